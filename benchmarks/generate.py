@@ -0,0 +1,95 @@
+"""Generates synthetic Snakefiles for benchmarking. The generated files are
+deterministic, so the same parameters always produce the same Snakefile.
+"""
+from random import Random
+
+# How many namespaces there are at each level of nesting
+NAMESPACE_WIDTH = 4
+
+
+class SnakefileSpec(object):
+    """The shape of a synthetic Snakefile.
+
+    :param tasks: the number of tasks to define
+    :param depth: how many namespaces deep the tasks are nested
+    :param fan_out: how many tasks each task requires
+    :param fan_in: how many consecutive tasks share the same requirements
+    :param kwargs: how many optional keyword arguments each task takes
+    """
+    def __init__(self, tasks, depth=0, fan_out=2, fan_in=1, kwargs=0):
+        self.tasks = tasks
+        self.depth = depth
+        self.fan_out = fan_out
+        self.fan_in = max(fan_in, 1)
+        self.kwargs = kwargs
+
+    def parameters(self):
+        return {
+            'tasks': self.tasks,
+            'depth': self.depth,
+            'fan_out': self.fan_out,
+            'fan_in': self.fan_in,
+            'kwargs': self.kwargs,
+        }
+
+    def namespace(self, index):
+        """The namespaces that a task is nested in, outermost first"""
+        return tuple('n%d' % ((index // NAMESPACE_WIDTH ** level) % NAMESPACE_WIDTH)
+                     for level in range(self.depth))
+
+    def label(self, index):
+        return ':'.join(self.namespace(index) + ('t%d' % index,))
+
+    def requirements(self, index):
+        """The indexes of the tasks that a task requires. Tasks are split into
+        groups of fan_in tasks that all require the same tasks, picked from the
+        groups before them, so the graph never has cycles.
+        """
+        group = index // self.fan_in
+        candidates = group * self.fan_in
+        if not candidates:
+            return []
+
+        random = Random(group)
+        return sorted(random.sample(range(candidates), min(self.fan_out, candidates)))
+
+
+def generate_snakefile(spec):
+    """Renders the source of a Snakefile. It has a task named `all`, which is the
+    default task and requires every other task.
+
+    :param spec: the shape of the Snakefile
+    :return: the source as a string
+    """
+    tree = {}
+    for index in range(spec.tasks):
+        node = tree
+        for name in spec.namespace(index):
+            node = node.setdefault(name, {})
+
+        node.setdefault(None, []).append(index)
+
+    lines = ['from snake import *', '', "default = 'all'", '']
+    _render_namespace(spec, tree, lines, '')
+
+    labels = ', '.join(repr(spec.label(index)) for index in range(spec.tasks))
+    lines.extend(['', '@task(requires=[%s])' % labels, 'def all():', '    pass', ''])
+
+    return '\n'.join(lines)
+
+
+def _render_namespace(spec, node, lines, indent):
+    for index in node.get(None, []):
+        requires = ', '.join(repr(spec.label(dependency)) for dependency in spec.requirements(index))
+        arguments = ', '.join("a%d='%d'" % (number, number) for number in range(spec.kwargs))
+
+        lines.append('%s@task(requires=[%s])' % (indent, requires))
+        lines.append('%sdef t%d(%s):' % (indent, index, arguments))
+        lines.append('%s    """Task %d"""' % (indent, index))
+        lines.append('')
+
+    for name in sorted(key for key in node if key is not None):
+        lines.append('%s@namespace' % indent)
+        lines.append('%sdef %s():' % (indent, name))
+        lines.append('')
+        _render_namespace(spec, node[name], lines, indent + '    ')
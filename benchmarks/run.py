@@ -0,0 +1,251 @@
+"""Measures the overhead of snake itself on synthetic Snakefiles of various sizes.
+
+Run the suite and save the results:
+
+    python -m benchmarks.run --tasks 10,1000,10000 -o before.json
+
+Compare two sets of results, failing if any benchmark got slower:
+
+    python -m benchmarks.run --compare before.json after.json
+"""
+from __future__ import print_function
+
+import json
+import os
+import platform
+import sys
+from optparse import OptionParser
+from shutil import rmtree
+from subprocess import CalledProcessError, check_output
+from tempfile import mkdtemp
+from timeit import default_timer
+
+from snake import application
+from snake.parser import ApplicationArgsParser
+from snake.tasks import TaskListFormatter
+from snake.version import VERSION
+
+from .generate import SnakefileSpec, generate_snakefile
+
+# Bumped whenever the format of the results changes
+RESULTS_VERSION = 1
+
+BENCHMARKS = ['load_cold', 'load_warm', 'resolve', 'tableize', 'dispatch']
+
+
+def run_suite(specs, repeat=5, benchmarks=None, report=None):
+    """Runs the benchmarks against a Snakefile generated for each spec.
+
+    :param specs: the shapes of the Snakefiles to benchmark
+    :param repeat: how many times each benchmark is timed
+    :param benchmarks: the names of the benchmarks to run, all of them by default
+    :param report: function called with each result as soon as it is measured
+    :return: the results, ready to be saved as JSON
+    """
+    results = []
+    for spec in specs:
+        for result in Benchmark(spec, repeat).run(benchmarks or BENCHMARKS):
+            results.append(result)
+            if report:
+                report(result)
+
+    return {
+        'version': RESULTS_VERSION,
+        'snake': VERSION,
+        'commit': _current_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+
+class Benchmark(object):
+    """Times the stages of a run for a single generated Snakefile. Snakefiles
+    register their tasks with the application that the snake module exposes,
+    so its registry is cleared before each measurement.
+    """
+    def __init__(self, spec, repeat):
+        self.spec = spec
+        self.repeat = repeat
+
+        self._app = application._instance
+
+    def run(self, benchmarks):
+        directory = mkdtemp(prefix='snake-benchmark-')
+        cache_home = os.environ.get('XDG_CACHE_HOME')
+        try:
+            # Keeps the manifest cache and task index out of the user's cache
+            os.environ['XDG_CACHE_HOME'] = os.path.join(directory, 'cache')
+
+            snakefile = os.path.join(directory, 'Snakefile')
+            with open(snakefile, 'w') as f:
+                f.write(generate_snakefile(self.spec))
+
+            return [self._result(name, getattr(self, name)(snakefile)) for name in benchmarks]
+        finally:
+            if cache_home is None:
+                del os.environ['XDG_CACHE_HOME']
+            else:
+                os.environ['XDG_CACHE_HOME'] = cache_home
+
+            self._reset()
+            rmtree(directory)
+
+    def load_cold(self, snakefile):
+        return self._time(lambda: self._load(snakefile, '--no-manifest-cache'))
+
+    def load_warm(self, snakefile):
+        self._load(snakefile)
+        return self._time(lambda: self._load(snakefile))
+
+    def resolve(self, snakefile):
+        graph = self._load(snakefile)._dependencies
+        return self._time(lambda: graph.resolve('all'))
+
+    def tableize(self, snakefile):
+        tasks = self._load(snakefile).tasks()
+        return self._time(lambda: TaskListFormatter(tasks).tableize('snake'))
+
+    def dispatch(self, snakefile):
+        registry = self._load(snakefile)
+        return self._time(lambda: registry.execute('all'))
+
+    def _load(self, snakefile, *flags):
+        self._reset()
+
+        _, _, opts = ApplicationArgsParser.parse(['-f', snakefile] + list(flags))
+        self._app._load_manifest(opts)
+
+        return self._app.registry
+
+    def _reset(self):
+        registry = self._app.registry
+        registry.__init__(registry.name)
+        registry.instrumentation = self._app.instrumentation
+        self._app.manifest = None
+
+    def _time(self, func):
+        timings = []
+        for _ in range(self.repeat):
+            started = default_timer()
+            func()
+            timings.append(default_timer() - started)
+
+        return sorted(timings)
+
+    def _result(self, name, timings):
+        result = {'benchmark': name, 'repeat': len(timings)}
+        result.update(self.spec.parameters())
+        result.update(min=timings[0], median=timings[len(timings) // 2], max=timings[-1])
+        return result
+
+
+def compare(baseline, current, threshold=0.1):
+    """Compares the median timings of two sets of results. Benchmarks are matched
+    up by name and Snakefile shape, and those missing from either side are left
+    out.
+
+    :param baseline: the results to compare against
+    :param current: the new results
+    :param threshold: how much slower, as a fraction, counts as a regression
+    :return: list of tuples of the key, baseline median, current median, ratio
+             and whether it regressed
+    """
+    medians = dict((_key(result), result['median']) for result in baseline['results'])
+
+    comparisons = []
+    for result in current['results']:
+        key = _key(result)
+        if key not in medians:
+            continue
+
+        before, after = medians[key], result['median']
+        ratio = after / before if before else float('inf')
+        comparisons.append((key, before, after, ratio, ratio > 1 + threshold))
+
+    return comparisons
+
+
+def _key(result):
+    return (result['benchmark'], result['tasks'], result['depth'],
+            result['fan_out'], result['fan_in'], result['kwargs'])
+
+
+def _describe(key):
+    return '%s tasks=%d depth=%d fan_out=%d fan_in=%d kwargs=%d' % key
+
+
+def _current_commit():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            return check_output(['git', 'rev-parse', 'HEAD'], cwd=directory,
+                                stderr=devnull).decode('ascii').strip()
+    except (OSError, CalledProcessError):
+        return None
+
+
+def _read_results(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+def _integers(value):
+    return [int(number) for number in value.split(',')]
+
+
+def main(argv):
+    parser = OptionParser(usage='%prog [options]\n       %prog --compare BASELINE CURRENT')
+    parser.add_option('--tasks', default='10,100,1000', metavar='N[,N...]',
+                      help="Numbers of tasks to generate Snakefiles with [default: %default]")
+    parser.add_option('--depth', default='0,2', metavar='N[,N...]',
+                      help="Depths of nested namespaces [default: %default]")
+    parser.add_option('--fan-out', type='int', default=2, metavar='N',
+                      help="Number of tasks each task requires [default: %default]")
+    parser.add_option('--fan-in', type='int', default=1, metavar='N',
+                      help="Number of tasks that share the same requirements [default: %default]")
+    parser.add_option('--kwargs', type='int', default=2, metavar='N',
+                      help="Number of keyword arguments of each task [default: %default]")
+    parser.add_option('--repeat', type='int', default=5, metavar='N',
+                      help="Number of times to time each benchmark [default: %default]")
+    parser.add_option('--only', metavar='NAME[,NAME...]',
+                      help="Only run these benchmarks, out of %s" % ', '.join(BENCHMARKS))
+    parser.add_option('-o', '--output', metavar='FILE',
+                      help="Write the results to FILE as JSON")
+    parser.add_option('--compare', action='store_true',
+                      help="Compare two result files instead of running the benchmarks")
+    parser.add_option('--threshold', type='float', default=0.1, metavar='FRACTION',
+                      help="How much slower counts as a regression when comparing [default: %default]")
+
+    opts, args = parser.parse_args(argv)
+
+    if opts.compare:
+        if len(args) != 2:
+            parser.error("--compare needs a baseline and a current result file")
+
+        baseline, current = [_read_results(filename) for filename in args]
+        comparisons = compare(baseline, current, opts.threshold)
+        for key, before, after, ratio, regressed in comparisons:
+            print('%-70s %10.6fs %10.6fs %6.2fx%s' % (
+                _describe(key), before, after, ratio, '  REGRESSED' if regressed else ''))
+
+        return 1 if any(regressed for _, _, _, _, regressed in comparisons) else 0
+
+    specs = [SnakefileSpec(tasks, depth, opts.fan_out, opts.fan_in, opts.kwargs)
+             for tasks in _integers(opts.tasks) for depth in _integers(opts.depth)]
+    benchmarks = opts.only.split(',') if opts.only else None
+    if benchmarks and not set(benchmarks).issubset(BENCHMARKS):
+        parser.error("Unknown benchmarks: %s" % ', '.join(sorted(set(benchmarks) - set(BENCHMARKS))))
+
+    report = lambda result: print('%-70s %10.6fs' % (_describe(_key(result)), result['median']))
+    results = run_suite(specs, opts.repeat, benchmarks, report)
+
+    if opts.output:
+        with open(opts.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -38,7 +38,7 @@ setup(
     url = 'https://github.com/jcomo/snake',
     author = 'Jonathan Como',
     author_email = 'jonathan.como@gmail.com',
-    packages = find_packages(exclude=['docs', 'tests', 'scripts']),
+    packages = find_packages(exclude=['docs', 'tests', 'scripts', 'benchmarks']),
     scripts = ['bin/snake'],
     install_requires = [],
     tests_require = ['tox'],
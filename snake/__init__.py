@@ -1,3 +1,3 @@
-from .application import ENV, sh, task, namespace
+from .application import ENV, sh, sh_async, sh_map, task, file_task, file, rule, namespace, results
 
-__all__ = ['ENV', 'sh', 'task', 'namespace']
+__all__ = ['ENV', 'sh', 'sh_async', 'sh_map', 'task', 'file_task', 'file', 'rule', 'namespace', 'results']
@@ -0,0 +1,75 @@
+"""Support for tasks written with asyncio. This module uses syntax that needs
+Python 3.5 or later, so it is only imported when it is available.
+"""
+import asyncio
+from asyncio.subprocess import PIPE
+from inspect import iscoroutine
+from locale import getpreferredencoding
+from threading import Thread
+
+__all__ = ['EventLoop', 'iscoroutine', 'on_behalf_of', 'run_command']
+
+
+class EventLoop(object):
+    """An event loop that runs on its own thread. Coroutines can be run on it
+    from any thread, so tasks running on several workers all share the one loop
+    and their coroutines run concurrently.
+    """
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = Thread(target=self._run_forever, name='snake-event-loop')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def run(self, coroutine):
+        """Runs a coroutine on the loop and waits for it to finish.
+
+        :param coroutine: the coroutine to run
+        :return: the value the coroutine returned
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def _run_forever(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+
+async def on_behalf_of(instrumentation, label, coroutine):
+    """Runs a coroutine on behalf of a task, so that the commands it runs are
+    attributed to the task even though it runs on the thread of the event loop.
+    Coroutines that it starts inherit the task along with the rest of its context.
+    """
+    with instrumentation.on_behalf_of(label):
+        return await coroutine
+
+
+async def run_command(shell, command, args, use_shell, instrumented, silent=False, capture=False):
+    """Runs a command without blocking the event loop. This is the coroutine
+    behind ShellWrapper.execute_async, which works out the arguments to run and
+    the context that reports the command to the instrumentation.
+    """
+    options = shell._process_options({'stdout': PIPE, 'stderr': PIPE} if capture else {})
+
+    with instrumented as outcome:
+        if use_shell:
+            process = await asyncio.create_subprocess_shell(args, **options)
+        else:
+            process = await asyncio.create_subprocess_exec(*args, **options)
+
+        if capture:
+            stdout, stderr = await process.communicate()
+
+            encoding = getpreferredencoding(False)
+            stdout, stderr = stdout.decode(encoding, 'replace'), stderr.decode(encoding, 'replace')
+        else:
+            await process.wait()
+            stdout = stderr = None
+
+        outcome.status = process.returncode
+
+    return shell._finish(command, process.returncode, silent, capture, stdout, stderr)
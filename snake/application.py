@@ -1,19 +1,40 @@
-from imp import load_source
-from os import environ, path, getcwd
+from multiprocessing import cpu_count
+from os import environ, execv, path, getcwd
 from six import print_
-from sys import exit, stderr, argv, exc_info
+from sys import exit, stderr, argv, exc_info, executable, modules
 from traceback import extract_tb
 
+from .cache import BuildCache
+from .daemon import DaemonServer
 from .datastructures import LenientDict
+from .distributed import WorkerPool, WorkerServer, worker_key
+from .history import TaskHistory, format_plan
+from .index import TaskIndex, included_files
+from .instrumentation import Instrumentation, Profiler, TraceRecorder
+from .jobserver import Jobserver
+from .loader import ManifestLoader
+from .processes import ProcessPool
 from .parser import ApplicationArgsParser as parser
 from .shell import ShellWrapper
-from .tasks import TaskRegistry, NoSuchTaskException
+from .tasks import TaskRegistry, NoSuchTaskException, TasksFailedException
 from .version import VERSION
+from .watch import watch, wait_for_changes
 
 
 class Application(object):
     def __init__(self):
         self.registry = TaskRegistry('snake')
+        self.instrumentation = Instrumentation()
+        self.shell = ShellWrapper(self, self.instrumentation)
+        self.profiler = None
+        self.tracer = None
+        self.history = None
+
+        # The Snakefile that has been loaded and the files it imported
+        self.manifest = None
+        self.includes = []
+
+        self.registry.instrumentation = self.instrumentation
 
     def info(self, message):
         """Logs a message to stdout"""
@@ -23,8 +44,9 @@ class Application(object):
         """Logs a message to stderr"""
         print_(message, file=stderr)
 
-    def run(self):
-        tasks, args, opts = parser.parse(argv[1:])
+    def run(self, tokens=None):
+        """Runs a command line, which is the one snake was started with by default"""
+        tasks, args, opts = parser.parse(argv[1:] if tokens is None else tokens)
         if opts.version:
             self.info('snake, version %s' % VERSION)
             return
@@ -35,32 +57,100 @@ class Application(object):
             self._handle_exception(e, opts)
 
     def _run(self, tasks, args, opts):
+        self.registry.jobs = opts.jobs
+        self.registry.jobs_mode = opts.jobs_mode
+        self.registry.keep_going = opts.keep_going
+        self.registry.cache = self._build_cache(opts)
+        self.registry.processes = ProcessPool(self._manifest_path(opts), opts.jobs, opts.manifest_cache,
+                                              self.instrumentation)
+
+        if opts.workers:
+            # Every task runs on a worker, and each worker runs one task at a time
+            addresses = opts.workers.split(',')
+            self.registry.processes = WorkerPool(addresses, self._manifest_path(opts), worker_key(opts.worker_key),
+                                                 self.instrumentation)
+            self.registry.jobs_mode = 'process'
+            self.registry.jobs = len(addresses)
+
+        self._start_instrumentation(opts)
+
+        self.history = TaskHistory(path.join(self._snake_directory(opts), 'history'))
+
+        if opts.cache_gc:
+            evicted = self.registry.cache.collect_garbage()
+            self.info('Evicted %d cache entries' % evicted)
+            return
+
+        if self._show_tasks_from_index(opts):
+            return
+
+        if opts.daemon:
+            self._serve_commands(opts)
+            return
+
         self._load_manifest(opts)
 
+        if opts.worker:
+            self._serve_tasks(opts)
+            return
+
         if opts.show_tasks:
             self._list_tasks()
             return
 
-        if tasks:
-            for task in tasks:
-                self._execute_task(task, args)
-        else:
-            # Run the default task
-            self._execute_task(None, args)
+        if opts.complete is not None:
+            self._complete_tasks(self.registry.tasks(), opts.complete)
+            return
+
+        if opts.dry_run:
+            self._show_plan(tasks)
+            return
+
+        self.instrumentation.add_listener(self.history)
+        self._join_jobserver(opts)
+
+        if opts.watch:
+            self._watch_tasks(tasks, args, opts)
+            return
+
+        # Runs the default task when no tasks are given
+        self._execute_tasks(tasks, args)
+        self._report_instrumentation(opts)
 
     def _handle_exception(self, e, opts):
+        self._report_exception(e, opts)
+        self._report_instrumentation(opts)
+        exit(1)
+
+    def _report_exception(self, e, opts):
         self.error('snake aborted!')
-        self.error(str(e))
+        if isinstance(e, TasksFailedException):
+            # Each of the tasks that failed while keeping going is reported the
+            # way a single failure would be
+            self.error(str(e))
+            for context, (_, error, tb) in e.failures:
+                self.error('')
+                self._report_failure(error, tb, context, opts)
 
-        tb = extract_tb(exc_info()[2])
-        self._print_stack_trace(tb, verbose=opts.trace)
+            if e.skipped:
+                self.error('')
+                self.error('Did not run: %s' % ', '.join(e.skipped))
+        else:
+            self._report_failure(e, exc_info()[2], self.registry.execution_context, opts)
 
         if not opts.trace:
-            context = ' => '.join(self.registry.execution_context)
-            self.error('Tasks: TOP => %s' % context)
             self.error('(See full trace by running task with --trace)')
 
-        exit(1)
+    def _report_failure(self, e, tb, context, opts):
+        self.error(str(e))
+
+        # Exceptions raised by tasks in worker processes carry the frames from
+        # the worker, which are the innermost frames
+        tb = extract_tb(tb) + getattr(e, 'remote_traceback', [])
+        self._print_stack_trace(tb, verbose=opts.trace)
+
+        if not opts.trace:
+            self.error('Tasks: TOP => %s' % ' => '.join(context))
 
     def _print_stack_trace(self, tb, verbose=False):
         for module, lineno, func, _ in reversed(tb):
@@ -73,14 +163,33 @@ class Application(object):
         library_path = __file__[:__file__.rindex('/')]
         return module.startswith(library_path)
 
-    def _load_manifest(self, opts):
+    def _manifest_path(self, opts):
         filename = opts.filename or 'Snakefile'
         if not path.isabs(filename):
             filename = path.join(getcwd(), filename)
 
+        return filename
+
+    def _snake_directory(self, opts):
+        """The directory next to the Snakefile that snake keeps the state of the project in"""
+        return path.join(path.dirname(self._manifest_path(opts)), '.snake')
+
+    def _build_cache(self, opts):
+        directory = path.join(self._snake_directory(opts), 'cache')
+        return BuildCache(directory, opts.cache_size * 1024 * 1024)
+
+    def _load_manifest(self, opts):
+        filename = self._manifest_path(opts)
+
+        # Commands run by a daemon start out with the Snakefile loaded
+        if filename == self.manifest:
+            return
+
+        modules_before = set(modules)
+
         try:
-            module = load_source('Snakefile', filename)
-        except IOError as e:
+            module = ManifestLoader().load(filename, use_cache=opts.manifest_cache)
+        except (IOError, OSError):
             message = "No Snakefile found"
             if opts.filename:
                 message += " (looking for: %s)" % opts.filename
@@ -89,24 +198,236 @@ class Application(object):
         else:
             self._register_default_task(module)
 
+        self.manifest = filename
+        self.includes = included_files(path.dirname(filename), modules_before)
+
+        if opts.manifest_cache:
+            index = TaskIndex(filename)
+            if not index.is_current():
+                index.save(self.registry.tasks(), self.includes)
+
+    def _show_tasks_from_index(self, opts):
+        """Lists or completes tasks without loading the manifest when the index
+        is up to date.
+
+        :return: true if the tasks were shown
+        """
+        if not (opts.show_tasks or opts.complete is not None) or not opts.manifest_cache:
+            return False
+
+        tasks = TaskIndex(self._manifest_path(opts)).tasks()
+        if tasks is None:
+            return False
+
+        if opts.show_tasks:
+            self.info(self.registry.view_all(tasks, self.history))
+        else:
+            self._complete_tasks(tasks, opts.complete)
+
+        return True
+
     def _register_default_task(self, module):
         default_task = getattr(module, 'default', None)
         self.registry.default = default_task
 
     def _list_tasks(self):
-        self.info(self.registry.view_all())
+        self.info(self.registry.view_all(history=self.history))
+
+    def _show_plan(self, tasks):
+        try:
+            plan = self.registry.plan(*tasks)
+        except NoSuchTaskException as e:
+            raise Exception("Don't know how to build task: %s" % e)
+
+        self.info(format_plan(plan, self.history))
+
+    def _complete_tasks(self, tasks, prefix):
+        labels = sorted(task.label for task in tasks if task.label.startswith(prefix))
+        if labels:
+            self.info('\n'.join(labels))
+
+    def _serve_tasks(self, opts):
+        if not opts.listen:
+            raise Exception("A worker needs an address to --listen on")
+
+        server = WorkerServer(opts.listen, self.registry, self._manifest_path(opts), worker_key(opts.worker_key))
+        server.listen()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+
+    def _join_jobserver(self, opts):
+        """Shares a budget of jobs with make and the commands that tasks run. Snake
+        joins the jobserver of the make that runs it, if any, or starts one of its
+        own when running more than one job. Tasks on other machines take up no
+        jobs here.
+        """
+        if opts.workers:
+            return
+
+        jobserver = Jobserver.from_makeflags(environ.get('MAKEFLAGS', ''))
+        if jobserver:
+            # The jobserver decides how many of the tasks run at once
+            self.registry.jobs = max(opts.jobs, jobserver.jobs or cpu_count())
+        elif opts.jobs > 1:
+            jobserver = Jobserver.create(opts.jobs)
+
+        self.registry.jobserver = self.shell.jobserver = jobserver
+
+    def _serve_commands(self, opts):
+        try:
+            self._load_manifest(opts)
+        except Exception as e:
+            # The daemon stays around to load the Snakefile once it is fixed,
+            # while clients run their commands themselves
+            self._report_exception(e, opts)
+            self._restart_when_changed([self._manifest_path(opts)])
+
+        server = DaemonServer(self, self.manifest, [self.manifest] + self.includes)
+        server.listen()
+        self.info('Serving %s on %s' % (self.manifest, server.address))
+        try:
+            restart = server.serve_forever()
+        except KeyboardInterrupt:
+            restart = False
+        finally:
+            server.close()
+
+        if restart:
+            self._restart()
+
+    def _restart_when_changed(self, files):
+        watcher = watch(files)
+        try:
+            wait_for_changes(watcher)
+        except KeyboardInterrupt:
+            exit(1)
+        finally:
+            watcher.close()
+
+        self._restart()
+
+    def _restart(self):
+        # The modules imported by the Snakefile could only be loaded again in
+        # this process by unloading them first, so the daemon starts over
+        execv(executable, [executable] + argv)
+
+    def _watch_tasks(self, tasks, args, opts):
+        """Runs tasks, then runs them again each time the files they read change,
+        until interrupted. Only the tasks affected by the changes run again, except
+        when the Snakefile itself changes, in which case it is loaded again and
+        every task runs.
+        """
+        manifest = self._manifest_path(opts)
+        changed = None
+        try:
+            while True:
+                self._execute_watched_tasks(tasks, args, opts, changed)
+
+                # Watching starts after the run so that the files written by the
+                # tasks themselves do not start another run
+                files = self._watched_files(tasks, manifest)
+                watcher = watch(files)
+                try:
+                    self.info('Watching %d files for changes' % len(files))
+                    paths = wait_for_changes(watcher)
+                finally:
+                    watcher.close()
+
+                self.info('Changed: %s' % ', '.join(sorted(paths)))
+                changed = set(files[filename] for filename in paths)
+        except KeyboardInterrupt:
+            pass
+
+    def _execute_watched_tasks(self, tasks, args, opts, changed):
+        # Each run is profiled and traced on its own
+        self._start_instrumentation(opts)
+        try:
+            if changed is None:
+                self._execute_tasks(tasks, args)
+            elif None in changed:
+                self.registry.clear()
+                self.manifest = None
+                self._load_manifest(opts)
+                self._execute_tasks(tasks, args)
+            else:
+                self._execute_tasks(tasks, args, changed)
+        except KeyboardInterrupt:
+            raise
+        except Exception as e:
+            self._report_exception(e, opts)
+        finally:
+            self._report_instrumentation(opts)
+
+    def _watched_files(self, tasks, manifest):
+        """Finds the files to watch, mapped to the labels of what changes with
+        them. The Snakefile maps to None.
+        """
+        try:
+            files = self.registry.input_files(*tasks)
+        except NoSuchTaskException:
+            # The Snakefile failed to load, so only it can fix that
+            files = {}
+
+        files[manifest] = None
+        return files
+
+    def _start_instrumentation(self, opts):
+        """Starts a new profile and trace, in place of any that were started
+        before.
+        """
+        for listener in (self.profiler, self.tracer):
+            if listener:
+                self.instrumentation.remove_listener(listener)
+
+        self.profiler = Profiler() if opts.profile else None
+        self.tracer = TraceRecorder() if opts.trace_events else None
+
+        for listener in (self.profiler, self.tracer):
+            if listener:
+                self.instrumentation.add_listener(listener)
+
+    def _report_instrumentation(self, opts):
+        # Each report is only made once, even if making it fails and the
+        # failure is handled afterwards
+        profiler, self.profiler = self.profiler, None
+        tracer, self.tracer = self.tracer, None
+        for listener in (profiler, tracer):
+            if listener:
+                self.instrumentation.remove_listener(listener)
+
+        if profiler and profiler.profiles():
+            self.info(profiler.report())
+
+        if tracer:
+            tracer.save(opts.trace_events)
+
+        if self.history:
+            self.history.save()
 
-    def _execute_task(self, task, args):
+    def _execute_tasks(self, tasks, args, changed=None):
         try:
-            self.registry.execute(task, **args)
+            if changed is None:
+                self.registry.execute(*tasks, **args)
+            else:
+                self.registry.execute_affected(tasks, changed, **args)
         except NoSuchTaskException as e:
             raise Exception("Don't know how to build task: %s" % e)
 
 
 _instance = Application()
-_runner = ShellWrapper(_instance)
+_runner = _instance.shell
 
 ENV = LenientDict(environ)
-sh = _runner.execute
+sh = _runner
+sh_async = _runner.execute_async
+sh_map = _runner.map
 task = _instance.registry.add_task
+file_task = _instance.registry.add_file_task
+file = file_task
+rule = _instance.registry.add_rule
 namespace = _instance.registry.add_namespace
+results = _instance.registry.result
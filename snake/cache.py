@@ -0,0 +1,263 @@
+import json
+import pickle
+from glob import glob
+from hashlib import sha256
+from os import environ, listdir, makedirs, path, rename, utime, walk
+from shutil import rmtree
+from threading import Lock
+from six import iteritems
+
+# Bumped whenever the layout of a cache entry changes so that old entries are
+# never restored by a newer version
+CACHE_VERSION = '3'
+
+
+class CachedResult(object):
+    """A cache hit, holding the value that the task returned when its outputs
+    were stored.
+    """
+    def __init__(self, result):
+        self.result = result
+
+
+class BuildCache(object):
+    """A local cache of task results keyed by a fingerprint of everything that
+    a task declares it depends on. Each entry records the value the task returned
+    along with an archive of the outputs it produced. Entries are evicted least
+    recently used first once the cache grows past its maximum size.
+
+    Outputs are archived under their position in the manifest rather than their
+    path, and restored to the path recorded there. Archives drop the leading
+    slash of absolute paths, which would restore them relative to the working
+    directory otherwise.
+    """
+    ARCHIVE = 'outputs.tar'
+    MANIFEST = 'manifest.json'
+    RESULT = 'result.pickle'
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+
+        self._lock = Lock()
+
+        # The size of the cache in bytes, which is only worked out once and
+        # kept up to date as entries are stored and evicted
+        self._total = None
+
+    def fingerprint(self, task, kwargs):
+        """Computes the fingerprint of a task execution from the task itself, the
+        contents of its input files, its environment variables and the keyword
+        arguments it will be called with.
+
+        :param task: the task about to be executed
+        :param kwargs: the keyword arguments the task function will receive
+        :return: the fingerprint as a hex string
+        """
+        digest = sha256()
+        self._update(digest, 'version', CACHE_VERSION)
+        self._update(digest, 'label', task.label)
+        self._update(digest, 'code', self._code(task.func))
+
+        for key, value in sorted(iteritems(kwargs)):
+            self._update(digest, 'arg', '%s=%s' % (key, value))
+
+        for name in sorted(task.env):
+            self._update(digest, 'env', '%s=%s' % (name, environ.get(name)))
+
+        for filename in expand(task.inputs):
+            self._update(digest, 'input', filename)
+            with open(filename, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 16), b''):
+                    digest.update(chunk)
+
+        for pattern in task.outputs:
+            self._update(digest, 'output', pattern)
+
+        return digest.hexdigest()
+
+    def restore(self, fingerprint):
+        """Restores the outputs recorded for a fingerprint.
+
+        :return: a CachedResult with the value the task returned, or None if
+                 there was no entry for the fingerprint
+        """
+        entry = self._entry(fingerprint)
+        if not path.isdir(entry):
+            return None
+
+        try:
+            with open(path.join(entry, self.RESULT), 'rb') as f:
+                result = pickle.load(f)
+        except Exception:
+            # The result may refer to a class that no longer exists, in which
+            # case the task has to run again
+            return None
+
+        # Imported here since it is slow to import and only needed when a task
+        # runs, which keeps listing tasks fast
+        import tarfile
+
+        with open(path.join(entry, self.MANIFEST)) as f:
+            outputs = json.load(f)['outputs']
+
+        with tarfile.open(path.join(entry, self.ARCHIVE)) as archive:
+            for member in archive.getmembers():
+                index, _, rest = member.name.partition('/')
+                target = outputs[int(index)]
+                member.name = path.join(path.basename(target), rest) if rest else path.basename(target)
+                archive.extract(member, path.dirname(target) or '.')
+
+        # Touch the entry so that it counts as recently used
+        utime(entry, None)
+        return CachedResult(result)
+
+    def store(self, fingerprint, outputs, result=None):
+        """Records a successful task execution and the outputs it produced, then
+        evicts old entries if the cache has grown too large. Nothing is recorded
+        when a declared output is missing or the result cannot be pickled since
+        neither could be restored.
+
+        :param fingerprint: the fingerprint of the task execution
+        :param outputs: list of output paths or glob patterns
+        :param result: the value that the task returned
+        """
+        try:
+            pickled = pickle.dumps(result, 2)
+        except Exception:
+            return
+
+        filenames = []
+        for pattern in outputs:
+            matches = sorted(glob(pattern))
+            if not matches:
+                return
+
+            filenames.extend(path.normpath(match) for match in matches)
+
+        import tarfile
+        from tempfile import mkdtemp
+
+        self._ensure_directory()
+        staging = mkdtemp(dir=self.directory, prefix='.staging-')
+
+        with tarfile.open(path.join(staging, self.ARCHIVE), 'w') as archive:
+            for index, filename in enumerate(filenames):
+                archive.add(filename, arcname='%d' % index)
+
+        with open(path.join(staging, self.MANIFEST), 'w') as f:
+            json.dump({'outputs': filenames}, f)
+
+        with open(path.join(staging, self.RESULT), 'wb') as f:
+            f.write(pickled)
+
+        size = _size(staging)
+        with self._lock:
+            entry = self._entry(fingerprint)
+            if path.isdir(entry):
+                rmtree(staging)
+            else:
+                rename(staging, entry)
+                if self._total is not None:
+                    self._total += size
+
+        if self._size() > self.max_size:
+            self.collect_garbage()
+
+    def collect_garbage(self, max_size=None):
+        """Evicts the least recently used entries until the cache fits within
+        its maximum size.
+
+        :param max_size: overrides the maximum size of the cache in bytes
+        :return: the number of entries evicted
+        """
+        if max_size is None:
+            max_size = self.max_size
+
+        if not path.isdir(self.directory):
+            return 0
+
+        with self._lock:
+            entries = []
+            for name in listdir(self.directory):
+                entry = path.join(self.directory, name)
+                if path.isdir(entry) and not name.startswith('.'):
+                    entries.append((path.getmtime(entry), _size(entry), entry))
+
+            total = sum(size for _, size, _ in entries)
+            evicted = 0
+            for _, size, entry in sorted(entries):
+                if total <= max_size:
+                    break
+
+                rmtree(entry)
+                total -= size
+                evicted += 1
+
+            self._total = total
+            return evicted
+
+    def _size(self):
+        with self._lock:
+            if self._total is None:
+                self._total = _size(self.directory)
+
+            return self._total
+
+    def _entry(self, fingerprint):
+        return path.join(self.directory, fingerprint)
+
+    def _ensure_directory(self):
+        try:
+            makedirs(self.directory)
+        except OSError:
+            if not path.isdir(self.directory):
+                raise
+
+    def _update(self, digest, kind, value):
+        if not isinstance(value, bytes):
+            value = value.encode('utf-8')
+
+        digest.update(kind.encode('utf-8') + b':' + value + b'\0')
+
+    def _code(self, func):
+        code = getattr(func, '__code__', None)
+        if code is None:
+            return repr(func)
+
+        return _describe_code(code)
+
+
+def expand(patterns):
+    """Expands a list of paths and glob patterns into a sorted list of files.
+    Directories are expanded to every file they contain.
+
+    :param patterns: list of paths or glob patterns
+    :return: sorted list of unique file paths
+    """
+    filenames = set()
+    for pattern in patterns:
+        for match in glob(pattern):
+            if path.isdir(match):
+                for root, _, files in walk(match):
+                    filenames.update(path.join(root, f) for f in files)
+            else:
+                filenames.add(match)
+
+    return sorted(filenames)
+
+
+def _describe_code(code):
+    """Describes a code object in a way that stays the same no matter how it was
+    loaded. Marshalled code is not suitable since its bytes depend on reference
+    counts at the time it was marshalled.
+    """
+    constants = [_describe_code(constant) if hasattr(constant, 'co_code') else repr(constant)
+                 for constant in code.co_consts]
+
+    return repr((code.co_name, code.co_code, code.co_names, code.co_varnames, constants))
+
+
+def _size(directory):
+    return sum(path.getsize(path.join(root, f))
+               for root, _, files in walk(directory) for f in files)
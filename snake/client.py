@@ -0,0 +1,170 @@
+"""Hands commands over to a daemon that keeps the Snakefile loaded. The command
+line, working directory and environment are sent to the daemon along with the
+standard streams themselves, so the command runs as if it had been run here.
+
+Only the standard library is used, since this is loaded before the rest of
+snake, whose import is part of the startup cost that the daemon saves.
+"""
+import json
+import os
+import signal
+import socket
+import stat
+import tempfile
+from array import array
+from hashlib import sha1
+from os import path
+
+# Bumped whenever the messages change in a way that older peers do not understand
+PROTOCOL_VERSION = 1
+
+# Signals sent to the client are passed on to the command, as a terminal would
+FORWARDED_SIGNALS = ('SIGINT', 'SIGTERM', 'SIGHUP', 'SIGQUIT')
+
+
+def socket_path(manifest):
+    """The path of the socket that the daemon serving a Snakefile listens on.
+    Sockets live in a directory that only the user can enter, since whoever can
+    connect can run tasks as the user.
+
+    :param manifest: the absolute path of the Snakefile
+    """
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime:
+        directory = path.join(runtime, 'snake')
+    else:
+        directory = path.join(tempfile.gettempdir(), 'snake-%d' % os.getuid())
+
+    name = sha1(manifest.encode('utf-8')).hexdigest()
+    return path.join(directory, '%s.sock' % name)
+
+
+def is_private_directory(directory):
+    """Whether a directory belongs to the user and nobody else can enter it.
+    Other users could plant a socket in any other directory, since the path of
+    the socket is predictable.
+    """
+    try:
+        status = os.lstat(directory)
+    except OSError:
+        return False
+
+    return (stat.S_ISDIR(status.st_mode) and status.st_uid == os.getuid() and
+            not status.st_mode & 0o077)
+
+
+def manifest_path(tokens, cwd):
+    """Finds the Snakefile that a command line uses, without parsing the rest
+    of it. The daemon checks the command line properly before running it.
+
+    :param tokens: the command line arguments
+    :param cwd: the directory the command runs in
+    :return: the absolute path of the Snakefile
+    """
+    filename = 'Snakefile'
+    for index, token in enumerate(tokens):
+        if token in ('-f', '--snakefile') and index + 1 < len(tokens):
+            filename = tokens[index + 1]
+        elif token.startswith('--snakefile='):
+            filename = token[len('--snakefile='):]
+        elif token.startswith('-f') and len(token) > 2:
+            filename = token[2:]
+
+    return path.join(cwd, filename)
+
+
+def run(tokens):
+    """Runs a command in the daemon serving its Snakefile.
+
+    :param tokens: the command line arguments
+    :return: the exit status of the command, or None if no daemon ran it
+    """
+    if not hasattr(socket, 'AF_UNIX') or not hasattr(socket.socket, 'sendmsg'):
+        return None
+
+    if '--daemon' in tokens:
+        return None
+
+    # The pipe of a jobserver that make passed down cannot be handed over
+    if _has_jobserver_descriptors(os.environ.get('MAKEFLAGS', '')):
+        return None
+
+    cwd = os.getcwd()
+    address = socket_path(manifest_path(tokens, cwd))
+    if not is_private_directory(path.dirname(address)):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(address)
+    except (IOError, OSError):
+        sock.close()
+        return None
+
+    try:
+        return _request(sock, tokens, cwd)
+    except (IOError, OSError):
+        # The daemon went away before it started the command
+        return None
+    finally:
+        sock.close()
+
+
+def send(sock, message, fds=()):
+    """Sends a message, along with file descriptors to share with the peer"""
+    data = (json.dumps(message) + '\n').encode('utf-8')
+    if not fds:
+        sock.sendall(data)
+        return
+
+    sent = sock.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array('i', fds))])
+    sock.sendall(data[sent:])
+
+
+def _request(sock, tokens, cwd):
+    request = {
+        'type': 'run',
+        'version': PROTOCOL_VERSION,
+        'argv': tokens,
+        'cwd': cwd,
+        'env': dict(os.environ),
+    }
+    send(sock, request, [0, 1, 2])
+
+    reader = sock.makefile('rb')
+    reply = _receive(reader)
+    if not reply or reply['type'] != 'started':
+        return None
+
+    forward = lambda signum, _: send(sock, {'type': 'signal', 'signal': signum})
+    previous = {}
+    for name in FORWARDED_SIGNALS:
+        signum = getattr(signal, name)
+        previous[signum] = signal.signal(signum, forward)
+
+    try:
+        reply = _receive(reader)
+    except (IOError, OSError):
+        reply = None
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+
+    # The command was killed before it could report its status
+    if not reply:
+        return 1
+
+    return reply['status']
+
+
+def _has_jobserver_descriptors(makeflags):
+    return any(word.startswith(('--jobserver-auth=', '--jobserver-fds=')) and 'fifo:' not in word
+               for word in makeflags.split())
+
+
+def _receive(reader):
+    line = reader.readline()
+    if not line:
+        return None
+
+    return json.loads(line.decode('utf-8'))
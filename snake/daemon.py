@@ -0,0 +1,244 @@
+"""Keeps a Snakefile loaded between runs of snake. The daemon loads the
+Snakefile once and forks a process for each command that a client sends it.
+The process starts out with the Snakefile already loaded, takes on the
+standard streams, working directory and environment of the client, and runs
+the command as snake would. Commands cannot affect each other or the daemon,
+since each runs in a process of its own.
+
+When any of the files that the Snakefile was loaded from change, the daemon
+turns commands away, so that clients run them themselves, and starts over.
+"""
+import json
+import os
+import signal
+import socket
+import sys
+from array import array
+from threading import Thread
+from traceback import print_exc
+
+from .client import PROTOCOL_VERSION, is_private_directory, send, socket_path
+from .parser import ApplicationArgsParser as parser
+
+
+class DaemonException(Exception):
+    pass
+
+
+class DaemonServer(object):
+    """Serves the commands of clients that use the same Snakefile as an
+    application that has loaded it.
+    """
+    def __init__(self, application, manifest, files):
+        self.application = application
+        self.manifest = manifest
+        self.address = socket_path(manifest)
+
+        self._identities = dict((filename, _identity(filename)) for filename in files)
+        self._socket = None
+
+    def listen(self):
+        if not hasattr(socket.socket, 'recvmsg'):
+            raise DaemonException("The daemon needs Python 3.3 or later")
+
+        directory = os.path.dirname(self.address)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+
+        # Clients send their environment and standard streams to the socket
+        if not is_private_directory(directory):
+            raise DaemonException("%s must belong to you and be closed to other users" % directory)
+
+        if os.path.exists(self.address):
+            if _is_served(self.address):
+                raise DaemonException("A daemon is already serving %s" % self.manifest)
+
+            os.remove(self.address)
+
+        # The socket only appears once it is listening, so that clients never
+        # find it too early and run the command themselves
+        temporary = '%s.%d' % (self.address, os.getpid())
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(temporary)
+        self._socket.listen(16)
+        os.rename(temporary, self.address)
+
+    def serve_forever(self):
+        """Serves commands until the files the Snakefile was loaded from change.
+
+        :return: true once the daemon needs to load the Snakefile again
+        """
+        # Commands are never waited for, so their processes are reaped by the system
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+        # Stopping the daemon goes through the same clean up as interrupting it,
+        # so that no socket is left behind for clients to find
+        signal.signal(signal.SIGTERM, _stop)
+        try:
+            while True:
+                connection, _ = self._socket.accept()
+                if self.is_stale():
+                    # Clients run their commands themselves until the daemon is back
+                    self.close()
+                    send(connection, {'type': 'declined'})
+                    connection.close()
+                    return True
+
+                if os.fork() == 0:
+                    self._serve_command(connection)
+
+                connection.close()
+        finally:
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    def is_stale(self):
+        """Whether any of the files the Snakefile was loaded from have changed"""
+        for filename, identity in self._identities.items():
+            if _identity(filename) != identity:
+                return True
+
+        return False
+
+    def close(self):
+        self._socket.close()
+
+        if os.path.exists(self.address):
+            os.remove(self.address)
+
+    def _serve_command(self, connection):
+        """Runs a command in the process forked for it. This never returns."""
+        status = 1
+        try:
+            self._socket.close()
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+            # The command gets a process group of its own, so that signals
+            # reach the commands it runs as well
+            os.setsid()
+
+            request, fds = _receive_request(connection)
+            if request:
+                status = self._run(connection, request, fds)
+        except BaseException:
+            print_exc()
+        finally:
+            os._exit(status)
+
+    def _run(self, connection, request, fds):
+        if request.get('version') != PROTOCOL_VERSION:
+            send(connection, {'type': 'declined'})
+            return 1
+
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+
+        # Command lines that fail to parse are left to the client to report
+        try:
+            _, _, opts = parser.parse(request['argv'])
+        except SystemExit:
+            opts = None
+
+        if opts is None or self.application._manifest_path(opts) != self.manifest:
+            send(connection, {'type': 'declined'})
+            return 1
+
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+
+        # Output is flushed by line when it goes to a terminal, as it would be
+        # in a process started from the client
+        for stream in (sys.stdout, sys.stderr):
+            if hasattr(stream, 'reconfigure'):
+                stream.reconfigure(line_buffering=stream.isatty())
+
+        send(connection, {'type': 'started'})
+
+        forwarder = Thread(target=_forward_signals, args=(connection,))
+        forwarder.daemon = True
+        forwarder.start()
+
+        sys.argv[1:] = request['argv']
+        try:
+            self.application.run(request['argv'])
+            status = 0
+        except SystemExit as e:
+            status = _exit_status(e.code)
+        except KeyboardInterrupt:
+            status = 128 + signal.SIGINT
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        send(connection, {'type': 'exit', 'status': status})
+        return status
+
+
+def _receive_request(connection):
+    """Reads the request of a client, along with the file descriptors it sent.
+
+    :return: tuple of the request and the file descriptors, or of None and no
+             file descriptors if the client closed the connection first
+    """
+    fds = array('i')
+    data, ancillary, _, _ = connection.recvmsg(65536, socket.CMSG_LEN(3 * fds.itemsize))
+    for level, kind, payload in ancillary:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(payload[:len(payload) - len(payload) % fds.itemsize])
+
+    while not data.endswith(b'\n'):
+        chunk = connection.recv(65536)
+        if not chunk:
+            return None, []
+        data += chunk
+
+    return json.loads(data.decode('utf-8')), list(fds)
+
+
+def _forward_signals(connection):
+    for line in iter(connection.makefile('rb').readline, b''):
+        message = json.loads(line.decode('utf-8'))
+        if message['type'] == 'signal':
+            os.killpg(os.getpgrp(), message['signal'])
+
+    # The client went away, as a terminal that is closed would
+    os.killpg(os.getpgrp(), signal.SIGHUP)
+
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt()
+
+
+def _is_served(address):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(address)
+    except (IOError, OSError):
+        return False
+    finally:
+        sock.close()
+
+    return True
+
+
+def _identity(filename):
+    try:
+        info = os.stat(filename)
+    except OSError:
+        return None
+
+    return info.st_mtime, info.st_size
+
+
+def _exit_status(code):
+    if code is None:
+        return 0
+
+    if isinstance(code, int):
+        return code
+
+    sys.stderr.write('%s\n' % code)
+    return 1
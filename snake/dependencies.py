@@ -8,6 +8,11 @@ class CircularDependencyException(Exception):
 
 
 class DependencyGraph(object):
+    """A directed graph of nodes and the nodes they depend on. Traversals are
+    iterative so that long chains of dependencies are not limited by the
+    recursion limit, and they keep their state in sets so that they take time
+    proportional to the size of the graph.
+    """
     def __init__(self):
         self._vertices = defaultdict(list)
 
@@ -15,24 +20,111 @@ class DependencyGraph(object):
         for dependency in dependencies:
             self._vertices[node].append(dependency)
 
-    def resolve(self, start):
-        return self._resolve_node(start, [], [])
+    def dependencies(self, node):
+        """Returns the direct dependencies of a node, in the order they were added.
+
+        :param node: the node to look up
+        :return: list of nodes
+        """
+        return list(self._vertices.get(node, []))
+
+    def dependents(self, nodes):
+        """Finds every node that depends on any of the given nodes, directly or
+        through other nodes.
+
+        :param nodes: the nodes to find the dependents of
+        :return: set of nodes, including the given ones
+        """
+        reverse = defaultdict(list)
+        for node, dependencies in self._vertices.items():
+            for dependency in dependencies:
+                reverse[dependency].append(node)
+
+        found = set(nodes)
+        pending = list(found)
+        while pending:
+            for dependent in reverse.get(pending.pop(), []):
+                if dependent not in found:
+                    found.add(dependent)
+                    pending.append(dependent)
+
+        return found
+
+    def chain(self, start, node):
+        """Finds a path of dependencies leading from one node to another. This is
+        the chain that explains why a node was part of the resolution of start.
+
+        :param start: the node to begin searching from
+        :param node: the node to find
+        :return: list of nodes beginning with start and ending with node, or an
+                 empty list if node is not a dependency of start
+        """
+        if start == node:
+            return [start]
 
-    def _resolve_node(self, node, resolved, unresolved):
-        unresolved.append(node)
+        path = [start]
+        visited = set(path)
+        stack = [iter(self._vertices.get(start, []))]
 
-        for dependency in self._vertices[node]:
-            if dependency in resolved:
-                continue
+        while stack:
+            for dependency in stack[-1]:
+                if dependency in visited:
+                    continue
 
-            if dependency in unresolved:
-                raise CircularDependencyException(unresolved + [dependency])
+                visited.add(dependency)
+                path.append(dependency)
+                if dependency == node:
+                    return path
 
-            self._resolve_node(dependency, resolved, unresolved)
+                stack.append(iter(self._vertices.get(dependency, [])))
+                break
+            else:
+                stack.pop()
+                path.pop()
 
-        unresolved.remove(node)
-        resolved.append(node)
+        return []
+
+    def resolve(self, start):
+        return self.resolve_all([start])
+
+    def resolve_all(self, starts):
+        """Resolves several nodes into a single ordering. Each node appears at
+        most once, even when it is a dependency of more than one start node, and
+        the start nodes are kept in the given order where the dependencies allow.
+
+        :param starts: list of nodes to resolve
+        :return: list of nodes in dependency order
+        """
+        resolved = []
+        done = set()
+        for start in starts:
+            if start not in done:
+                self._resolve_node(start, resolved, done)
 
-        # We can just return at the end since steps in the recursion are
-        # getting references to the resolved list and modifying it "globally"
         return resolved
+
+    def _resolve_node(self, start, resolved, done):
+        # A depth first traversal where the path holds the nodes that are being
+        # resolved and the stack holds the dependencies each of them has left
+        path = [start]
+        unresolved = set(path)
+        stack = [iter(self._vertices.get(start, []))]
+
+        while stack:
+            for dependency in stack[-1]:
+                if dependency in done:
+                    continue
+
+                if dependency in unresolved:
+                    raise CircularDependencyException(path + [dependency])
+
+                path.append(dependency)
+                unresolved.add(dependency)
+                stack.append(iter(self._vertices.get(dependency, [])))
+                break
+            else:
+                stack.pop()
+                node = path.pop()
+                unresolved.discard(node)
+                done.add(node)
+                resolved.append(node)
@@ -0,0 +1,432 @@
+"""Runs tasks on other machines. A worker loads a Snakefile and listens for a
+coordinator, which is a normal run of snake that sends each task to one of its
+workers by label as soon as the task is ready to run. The worker runs the task,
+streams back everything the task writes to stdout and stderr, and reports how
+the task went.
+
+Messages are JSON objects, one per line, sent over TCP or Unix sockets.
+Whoever can send a worker tasks can run commands on its machine, so workers
+with a key only serve coordinators that prove they have the same key, by
+signing a random challenge with it.
+"""
+import codecs
+import hmac
+import json
+import os
+import socket
+import sys
+import time
+from binascii import hexlify
+from hashlib import sha1, sha256
+from threading import Lock, Thread
+from traceback import extract_tb
+from six import iteritems
+from six.moves.queue import Queue
+
+# Bumped whenever the messages change in a way that older peers do not understand
+PROTOCOL_VERSION = 2
+
+# The environment variable holding the key that workers and coordinators share
+KEY_VARIABLE = 'SNAKE_WORKER_KEY'
+
+
+class WorkerException(Exception):
+    pass
+
+
+class RemoteTaskException(Exception):
+    """Raised when a task fails on a worker. The message is the message of the
+    original exception and the frames of its traceback are kept in the
+    `remote_traceback` attribute.
+    """
+    def __init__(self, message, frames=None):
+        super(RemoteTaskException, self).__init__(message)
+        self.remote_traceback = [tuple(frame) for frame in frames or []]
+
+
+def parse_address(address):
+    """Parses the address of a worker, which is either HOST:PORT or unix:PATH.
+
+    :return: tuple of the socket family and the address to bind or connect to
+    """
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+
+    host, _, port = address.rpartition(':')
+    if not host or not port.isdigit():
+        raise WorkerException("Invalid worker address, expected HOST:PORT or unix:PATH: %s" % address)
+
+    return socket.AF_INET, (host, int(port))
+
+
+def worker_key(filename=None):
+    """Reads the key that workers and coordinators share, from a file or else
+    from the environment.
+
+    :param filename: the file holding the key
+    :return: the key as bytes, or None if there is none
+    """
+    if filename:
+        with open(filename, 'rb') as f:
+            key = f.read().strip()
+    else:
+        key = os.environ.get(KEY_VARIABLE, '').encode('utf-8')
+
+    return key or None
+
+
+def sign(key, nonce):
+    """Signs the challenge of a worker with the shared key"""
+    return hmac.new(key, nonce.encode('utf-8'), sha256).hexdigest()
+
+
+def manifest_digest(filename):
+    """Identifies the contents of a Snakefile, so that a coordinator only uses
+    workers that have loaded the same one.
+    """
+    with open(filename, 'rb') as f:
+        return sha1(f.read()).hexdigest()
+
+
+class Connection(object):
+    """Sends and receives messages over a socket"""
+    def __init__(self, sock, address):
+        self.address = address
+
+        self._socket = sock
+        self._reader = sock.makefile('rb')
+        self._lock = Lock()
+
+    @classmethod
+    def connect(cls, address):
+        family, target = parse_address(address)
+
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.connect(target)
+        except (IOError, OSError) as e:
+            sock.close()
+            raise WorkerException("Cannot connect to worker %s: %s" % (address, e))
+
+        return cls(sock, address)
+
+    def send(self, message):
+        data = (json.dumps(message) + '\n').encode('utf-8')
+        with self._lock:
+            self._socket.sendall(data)
+
+    def receive(self):
+        """Waits for the next message.
+
+        :return: the message, or None if the peer closed the connection
+        """
+        line = self._reader.readline()
+        if not line:
+            return None
+
+        return json.loads(line.decode('utf-8'))
+
+    def close(self):
+        self._reader.close()
+        self._socket.close()
+
+
+class WorkerPool(object):
+    """The workers of a coordinator. It runs tasks the same way a ProcessPool
+    does, on whichever worker is idle, and connects to the workers the first
+    time a task needs one.
+    """
+    def __init__(self, addresses, manifest, key=None, instrumentation=None):
+        self.addresses = addresses
+        self.manifest = manifest
+        self.key = key
+        self.instrumentation = instrumentation
+
+        self._idle = None
+        self._live = 0
+        self._lock = Lock()
+
+    def run(self, label, kwargs, results=None):
+        """Runs a task on a worker and waits for it to finish. What the task writes
+        is written to stdout and stderr as it arrives.
+
+        :param label: the label of the task to run
+        :param kwargs: the keyword arguments to pass to the task
+        :param results: the results of the tasks it requires, by label. Results
+                        that cannot be sent as JSON are None on the worker.
+        :return: the value returned by the task, if it can be sent as JSON
+        """
+        if self._idle is None:
+            self._start()
+
+        connection = self._idle.get()
+        if connection is None:
+            # Passed on, so that every task waiting for a worker gives up too
+            self._idle.put(None)
+            raise WorkerException("Lost the connections to every worker, none is left to run %s" % label)
+
+        try:
+            results = dict((name, _serializable(value)) for name, value in iteritems(results or {}))
+            connection.send({'type': 'run', 'label': label, 'kwargs': kwargs, 'results': results})
+            outcome = self._wait(connection)
+        except Exception:
+            connection.close()
+            self._lost()
+            raise
+        else:
+            self._idle.put(connection)
+
+        if self.instrumentation:
+            self.instrumentation.ran_on_worker(label, connection.address, outcome['wall'])
+
+        if not outcome['ok']:
+            raise RemoteTaskException(outcome['error'], outcome['frames'])
+
+        return outcome['result']
+
+    def close(self):
+        if self._idle is None:
+            return
+
+        while not self._idle.empty():
+            connection = self._idle.get()
+            if connection:
+                connection.close()
+
+        self._idle = None
+
+    def _start(self):
+        digest = manifest_digest(self.manifest)
+
+        self._idle = Queue()
+        self._live = 0
+        for address in self.addresses:
+            connection = Connection.connect(address)
+            connection.send({'type': 'hello', 'version': PROTOCOL_VERSION, 'manifest': digest})
+
+            reply = connection.receive()
+            if reply and reply['type'] == 'challenge':
+                if not self.key:
+                    connection.close()
+                    raise WorkerException("Worker %s needs a key, set %s or use --worker-key" %
+                                          (address, KEY_VARIABLE))
+
+                connection.send({'type': 'auth', 'signature': sign(self.key, reply['nonce'])})
+                reply = connection.receive()
+
+            if not reply or reply['type'] != 'ready':
+                connection.close()
+                reason = reply['message'] if reply else 'closed the connection'
+                raise WorkerException("Worker %s refused to run tasks: %s" % (address, reason))
+
+            self._idle.put(connection)
+            self._live += 1
+
+    def _lost(self):
+        # Tasks wait for an idle connection, which never comes once the last one
+        # is lost, so they are told that there are none left instead
+        with self._lock:
+            self._live -= 1
+            if not self._live:
+                self._idle.put(None)
+
+    def _wait(self, connection):
+        while True:
+            message = connection.receive()
+            if message is None:
+                raise WorkerException("Lost connection to worker %s" % connection.address)
+
+            if message['type'] == 'log':
+                stream = sys.stderr if message['stream'] == 'stderr' else sys.stdout
+                stream.write(message['data'])
+                stream.flush()
+            elif message['type'] == 'done':
+                return message
+
+
+class WorkerServer(object):
+    """Serves the tasks of a registry to coordinators. Coordinators are served
+    one at a time and their tasks are run one at a time, since the output of a
+    task is captured from the file descriptors of the whole process. Run more
+    workers to run more tasks at once.
+
+    Workers listening on HOST:PORT need a key. Workers listening on a Unix
+    socket rely on the socket only being open to the user when they have none.
+    """
+    def __init__(self, address, registry, manifest, key=None):
+        self.address = address
+        self.registry = registry
+        self.digest = manifest_digest(manifest)
+        self.key = key
+
+        self._socket = None
+
+    def listen(self):
+        family, target = parse_address(self.address)
+        if family != socket.AF_UNIX and not self.key:
+            raise WorkerException("Workers listening on HOST:PORT need a key, set %s or use --worker-key" %
+                                  KEY_VARIABLE)
+
+        self._socket = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_UNIX:
+            if os.path.exists(target):
+                os.remove(target)
+        else:
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+        self._socket.bind(target)
+        if family == socket.AF_UNIX:
+            os.chmod(target, 0o600)
+
+        self._socket.listen(1)
+
+    def serve_forever(self):
+        while True:
+            connection = self.accept()
+            try:
+                self.serve(connection)
+            finally:
+                connection.close()
+
+    def accept(self):
+        """Waits for a coordinator to connect.
+
+        :return: the connection to the coordinator
+        """
+        sock, _ = self._socket.accept()
+        return Connection(sock, self.address)
+
+    def serve(self, connection):
+        """Runs the tasks sent over a connection until the coordinator closes it"""
+        try:
+            hello = connection.receive()
+            if not hello or not self._handshake(connection, hello):
+                return
+
+            for message in iter(connection.receive, None):
+                if message['type'] == 'run':
+                    connection.send(self._run(connection, message['label'], message['kwargs'],
+                                              message.get('results', {})))
+        except (IOError, OSError):
+            # A coordinator that goes away, such as one that was refused, only
+            # ends its own session
+            return
+
+    def close(self):
+        self._socket.close()
+
+        family, target = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(target):
+            os.remove(target)
+
+    def _handshake(self, connection, hello):
+        if hello.get('version') != PROTOCOL_VERSION:
+            message = "protocol version %s is not supported" % hello.get('version')
+        elif not self._authenticate(connection):
+            message = "the coordinator does not have the key of the worker"
+        elif hello.get('manifest') != self.digest:
+            message = "it has loaded a different Snakefile"
+        else:
+            connection.send({'type': 'ready'})
+            return True
+
+        connection.send({'type': 'error', 'message': message})
+        return False
+
+    def _authenticate(self, connection):
+        if not self.key:
+            return True
+
+        nonce = hexlify(os.urandom(16)).decode('ascii')
+        connection.send({'type': 'challenge', 'nonce': nonce})
+
+        reply = connection.receive()
+        if not reply or reply.get('type') != 'auth':
+            return False
+
+        # Compared as bytes since compare_digest only takes ASCII strings
+        signature = ('%s' % reply.get('signature')).encode('utf-8')
+        return hmac.compare_digest(signature, sign(self.key, nonce).encode('ascii'))
+
+    def _run(self, connection, label, kwargs, results):
+        outcome = {'type': 'done', 'label': label, 'ok': True, 'result': None}
+
+        started = time.time()
+        with OutputCapture(connection):
+            try:
+                outcome['result'] = _serializable(self.registry.run(label, _results=results, **kwargs))
+            except Exception as e:
+                frames = extract_tb(sys.exc_info()[2])[1:]
+                outcome.update(ok=False, error=str(e), frames=[list(frame) for frame in frames])
+
+        outcome['wall'] = time.time() - started
+        return outcome
+
+
+def _serializable(value):
+    try:
+        json.dumps(value)
+    except (TypeError, ValueError):
+        return None
+
+    return value
+
+
+class OutputCapture(object):
+    """Sends everything written to stdout and stderr, including by child
+    processes, over a connection for the duration of the context. This works on
+    file descriptors rather than on sys.stdout and sys.stderr for the sake of
+    commands run with sh.
+    """
+    STREAMS = (('stdout', 1), ('stderr', 2))
+
+    def __init__(self, connection):
+        self.connection = connection
+
+        self._saved = []
+        self._readers = []
+
+    def __enter__(self):
+        self._flush()
+
+        for name, fd in self.STREAMS:
+            read, write = os.pipe()
+
+            self._saved.append((fd, os.dup(fd)))
+            os.dup2(write, fd)
+            os.close(write)
+
+            reader = Thread(target=self._forward, args=(name, read))
+            reader.daemon = True
+            reader.start()
+            self._readers.append(reader)
+
+        return self
+
+    def __exit__(self, *exc_info):
+        self._flush()
+
+        # Restoring the descriptors closes the write ends of the pipes, which
+        # lets the readers finish once they have sent what is left
+        for fd, saved in self._saved:
+            os.dup2(saved, fd)
+            os.close(saved)
+
+        for reader in self._readers:
+            reader.join()
+
+        self._saved, self._readers = [], []
+
+    def _forward(self, name, fd):
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        try:
+            for chunk in iter(lambda: os.read(fd, 65536), b''):
+                data = decoder.decode(chunk)
+                if data:
+                    self.connection.send({'type': 'log', 'stream': name, 'data': data})
+        finally:
+            os.close(fd)
+
+    def _flush(self):
+        sys.stdout.flush()
+        sys.stderr.flush()
@@ -0,0 +1,191 @@
+"""Keeps a history of how long tasks took and how they went, which is used to
+estimate how long tasks will take before running them.
+"""
+import json
+import time
+from collections import defaultdict
+from math import ceil
+from os import getpid, makedirs, path, rename
+from threading import Lock
+from six import iteritems
+
+
+class TaskRun(object):
+    """A single run of a task"""
+    def __init__(self, label, started, duration, failed, arguments):
+        self.label = label
+        self.started = started
+        self.duration = duration
+        self.failed = failed
+        self.arguments = arguments
+
+    @classmethod
+    def from_entry(cls, entry):
+        return cls(entry['task'], entry['started'], entry['duration'], entry['failed'],
+                   entry['arguments'])
+
+    def entry(self):
+        return {
+            'task': self.label,
+            'started': self.started,
+            'duration': self.duration,
+            'failed': self.failed,
+            'arguments': self.arguments,
+        }
+
+
+class Estimate(object):
+    """How long a task is expected to take, from the durations of its past
+    successful runs.
+    """
+    def __init__(self, durations):
+        durations = sorted(durations)
+        middle = len(durations) // 2
+
+        self.runs = len(durations)
+        self.median = (durations[middle] + durations[~middle]) / 2.0
+        self.p90 = durations[int(ceil(0.9 * len(durations))) - 1]
+
+
+class TaskHistory(object):
+    """Records the runs of tasks in a file of JSON objects, one per line. It
+    listens to the instrumentation of a run and appends the runs of that run to
+    the file when saved. Once the file grows past max_size bytes, only the
+    latest runs of each task are kept.
+    """
+    def __init__(self, filename, runs=20, max_size=1024 * 1024):
+        self.filename = filename
+        self.runs_per_task = runs
+        self.max_size = max_size
+
+        self._started = {}
+        self._pending = []
+        self._runs = None
+        self._lock = Lock()
+
+    def task_started(self, label, arguments):
+        # Arguments are stored as they are displayed since they may not be
+        # serializable
+        arguments = dict((name, '%s' % value) for name, value in iteritems(arguments))
+        with self._lock:
+            self._started[label] = (time.time(), arguments)
+
+    def task_finished(self, label, failed):
+        finished = time.time()
+        with self._lock:
+            started, arguments = self._started.pop(label)
+            self._pending.append(TaskRun(label, started, finished - started, failed, arguments))
+
+    def save(self):
+        """Appends the runs recorded since the last save to the file. Failing to
+        write the history is not an error.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+
+        if not pending:
+            return
+
+        try:
+            directory = path.dirname(self.filename)
+            if not path.isdir(directory):
+                makedirs(directory)
+
+            with open(self.filename, 'a') as f:
+                f.write(''.join(json.dumps(run.entry()) + '\n' for run in pending))
+
+            if path.getsize(self.filename) > self.max_size:
+                self._compact()
+        except (IOError, OSError):
+            pass
+
+        self._runs = None
+
+    def runs(self, label):
+        """Returns the recorded runs of a task, oldest first.
+
+        :return: list of task runs
+        """
+        if self._runs is None:
+            self._runs = self._read()
+
+        return self._runs.get(label, [])
+
+    def last_run(self, label):
+        """Returns the latest recorded run of a task, or None if it never ran"""
+        runs = self.runs(label)
+        return runs[-1] if runs else None
+
+    def estimate(self, label):
+        """Estimates how long a task will take from its past successful runs.
+
+        :return: the estimate, or None if the task never ran successfully
+        """
+        durations = [run.duration for run in self.runs(label) if not run.failed]
+        if not durations:
+            return None
+
+        return Estimate(durations)
+
+    def _read(self):
+        runs = defaultdict(list)
+        try:
+            with open(self.filename) as f:
+                for line in f:
+                    try:
+                        run = TaskRun.from_entry(json.loads(line))
+                    except (ValueError, KeyError, TypeError):
+                        # A line cut short by a run that was killed while saving
+                        continue
+
+                    runs[run.label].append(run)
+        except (IOError, OSError):
+            pass
+
+        return runs
+
+    def _compact(self):
+        runs = self._read()
+
+        # Writes to a temporary file first so that a concurrent snake never
+        # reads a partially written history
+        temporary = '%s.%d' % (self.filename, getpid())
+        with open(temporary, 'w') as f:
+            for label in sorted(runs):
+                for run in runs[label][-self.runs_per_task:]:
+                    f.write(json.dumps(run.entry()) + '\n')
+
+        rename(temporary, self.filename)
+
+
+def format_plan(labels, history):
+    """Formats the tasks that a run would execute along with how long each of
+    them, and the whole run, is expected to take. The total is for running the
+    tasks one after another.
+
+    :param labels: the labels of the tasks, in the order they would run in
+    :param history: the task history to estimate the durations from
+    :return: string formatted as a table
+    """
+    rows = [('Task', 'Median', 'P90', 'Runs')]
+    total_median = total_p90 = 0.0
+    for label in labels:
+        estimate = history.estimate(label)
+        if estimate is None:
+            rows.append((label, '-', '-', '0'))
+            continue
+
+        total_median += estimate.median
+        total_p90 += estimate.p90
+        rows.append((label, _format_seconds(estimate.median), _format_seconds(estimate.p90),
+                     '%d' % estimate.runs))
+
+    rows.append(('Total', _format_seconds(total_median), _format_seconds(total_p90), ''))
+
+    width = max(len(row[0]) for row in rows)
+    lines = ['%-*s  %9s  %9s  %5s' % ((width,) + row) for row in rows]
+    return '\n'.join(line.rstrip() for line in lines)
+
+
+def _format_seconds(seconds):
+    return '%.3fs' % seconds
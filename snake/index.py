@@ -0,0 +1,143 @@
+import json
+import sys
+from collections import OrderedDict
+from hashlib import sha1
+from os import getpid, makedirs, path, rename, stat
+from six import iteritems
+
+from .loader import cache_directory
+
+# Bumped whenever the format of the index changes
+INDEX_VERSION = 2
+
+
+class IndexedTask(object):
+    """A task as recorded in the index. It has the same interface as a task for
+    the purpose of listing, but cannot be executed.
+    """
+    def __init__(self, label, description, required, optional):
+        self.label = label
+        self.description = description
+
+        self._required = required
+        self._optional = optional
+
+    def required_args(self):
+        return list(self._required)
+
+    def optional_args(self):
+        return OrderedDict(self._optional)
+
+
+class TaskIndex(object):
+    """An on-disk index of the tasks defined by a Snakefile. It is written when
+    the Snakefile is loaded and allows tasks to be listed without loading the
+    Snakefile again. The index records the files the Snakefile was loaded from
+    and is only used while none of them have changed.
+
+    The files are recorded on the first line and the tasks on the second, so
+    that checking whether the index is current does not read every task.
+    """
+    def __init__(self, manifest, directory=None):
+        self.manifest = manifest
+        self.directory = directory or path.join(cache_directory(), 'index')
+
+    def tasks(self):
+        """Reads the tasks from the index.
+
+        :return: list of indexed tasks, or None if the index is missing or stale
+        """
+        try:
+            with open(self._path()) as f:
+                if not self._is_current(f):
+                    return None
+
+                entries = json.loads(f.readline())
+        except (IOError, OSError, ValueError):
+            return None
+
+        return [IndexedTask(*entry) for entry in entries]
+
+    def is_current(self):
+        """Whether the index exists and none of the files it was built from
+        have changed since.
+        """
+        try:
+            with open(self._path()) as f:
+                return self._is_current(f)
+        except (IOError, OSError, ValueError):
+            return False
+
+    def _is_current(self, f):
+        header = json.loads(f.readline())
+        if header.get('version') != INDEX_VERSION:
+            return False
+
+        return all(self._identity(filename) == identity
+                   for filename, identity in iteritems(header['files']))
+
+    def save(self, tasks, includes):
+        """Writes the index. Failing to write the index is not an error.
+
+        :param tasks: the tasks defined by the manifest
+        :param includes: paths of other files that the manifest was loaded from
+        """
+        files = dict((filename, self._identity(filename))
+                     for filename in [self.manifest] + list(includes))
+
+        header = {'version': INDEX_VERSION, 'files': files}
+        entries = [self._entry(task) for task in tasks]
+
+        temporary = '%s.%d' % (self._path(), getpid())
+        try:
+            if not path.isdir(self.directory):
+                makedirs(self.directory)
+
+            with open(temporary, 'w') as f:
+                f.write(json.dumps(header) + '\n')
+                f.write(json.dumps(entries) + '\n')
+
+            rename(temporary, self._path())
+        except (IOError, OSError):
+            pass
+
+    def _entry(self, task):
+        # Defaults are stored as they are displayed since they may not be
+        # serializable
+        optional = [(name, '%s' % default) for name, default in iteritems(task.optional_args())]
+        return [task.label, task.description, task.required_args(), optional]
+
+    def _identity(self, filename):
+        try:
+            info = stat(filename)
+        except OSError:
+            return None
+
+        return [repr(info.st_mtime), info.st_size]
+
+    def _path(self):
+        name = sha1(self.manifest.encode('utf-8')).hexdigest()
+        return path.join(self.directory, '%s.json' % name)
+
+
+def included_files(directory, modules_before):
+    """Finds the source files of the modules that were imported from a directory
+    since a snapshot of the loaded modules was taken.
+
+    :param directory: the directory the manifest lives in
+    :param modules_before: the names of the modules loaded before the manifest
+    :return: list of paths
+    """
+    prefix = path.join(directory, '')
+    includes = []
+    for name, module in list(iteritems(sys.modules)):
+        filename = getattr(module, '__file__', None)
+        if name in modules_before or not filename or not filename.startswith(prefix):
+            continue
+
+        if filename.endswith('.pyc'):
+            filename = filename[:-1]
+
+        includes.append(filename)
+
+    return includes
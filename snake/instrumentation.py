@@ -0,0 +1,438 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from threading import Lock, current_thread, local
+from six import iteritems, itervalues
+
+try:
+    from contextvars import ContextVar
+except ImportError:
+    # Python 3.6 and earlier only track the current task per thread
+    ContextVar = None
+
+try:
+    from time import thread_time as cpu_time
+except ImportError:
+    # Python 3.6 and earlier can only measure the CPU time of the whole process
+    cpu_time = lambda: sum(os.times()[:2])
+
+
+class Instrumentation(object):
+    """Notifies listeners of what happens during a run. The task registry reports
+    when tasks start and finish and the shell reports the commands it runs. The
+    task running on each thread, and in each coroutine where contextvars are
+    available, is tracked so that commands can be attributed to the task that
+    ran them.
+
+    Listeners can implement any of task_started(label, arguments),
+    task_finished(label, failed), command_started(label, command) and
+    command_finished(label, command, status). The label given for a command is None when it did not run
+    on behalf of a task. Listeners are called from the thread the event happened
+    on. Commands that a task ran in a worker process are reported once it is done,
+    through commands_forwarded(label, commands, child_cpu_time), and tasks that
+    ran on other machines through task_ran_on_worker(label, worker, wall_time).
+    """
+    def __init__(self):
+        self.listeners = []
+
+        # Coroutines of several tasks interleave on the thread of the event loop,
+        # so the current task is kept in a context variable where possible
+        self._local = local()
+        self._current = ContextVar('snake_task', default=None) if ContextVar else None
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    @property
+    def current_task(self):
+        """The label of the task running on the current thread or coroutine, if any"""
+        if self._current:
+            return self._current.get()
+
+        return getattr(self._local, 'task', None)
+
+    @contextmanager
+    def task(self, label, arguments=None):
+        """Reports that a task runs for the duration of the context.
+
+        :param label: the label of the task
+        :param arguments: the keyword arguments the task is called with
+        """
+        self._notify('task_started', label, arguments or {})
+
+        failed = True
+        try:
+            with self.on_behalf_of(label):
+                yield
+            failed = False
+        finally:
+            self._notify('task_finished', label, failed)
+
+    @contextmanager
+    def on_behalf_of(self, label):
+        """Attributes the commands run on the current thread to a task for the
+        duration of the context. This is for threads that do work for a task
+        that is running on another thread, and for its coroutines.
+        """
+        if self._current:
+            token = self._current.set(label)
+            try:
+                yield
+            finally:
+                self._current.reset(token)
+            return
+
+        previous = self.current_task
+        self._local.task = label
+        try:
+            yield
+        finally:
+            self._local.task = previous
+
+    @contextmanager
+    def command(self, command, task=None):
+        """Reports that a command runs for the duration of the context. The
+        status of the command can be reported by assigning it to the `status`
+        attribute of the value of the context.
+
+        :param task: the label of the task that runs the command, which is the
+                     current task by default
+        """
+        label = task or self.current_task
+        self._notify('command_started', label, command)
+
+        outcome = CommandOutcome()
+        try:
+            yield outcome
+        finally:
+            self._notify('command_finished', label, command, outcome.status)
+
+    def forward(self, label, commands, child_cpu_time):
+        """Reports the commands that a task ran in a worker process.
+
+        :param label: the label of the task
+        :param commands: list of forwarded commands, in the order they finished
+        :param child_cpu_time: the CPU time the commands used, in seconds
+        """
+        self._notify('commands_forwarded', label, commands, child_cpu_time)
+
+    def ran_on_worker(self, label, worker, wall_time):
+        """Reports that a task ran on another machine.
+
+        :param label: the label of the task
+        :param worker: the address of the worker that ran it
+        :param wall_time: how long the task took on the worker, in seconds
+        """
+        self._notify('task_ran_on_worker', label, worker, wall_time)
+
+    def _notify(self, event, *args):
+        for listener in self.listeners:
+            handler = getattr(listener, event, None)
+            if handler:
+                handler(*args)
+
+
+class CommandOutcome(object):
+    def __init__(self):
+        self.status = None
+
+
+class ForwardedCommand(object):
+    """A command that ran in a worker process, with the times it started and
+    finished there.
+    """
+    def __init__(self, command, status, started, finished):
+        self.command = command
+        self.status = status
+        self.started = started
+        self.finished = finished
+
+
+class CommandRecorder(object):
+    """Records the commands run in a worker process, so that they can be
+    forwarded to the instrumentation of the process that sent it the task.
+    """
+    def __init__(self):
+        self._commands = []
+        self._started = {}
+        self._lock = Lock()
+
+    def command_started(self, label, command):
+        with self._lock:
+            self._started.setdefault(command, []).append(time.time())
+
+    def command_finished(self, label, command, status):
+        finished = time.time()
+        with self._lock:
+            started = self._started[command].pop()
+            self._commands.append(ForwardedCommand(command, status, started, finished))
+
+    def take(self):
+        """Returns the commands recorded since the last call"""
+        with self._lock:
+            commands, self._commands = self._commands, []
+            return commands
+
+
+class TaskProfile(object):
+    """The resources used by a single task"""
+    def __init__(self, label):
+        self.label = label
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.child_cpu_time = 0.0
+        self.commands = 0
+        self.failed = False
+
+        # The address of the worker the task ran on, if it ran on another machine
+        self.worker = None
+        self.worker_time = 0.0
+
+
+class Profiler(object):
+    """Records the wall time, CPU time, CPU time of child processes and number of
+    shell commands of each task. CPU time is measured for the thread the task
+    ran on where the platform supports it. Child processes can only be measured
+    for the whole process, so with more than one job a task is also charged for
+    the child processes of the tasks that ran at the same time.
+    """
+    def __init__(self):
+        self._profiles = {}
+        self._started = {}
+        self._lock = Lock()
+
+    def task_started(self, label, arguments):
+        with self._lock:
+            self._profiles.setdefault(label, TaskProfile(label))
+            self._started[label] = (time.time(), cpu_time(), self._child_cpu_time())
+
+    def task_finished(self, label, failed):
+        wall, cpu, child_cpu = time.time(), cpu_time(), self._child_cpu_time()
+
+        with self._lock:
+            started_wall, started_cpu, started_child_cpu = self._started.pop(label)
+
+            profile = self._profiles[label]
+            profile.wall_time += wall - started_wall
+            profile.cpu_time += cpu - started_cpu
+            profile.child_cpu_time += child_cpu - started_child_cpu
+            profile.failed = failed
+
+    def command_finished(self, label, command, status):
+        with self._lock:
+            if label in self._profiles:
+                self._profiles[label].commands += 1
+
+    def commands_forwarded(self, label, commands, child_cpu_time):
+        # The commands of worker processes are not children of this process
+        with self._lock:
+            if label in self._profiles:
+                self._profiles[label].commands += len(commands)
+                self._profiles[label].child_cpu_time += child_cpu_time
+
+    def task_ran_on_worker(self, label, worker, wall_time):
+        with self._lock:
+            if label in self._profiles:
+                self._profiles[label].worker = worker
+                self._profiles[label].worker_time += wall_time
+
+    def profiles(self):
+        """Returns the profile of every task that ran, slowest first.
+
+        :return: list of task profiles
+        """
+        with self._lock:
+            return sorted(itervalues(self._profiles), key=lambda profile: -profile.wall_time)
+
+    def report(self):
+        """Formats the profiles as a table, slowest task first.
+
+        :return: string formatted as a table
+        """
+        profiles = self.profiles()
+
+        # Only runs with tasks on other machines show where they ran
+        rows = [('Task', 'Wall', 'CPU', 'Child CPU', 'sh', 'Worker')]
+        for profile in profiles:
+            label = profile.label + (' (failed)' if profile.failed else '')
+            worker = ''
+            if profile.worker:
+                worker = '%s (%s)' % (profile.worker, self._format_seconds(profile.worker_time))
+
+            rows.append((label,
+                         self._format_seconds(profile.wall_time),
+                         self._format_seconds(profile.cpu_time),
+                         self._format_seconds(profile.child_cpu_time),
+                         '%d' % profile.commands,
+                         worker))
+
+        if not any(profile.worker for profile in profiles):
+            rows = [row[:-1] + ('',) for row in rows]
+
+        width = max(len(row[0]) for row in rows)
+        lines = ['%-*s  %9s  %9s  %9s  %5s  %s' % ((width,) + row) for row in rows]
+        return '\n'.join(line.rstrip() for line in lines)
+
+    def _child_cpu_time(self):
+        return sum(os.times()[2:4])
+
+    def _format_seconds(self, seconds):
+        return '%.3fs' % seconds
+
+
+class TraceRecorder(object):
+    """Records tasks and commands as spans in the Chrome trace event format, which
+    can be loaded into chrome://tracing or Perfetto. Every thread that runs tasks
+    gets its own lane, so tasks that ran at the same time are shown side by side
+    and the commands of a task are nested under it, even the commands that async
+    tasks run on the thread of the event loop. Commands that a task runs at the
+    same time, with sh.map or from several coroutines, go on extra lanes beside
+    the lane of the task since spans on one lane must not overlap.
+    """
+    def __init__(self):
+        self._events = []
+        self._lanes = {}
+        self._task_lanes = {}
+        self._extra_lanes = {}
+        self._names = {}
+        self._free_from = {}
+        self._open = {}
+        self._origin = time.time()
+        self._lock = Lock()
+
+    def task_started(self, label, arguments):
+        args = dict((name, '%s' % value) for name, value in iteritems(arguments))
+        with self._lock:
+            self._task_lanes[label] = self._lane()
+
+        self._begin(label, 'task', args, label)
+
+    def task_finished(self, label, failed):
+        self._end(label, 'task', {'failed': failed}, label)
+        with self._lock:
+            self._task_lanes.pop(label, None)
+
+    def command_started(self, label, command):
+        self._begin(command, 'command', {'task': label}, label)
+
+    def command_finished(self, label, command, status):
+        self._end(command, 'command', {'status': status}, label)
+
+    def commands_forwarded(self, label, commands, child_cpu_time):
+        with self._lock:
+            for command in sorted(commands, key=lambda command: command.started):
+                started = self._timestamp(command.started)
+                finished = self._timestamp(command.finished)
+                lane = self._command_lane(label, started, finished)
+                self._events.append({'name': command.command, 'cat': 'command', 'ph': 'X',
+                                     'pid': os.getpid(), 'tid': lane, 'ts': started,
+                                     'dur': finished - started,
+                                     'args': {'task': label, 'status': command.status}})
+
+    def task_ran_on_worker(self, label, worker, wall_time):
+        # The clock of the worker may differ, so the span is shown as ending when
+        # the coordinator heard that the task finished
+        finished = self._timestamp()
+        started = finished - int(wall_time * 1000000)
+
+        with self._lock:
+            lane = self._command_lane(label, started, finished)
+            self._events.append({'name': worker, 'cat': 'worker', 'ph': 'X', 'pid': os.getpid(),
+                                 'tid': lane, 'ts': started, 'dur': finished - started,
+                                 'args': {'task': label}})
+
+    def events(self):
+        """Returns the recorded events.
+
+        :return: list of trace events as dicts
+        """
+        with self._lock:
+            return list(self._events)
+
+    def save(self, filename):
+        """Writes the recorded events to a file as JSON.
+
+        :param filename: the path of the file to write
+        """
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': self.events(), 'displayTimeUnit': 'ms'}, f)
+
+    def _begin(self, name, category, args, task):
+        timestamp = self._timestamp()
+
+        with self._lock:
+            if category == 'command':
+                lane = self._command_lane(task, timestamp)
+            else:
+                lane = self._home_lane(task)
+
+            self._open.setdefault(lane, []).append((name, category, timestamp, args))
+
+    def _end(self, name, category, args, task):
+        timestamp = self._timestamp()
+
+        with self._lock:
+            # Spans on a lane are normally closed in the reverse order that they
+            # were opened, but concurrent coroutines can interleave on one thread
+            for lane in self._lane_group(task):
+                spans = self._open.get(lane, [])
+                matches = [i for i, span in enumerate(spans) if span[:2] == (name, category)]
+                if matches:
+                    break
+
+            name, category, started, begin_args = spans.pop(matches[-1])
+            if category == 'command':
+                self._free_from[lane] = timestamp
+
+            args = dict(begin_args, **args)
+            self._events.append({'name': name, 'cat': category, 'ph': 'X', 'pid': os.getpid(),
+                                 'tid': lane, 'ts': started, 'dur': timestamp - started,
+                                 'args': args})
+
+    def _command_lane(self, task, started, finished=None):
+        """Finds the first lane of a task that has no command running at the time
+        a command starts, adding a lane when every one of them has.
+
+        :param finished: when the command finished, if it already has
+        """
+        lanes = self._lane_group(task)
+        free = [lane for lane in lanes if self._free_from.get(lane, float('-inf')) <= started]
+        if free:
+            lane = free[0]
+        else:
+            home = lanes[0]
+            lane = self._add_lane('%s (%d)' % (self._names[home], len(lanes) + 1))
+            self._extra_lanes.setdefault(home, []).append(lane)
+
+        # A command that is still running keeps its lane until it finishes
+        self._free_from[lane] = float('inf') if finished is None else finished
+        return lane
+
+    def _lane_group(self, task):
+        home = self._home_lane(task)
+        return [home] + self._extra_lanes.get(home, [])
+
+    def _home_lane(self, task):
+        return self._task_lanes.get(task) or self._lane()
+
+    def _lane(self):
+        thread = current_thread()
+        if thread.ident not in self._lanes:
+            self._lanes[thread.ident] = self._add_lane(thread.name)
+
+        return self._lanes[thread.ident]
+
+    def _add_lane(self, name):
+        lane = len(self._names) + 1
+        self._names[lane] = name
+        self._events.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(),
+                             'tid': lane, 'args': {'name': name}})
+        return lane
+
+    def _timestamp(self, at=None):
+        # Trace events are timed in microseconds
+        return int(((at or time.time()) - self._origin) * 1000000)
@@ -0,0 +1,199 @@
+"""Shares a budget of jobs with make, using the jobserver protocol of GNU make.
+A jobserver is a pipe, or a named pipe, holding one byte, a token, for every job
+that may run beyond the first. Every process in the tree reads a token before
+it starts an extra job and writes it back once the job is done, so the whole
+tree runs no more jobs at once than the budget allows.
+
+Snake uses the jobserver that make advertises in MAKEFLAGS when make runs it,
+and otherwise starts one of its own when it runs more than one job. Commands
+run with sh are told about the jobserver, so that make, or snake, run from a
+task shares the same budget.
+"""
+import os
+import re
+import select
+import stat
+from contextlib import contextmanager
+from errno import EAGAIN, EINTR
+from threading import Lock
+from six import PY2
+
+# The options make uses to advertise a jobserver, the first is used by make 4.2
+# and later, the second by earlier versions
+JOBSERVER_OPTIONS = re.compile(r'--jobserver-(?:auth|fds)=(\S+)')
+JOBS_OPTION = re.compile(r'^-j(\d*)$')
+
+
+class Jobserver(object):
+    """A jobserver that this process takes part in, either as the server that
+    created it or as a client of the process that passed it down.
+
+    :param read_fd: the file descriptor that tokens are read from
+    :param write_fd: the file descriptor that tokens are written back to
+    :param jobs: the size of the budget, if known
+    :param fifo: the path of the named pipe, for jobservers that use one
+    """
+    def __init__(self, read_fd, write_fd, jobs=None, fifo=None):
+        self.read_fd = read_fd
+        self.write_fd = write_fd
+        self.jobs = jobs
+        self.fifo = fifo
+
+    @classmethod
+    def create(cls, jobs):
+        """Starts a jobserver for a budget of jobs. The process that starts it
+        holds one job already, so the pipe starts out with one token fewer.
+        """
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, b'+' * (jobs - 1))
+        return cls(read_fd, write_fd, jobs)
+
+    @classmethod
+    def from_makeflags(cls, makeflags):
+        """Joins the jobserver advertised in MAKEFLAGS.
+
+        :return: the jobserver, or None if there is none or it was not passed
+                 down to this process
+        """
+        words = makeflags.split()
+        auth = [match.group(1) for match in map(JOBSERVER_OPTIONS.match, words) if match]
+        if not auth:
+            return None
+
+        jobs = [match.group(1) for match in map(JOBS_OPTION.match, words) if match]
+        jobs = int(jobs[-1]) if jobs and jobs[-1] else None
+
+        if auth[-1].startswith('fifo:'):
+            fifo = auth[-1][len('fifo:'):]
+            try:
+                fd = os.open(fifo, os.O_RDWR)
+            except OSError:
+                return None
+
+            return cls(fd, fd, jobs, fifo)
+
+        try:
+            read_fd, write_fd = [int(fd) for fd in auth[-1].split(',')]
+        except ValueError:
+            return None
+
+        # Make only passes the pipe to commands it knows to be make, so the
+        # descriptors may be closed, or be something else entirely
+        if not (_is_pipe(read_fd) and _is_pipe(write_fd)):
+            return None
+
+        return cls(read_fd, write_fd, jobs)
+
+    def acquire(self, timeout=None):
+        """Takes a token, waiting for one to be available.
+
+        :param timeout: how long to wait in seconds, or None to wait forever
+        :return: the token, or None if none was available before the timeout
+        """
+        while True:
+            try:
+                readable, _, _ = select.select([self.read_fd], [], [], timeout)
+            except (OSError, select.error) as e:
+                if e.args[0] == EINTR:
+                    continue
+                raise
+
+            if not readable:
+                return None
+
+            # Another process may have taken the token in the meantime, in which
+            # case a pipe that make made non-blocking has nothing to read
+            try:
+                token = os.read(self.read_fd, 1)
+            except OSError as e:
+                if e.errno in (EAGAIN, EINTR):
+                    continue
+                raise
+
+            if token:
+                return token
+
+    def release(self, token):
+        """Gives back a token that was taken with acquire"""
+        os.write(self.write_fd, token)
+
+    def makeflags(self, makeflags=''):
+        """Adds the jobserver to MAKEFLAGS for a child process, replacing any
+        jobserver or number of jobs that it mentions already.
+        """
+        words = [word for word in makeflags.split()
+                 if not (JOBSERVER_OPTIONS.match(word) or JOBS_OPTION.match(word))]
+
+        words.append('-j%s' % (self.jobs or ''))
+        if self.fifo:
+            words.append('--jobserver-auth=fifo:%s' % self.fifo)
+        else:
+            words.append('--jobserver-auth=%d,%d' % (self.read_fd, self.write_fd))
+
+        return ' '.join(words)
+
+    def process_options(self, options=None):
+        """Adds what a child process needs to share the jobserver to the options
+        for starting it with subprocess.
+        """
+        options = dict(options or {})
+
+        env = options.get('env')
+        env = dict(os.environ if env is None else env)
+        env['MAKEFLAGS'] = self.makeflags(env.get('MAKEFLAGS', ''))
+        options['env'] = env
+
+        # Python 2 leaves descriptors open in child processes by default
+        if not self.fifo and not PY2:
+            options['pass_fds'] = tuple(options.get('pass_fds', ())) + (self.read_fd, self.write_fd)
+
+        return options
+
+
+class JobSlots(object):
+    """The slots that the tasks of a run take up while they run. The first slot
+    is the one the process already holds, every other slot takes a token from
+    the jobserver.
+    """
+    def __init__(self, jobserver, poll_interval=0.1):
+        self.jobserver = jobserver
+        self.poll_interval = poll_interval
+
+        self._own_slot_free = True
+        self._lock = Lock()
+
+    @contextmanager
+    def slot(self):
+        """Holds a slot for the duration of the context"""
+        token = self._acquire()
+        try:
+            yield
+        finally:
+            self._release(token)
+
+    def _acquire(self):
+        # Waits for a token a little at a time, since the slot of the process
+        # itself may become free in the meantime
+        while True:
+            with self._lock:
+                if self._own_slot_free:
+                    self._own_slot_free = False
+                    return None
+
+            token = self.jobserver.acquire(self.poll_interval)
+            if token:
+                return token
+
+    def _release(self, token):
+        if token is None:
+            with self._lock:
+                self._own_slot_free = True
+        else:
+            self.jobserver.release(token)
+
+
+def _is_pipe(fd):
+    try:
+        return stat.S_ISFIFO(os.fstat(fd).st_mode)
+    except OSError:
+        return False
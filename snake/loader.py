@@ -0,0 +1,97 @@
+import marshal
+import sys
+from hashlib import sha1
+from os import environ, getpid, makedirs, path, rename, stat
+from types import ModuleType
+from six import exec_
+
+MANIFEST_MODULE = 'Snakefile'
+
+
+def cache_directory():
+    """Returns the directory that snake keeps its caches in. This lives outside
+    of the project so that the project tree stays clean.
+
+    :return: the absolute path of the cache directory
+    """
+    base = environ.get('XDG_CACHE_HOME') or path.join(path.expanduser('~'), '.cache')
+    return path.join(base, 'snake')
+
+
+class ManifestLoader(object):
+    """Loads a Snakefile as a module. The compiled code of the Snakefile is
+    cached so that it only has to be parsed and compiled again when the file
+    changes or when it is loaded by a different version of Python.
+    """
+    def __init__(self, directory=None):
+        self.directory = directory or path.join(cache_directory(), 'manifests')
+
+    def load(self, filename, use_cache=True):
+        """Loads and executes the manifest.
+
+        :param filename: the absolute path of the manifest
+        :param use_cache: whether the compiled code can be read from and written
+                          to the cache
+        :raises IOError: if the manifest cannot be read
+        :return: the module created from the manifest
+        """
+        if use_cache:
+            code = self._cached_code(filename)
+        else:
+            code = self._compile(filename)
+
+        module = ModuleType(MANIFEST_MODULE)
+        module.__file__ = filename
+        sys.modules[MANIFEST_MODULE] = module
+
+        exec_(code, module.__dict__)
+        return module
+
+    def _cached_code(self, filename):
+        key = self._key(filename)
+        cached = self._cache_path(filename)
+
+        try:
+            with open(cached, 'rb') as f:
+                if f.read(len(key)) == key:
+                    return marshal.load(f)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            pass
+
+        code = self._compile(filename)
+        self._write(cached, key, code)
+        return code
+
+    def _compile(self, filename):
+        with open(filename, 'rb') as f:
+            source = f.read()
+
+        return compile(source, filename, 'exec', dont_inherit=True)
+
+    def _write(self, cached, key, code):
+        # Writes to a temporary file first so that a concurrent snake never
+        # reads a partially written cache entry. Failing to cache is not an error.
+        temporary = '%s.%d' % (cached, getpid())
+        try:
+            if not path.isdir(self.directory):
+                makedirs(self.directory)
+
+            with open(temporary, 'wb') as f:
+                f.write(key)
+                marshal.dump(code, f)
+
+            rename(temporary, cached)
+        except (IOError, OSError):
+            pass
+
+    def _key(self, filename):
+        """The key identifies the exact manifest and interpreter that the code
+        was compiled for. Stat raises if the manifest does not exist.
+        """
+        info = stat(filename)
+        identity = '%s|%r|%d|%s' % (filename, info.st_mtime, info.st_size, sys.version)
+        return sha1(identity.encode('utf-8')).hexdigest().encode('ascii')
+
+    def _cache_path(self, filename):
+        name = sha1(filename.encode('utf-8')).hexdigest()
+        return path.join(self.directory, name)
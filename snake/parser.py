@@ -7,6 +7,39 @@ flags_parser.add_option('-t', '--trace', dest='trace', action='store_true',
                         help="Turn on verbose backtraces")
 flags_parser.add_option('-T', '--tasks', dest='show_tasks', action='store_true',
                         help="Display the tasks with descriptions and exit")
+flags_parser.add_option('-n', '--dry-run', dest='dry_run', action='store_true',
+                        help="Display the tasks that would run and how long they are expected to take, and exit")
+flags_parser.add_option('--complete', dest='complete', metavar='PREFIX',
+                        help="Display the names of tasks starting with PREFIX and exit")
+flags_parser.add_option('-j', '--jobs', dest='jobs', metavar='N', type='int', default=1,
+                        help="Run up to N independent tasks at the same time")
+flags_parser.add_option('-k', '--keep-going', dest='keep_going', action='store_true',
+                        help="Keep running the tasks that do not require a failed task")
+flags_parser.add_option('--jobs-mode', dest='jobs_mode', metavar='MODE', type='choice',
+                        choices=['thread', 'process'], default='thread',
+                        help="Run tasks on threads or in worker processes (thread or process)")
+flags_parser.add_option('--workers', dest='workers', metavar='ADDRESS[,ADDRESS...]',
+                        help="Run the tasks on the workers listening at each ADDRESS")
+flags_parser.add_option('--worker', dest='worker', action='store_true',
+                        help="Run tasks sent by a coordinator instead of running tasks")
+flags_parser.add_option('--listen', dest='listen', metavar='ADDRESS',
+                        help="Listen for a coordinator at ADDRESS, either HOST:PORT or unix:PATH")
+flags_parser.add_option('--worker-key', dest='worker_key', metavar='FILE',
+                        help="Authenticate workers and coordinators with the key in FILE instead of $SNAKE_WORKER_KEY")
+flags_parser.add_option('--cache-size', dest='cache_size', metavar='MB', type='int', default=1024,
+                        help="Keep the task cache under MB megabytes")
+flags_parser.add_option('--cache-gc', dest='cache_gc', action='store_true',
+                        help="Evict old entries from the task cache and exit")
+flags_parser.add_option('--no-manifest-cache', dest='manifest_cache', action='store_false', default=True,
+                        help="Compile the Snakefile from source instead of using the cached code")
+flags_parser.add_option('--profile', dest='profile', action='store_true',
+                        help="Display the time and resources used by each task after the run")
+flags_parser.add_option('--trace-events', dest='trace_events', metavar='FILE',
+                        help="Write the tasks and commands that ran to FILE in Chrome trace event format")
+flags_parser.add_option('--daemon', dest='daemon', action='store_true',
+                        help="Keep the Snakefile loaded and run the commands of later invocations of snake")
+flags_parser.add_option('--watch', dest='watch', action='store_true',
+                        help="Run the tasks again whenever the files they read change")
 flags_parser.add_option('--version', dest='version', action='store_true',
                         help="Display the version information and exit")
 
@@ -0,0 +1,163 @@
+"""Runs tasks in a pool of worker processes so that CPU bound tasks written in
+Python are not held back by the GIL. Each worker loads the Snakefile once when
+it starts and then runs tasks by their label.
+"""
+import multiprocessing
+import os
+import pickle
+import sys
+from traceback import extract_tb
+from six import iteritems
+
+from .instrumentation import CommandRecorder
+from .loader import ManifestLoader
+
+# The registry that a worker process runs tasks from, and what records the
+# commands its tasks run
+_registry = None
+_recorder = None
+
+
+class RemoteFailure(object):
+    """An exception raised by a task in a worker process, along with the frames
+    of its traceback, since tracebacks themselves cannot be sent between
+    processes.
+    """
+    def __init__(self, exception, frames):
+        self.exception = exception
+        self.frames = frames
+
+    def reraise(self):
+        """Raises the exception in the current process. The frames from the
+        worker are kept in the `remote_traceback` attribute of the exception.
+        """
+        self.exception.remote_traceback = self.frames
+        raise self.exception
+
+
+class WorkerOutcome(object):
+    """What a task run in a worker process sends back: the value it returned,
+    or a RemoteFailure, along with the commands it ran and their CPU time.
+    """
+    def __init__(self, result, commands, child_cpu_time):
+        self.result = result
+        self.commands = commands
+        self.child_cpu_time = child_cpu_time
+
+
+class ProcessPool(object):
+    """A pool of worker processes that is only started once a task needs it.
+    Workers are started fresh rather than forked where the platform allows, so
+    they never inherit locks held by the threads of the scheduler. The commands
+    that tasks run in the workers are forwarded to the instrumentation, if any.
+    """
+    def __init__(self, manifest, processes, use_cache=True, instrumentation=None):
+        self.manifest = manifest
+        self.processes = processes
+        self.use_cache = use_cache
+        self.instrumentation = instrumentation
+
+        self._pool = None
+
+    def run(self, label, kwargs, results=None):
+        """Runs a task in a worker process and waits for it to finish. Exceptions
+        raised by the task are raised again in this process.
+
+        :param label: the label of the task to run
+        :param kwargs: the keyword arguments to pass to the task
+        :param results: the results of the tasks it requires, by label. Results
+                        that cannot be pickled are None in the worker.
+        :return: the value returned by the task
+        """
+        if not self._pool:
+            self._pool = self._start()
+
+        results = dict((name, _picklable_result(value)) for name, value in iteritems(results or {}))
+        outcome = self._pool.apply(execute_task, (label, kwargs, results))
+        if self.instrumentation:
+            self.instrumentation.forward(label, outcome.commands, outcome.child_cpu_time)
+
+        if isinstance(outcome.result, RemoteFailure):
+            outcome.result.reraise()
+
+        return outcome.result
+
+    def close(self):
+        if not self._pool:
+            return
+
+        self._pool.close()
+        self._pool.join()
+        self._pool = None
+
+    def _start(self):
+        context = multiprocessing
+        if hasattr(multiprocessing, 'get_context'):
+            context = multiprocessing.get_context('spawn')
+
+        return context.Pool(self.processes, initializer=initialize_worker,
+                            initargs=(self.manifest, self.use_cache))
+
+
+def initialize_worker(manifest, use_cache):
+    """Loads the Snakefile in a worker process. Workers that were forked already
+    have the tasks of the parent process.
+    """
+    global _registry, _recorder
+
+    from .application import _instance
+    _registry = _instance.registry
+
+    _recorder = CommandRecorder()
+    _instance.instrumentation.add_listener(_recorder)
+
+    # Tasks are always run in the worker itself
+    _registry.processes = None
+
+    if not _registry.tasks():
+        module = ManifestLoader().load(manifest, use_cache=use_cache)
+        _registry.default = getattr(module, 'default', None)
+
+
+def execute_task(label, kwargs, results=None):
+    """Runs a task in a worker process.
+
+    :return: the outcome, whose result is the value returned by the task, or a
+             RemoteFailure if it raised
+    """
+    child_cpu_time = _child_cpu_time()
+    try:
+        result = _registry.run(label, _results=results or {}, **kwargs)
+    except Exception as e:
+        # The first frame is this function, which is of no interest
+        frames = [tuple(frame) for frame in extract_tb(sys.exc_info()[2])[1:]]
+        result = RemoteFailure(_picklable(e), frames)
+    finally:
+        # Output is written before the task is reported as finished
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+    commands = _recorder.take() if _recorder else []
+    return WorkerOutcome(result, commands, _child_cpu_time() - child_cpu_time)
+
+
+def _child_cpu_time():
+    return sum(os.times()[2:4])
+
+
+def _picklable_result(value):
+    try:
+        pickle.dumps(value)
+    except Exception:
+        return None
+
+    return value
+
+
+def _picklable(exception):
+    try:
+        pickle.loads(pickle.dumps(exception))
+    except Exception:
+        return Exception('%s: %s' % (type(exception).__name__, exception))
+
+    return exception
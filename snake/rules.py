@@ -0,0 +1,57 @@
+import re
+from six import string_types
+
+
+class Rule(object):
+    """A rule describes how to build any file whose path matches a pattern. Tasks
+    are only created from a rule when a matching label is needed, so a single
+    rule can stand in for a task per file without defining them all up front.
+
+    Patterns are either strings where `%` stands for the part of the path that
+    varies (the stem), or compiled regular expressions. The sources of a string
+    pattern have `%` replaced by the stem. The sources of a regular expression
+    can refer to its groups, as in `re.sub`. Sources can also be functions that
+    are called with the target path and return a path or a list of paths.
+    """
+    def __init__(self, pattern, sources, func, description, requires=None):
+        self.pattern = pattern
+        self.sources = sources
+        self.func = func
+        self.description = description
+        self.requires = requires or []
+
+        self._regex = self._compile(pattern)
+
+    def match(self, label):
+        """Matches a label against the rule's pattern.
+
+        :param label: the label of the task being looked up
+        :return: the list of sources for the label, or None if it does not match
+        """
+        match = self._regex.match(label)
+        if not match:
+            return None
+
+        sources = []
+        for source in self.sources:
+            if callable(source):
+                expanded = source(label)
+                if isinstance(expanded, string_types):
+                    expanded = [expanded]
+                sources.extend(expanded)
+            elif isinstance(self.pattern, string_types):
+                sources.append(source.replace('%', match.group(1)))
+            else:
+                sources.append(match.expand(source))
+
+        return sources
+
+    def _compile(self, pattern):
+        if not isinstance(pattern, string_types):
+            return pattern
+
+        if '%' not in pattern:
+            raise ValueError("Rule pattern must contain a %% stem: %s" % pattern)
+
+        prefix, _, suffix = pattern.partition('%')
+        return re.compile('^%s(.+)%s$' % (re.escape(prefix), re.escape(suffix)))
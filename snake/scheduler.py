@@ -0,0 +1,154 @@
+from heapq import heappush, heappop
+from sys import exc_info
+from threading import Thread
+from six import reraise
+from six.moves.queue import Queue
+
+
+class Scheduler(object):
+    """Runs a plan of tasks while respecting the dependencies between them. A task
+    is started as soon as every one of its dependencies in the plan has finished.
+    With a single job the plan is run in order on the calling thread, otherwise
+    ready tasks are handed out to a pool of worker threads.
+
+    The number of jobs caps how many tasks run at once. Slots, when given, can
+    hold tasks back further: each task takes a slot for as long as it runs,
+    through the slot() context manager of the slots.
+
+    With keep_going, a failure only stops the tasks that depend on the failed
+    task, directly or not, and every other task in the plan still runs.
+    """
+    def __init__(self, graph, jobs=1, slots=None, keep_going=False):
+        self.jobs = jobs
+        self.slots = slots
+        self.keep_going = keep_going
+        self.failed = None
+        self.failures = []
+        self.skipped = []
+
+        self._graph = graph
+
+    def run(self, plan, execute):
+        """Runs every task in the plan. If a task raises, no new tasks are started,
+        the tasks that are already running are allowed to finish and the original
+        exception is raised again. The label of the task that failed is kept in
+        `failed`.
+
+        With keep_going, nothing is raised. Instead, each failure is kept in
+        `failures` as a (label, exc_info) pair, in the order the tasks failed, and
+        the tasks that did not run because of them are kept in `skipped`, in plan
+        order.
+
+        :param plan: list of task labels in dependency order
+        :param execute: function called with the label of each task to run
+        """
+        if self.jobs <= 1:
+            self._run_serially(plan, execute)
+        else:
+            self._run_concurrently(plan, execute)
+
+    def _run_serially(self, plan, execute):
+        # Tasks come after their dependencies in the plan, so a task is skipped
+        # when any of its dependencies failed or was skipped
+        stopped = set()
+        for label in plan:
+            if stopped.intersection(self._graph.dependencies(label)):
+                stopped.add(label)
+                self.skipped.append(label)
+                continue
+
+            try:
+                execute(label)
+            except Exception:
+                if not self.failed:
+                    self.failed = label
+
+                if not self.keep_going:
+                    raise
+
+                stopped.add(label)
+                self.failures.append((label, exc_info()))
+
+    def _run_concurrently(self, plan, execute):
+        position = dict((label, index) for index, label in enumerate(plan))
+
+        # For each task, the dependencies that have yet to finish and the tasks
+        # that are waiting on it. Dependencies outside of the plan are ignored.
+        waiting = {}
+        dependents = dict((label, []) for label in plan)
+        for label in plan:
+            waiting[label] = set(dependency for dependency in self._graph.dependencies(label)
+                                 if dependency in position)
+            for dependency in waiting[label]:
+                dependents[dependency].append(label)
+
+        # Ready tasks are started in plan order so that the run stays as close
+        # to the serial order as the number of jobs allows
+        ready = []
+        for label in plan:
+            if not waiting[label]:
+                heappush(ready, (position[label], label))
+
+        work, finished = Queue(), Queue()
+        workers = [Thread(target=self._work, args=(work, finished, execute),
+                          name='snake-worker-%d' % (number + 1))
+                   for number in range(min(self.jobs, len(plan)))]
+
+        for worker in workers:
+            worker.start()
+
+        failure = None
+        running = 0
+        try:
+            while ready or running:
+                while ready and running < len(workers) and not (failure and not self.keep_going):
+                    _, label = heappop(ready)
+                    work.put(label)
+                    running += 1
+
+                if not running:
+                    break
+
+                label, error = finished.get()
+                running -= 1
+
+                if error:
+                    # Tasks that depend on a failed task never become ready
+                    if not failure:
+                        self.failed, failure = label, error
+                    if self.keep_going:
+                        self.failures.append((label, error))
+                    continue
+
+                for dependent in dependents[label]:
+                    waiting[dependent].discard(label)
+                    if not waiting[dependent]:
+                        heappush(ready, (position[dependent], dependent))
+        finally:
+            for _ in workers:
+                work.put(None)
+
+            for worker in workers:
+                worker.join()
+
+        if self.keep_going:
+            self.skipped = [label for label in plan if waiting[label]]
+        elif failure:
+            reraise(*failure)
+
+    def _work(self, work, finished, execute):
+        while True:
+            label = work.get()
+            if label is None:
+                return
+
+            try:
+                if self.slots:
+                    with self.slots.slot():
+                        execute(label)
+                else:
+                    execute(label)
+            except Exception:
+                finished.put((label, exc_info()))
+            else:
+                finished.put((label, None))
@@ -1,32 +1,522 @@
-from subprocess import call
+import io
+import os
+import re
+import shlex
+import sys
+from contextlib import contextmanager
+from errno import ENOENT
+from itertools import islice
+from locale import getpreferredencoding
+from multiprocessing import cpu_count
+from subprocess import call, Popen, PIPE
+from threading import local, Thread
+from uuid import uuid4
+from six import PY2, reraise, string_types
+from six.moves import shlex_quote
+from six.moves.queue import Queue
+
+try:
+    from shutil import which
+except ImportError:
+    from distutils.spawn import find_executable as which
+
+from .instrumentation import Instrumentation
+
+
+# Any of these characters means the command needs the shell to interpret it:
+# pipes, redirects, command lists, substitutions, expansions, globs, escapes
+# and comments
+SHELL_SYNTAX = re.compile(r'[|&;<>()$`\\*?\[\]#~{}!\n]')
+
+# Words that are only meaningful to the shell itself, as reserved words or
+# builtins that change the state of the shell
+SHELL_WORDS = frozenset([
+    '.', ':', 'alias', 'bg', 'break', 'builtin', 'case', 'cd', 'command', 'continue',
+    'do', 'done', 'elif', 'else', 'esac', 'eval', 'exec', 'exit', 'export', 'fc',
+    'fg', 'fi', 'for', 'function', 'getopts', 'hash', 'if', 'jobs', 'local', 'read',
+    'readonly', 'return', 'select', 'set', 'shift', 'source', 'then', 'time', 'times',
+    'trap', 'type', 'ulimit', 'umask', 'unalias', 'unset', 'until', 'wait', 'while',
+])
+
+
+def program_arguments(command):
+    """Works out how to run a command. Lists are run directly. Strings are split
+    into a list and run directly as well when they are plain enough that the
+    shell would do nothing but split them into words and look up the program.
+    Everything else, including commands whose program cannot be found, goes
+    through the shell so that it behaves exactly as before.
+
+    :param command: the command as a string or a list of arguments
+    :return: tuple of the arguments to run and whether to run them with the shell
+    """
+    if not isinstance(command, string_types):
+        return list(command), False
+
+    if SHELL_SYNTAX.search(command):
+        return command, True
+
+    try:
+        argv = shlex.split(command)
+    except ValueError:
+        return command, True
+
+    if not argv or argv[0] in SHELL_WORDS or '=' in argv[0] or not which(argv[0]):
+        return command, True
+
+    return argv, False
+
+
+def display_command(command):
+    """Renders a command as it would be typed into a shell"""
+    if isinstance(command, string_types):
+        return command
+
+    return ' '.join(shlex_quote(argument) for argument in command)
+
+
+def text_output(stream):
+    """Reads the output of a command as text in the preferred encoding, like
+    universal_newlines does, except that bytes that are not valid in the
+    encoding are replaced rather than failing the read. Output is already text
+    on Python 2.
+
+    :param stream: the binary stream of the output
+    :return: a text stream
+    """
+    if PY2:
+        return stream
+
+    return io.TextIOWrapper(stream, encoding=getpreferredencoding(False), errors='replace')
+
+
+def decode_output(data):
+    """Decodes the captured output of a command the way text_output reads it.
+
+    :param data: the output as bytes
+    :return: the output as text
+    """
+    if PY2:
+        return data
+
+    return text_output(io.BytesIO(data)).read()
 
 
 class CommandFailedException(Exception):
     def __init__(self, status, command):
+        self.status = status
+        self.command = command
+
         message = self._failure_message(status, command)
         super(CommandFailedException, self).__init__(message)
 
+    def __reduce__(self):
+        # Allows the exception to be sent back from worker processes
+        return type(self), (self.status, self.command)
+
     def _failure_message(self, status, command):
         program = command.split(' ')[0]
         return "Command failed with status (%d): [%s...]" % (status, program)
 
 
+class CommandsFailedException(CommandFailedException):
+    """Raised by ShellWrapper.map when any of the commands fail. The failures
+    are kept as a list of (item, CommandFailedException) pairs in input order.
+    """
+    def __init__(self, failures, total):
+        self.failures = failures
+        self.total = total
+
+        _, first = failures[0]
+        super(CommandsFailedException, self).__init__(first.status, first.command)
+
+    def __reduce__(self):
+        return type(self), (self.failures, self.total)
+
+    def _failure_message(self, status, command):
+        lines = ['%d of %d commands failed:' % (len(self.failures), self.total)]
+        for item, failure in self.failures:
+            lines.append('  %s: %s' % (item, failure))
+
+        return '\n'.join(lines)
+
+
+class CommandResult(object):
+    """The outcome of a command whose output was captured"""
+    def __init__(self, status, stdout, stderr):
+        self.status = status
+        self.stdout = stdout
+        self.stderr = stderr
+
+    def __repr__(self):
+        return '<CommandResult: %d>' % self.status
+
+
+class ShellSession(object):
+    """A long lived shell that commands are sent to over a pipe, which saves
+    starting a new shell for every command. The shell reads the pipe as its
+    script, so commands keep the original stdin, stdout and stderr. After each
+    command the shell writes a line with a unique sentinel and the exit status
+    to a separate pipe, which is how the status is read back.
+
+    The pipes are named by their /dev/fd paths, since shells such as dash only
+    redirect descriptors below 10.
+
+    Since the commands share a shell, changes to the working directory and
+    shell variables carry over from one command to the next.
+    """
+    def __init__(self, options=None):
+        self.options = options or {}
+
+        self._process = None
+
+    def run(self, command):
+        """Runs a command in the shell, starting the shell if needed.
+
+        :param command: the command to run as a string
+        :return: the exit status of the command
+        """
+        if not self._process:
+            self._start()
+
+        sentinel = uuid4().hex
+        script = '{ %s\n}\nprintf "%s %%d\\n" "$?" >/dev/fd/%d\n' % (
+            command, sentinel, self._status_write)
+
+        try:
+            self._script.write(script)
+            self._script.flush()
+        except (IOError, OSError):
+            return self._restart()
+
+        for line in iter(self._status.readline, ''):
+            token, _, status = line.strip().partition(' ')
+            if token == sentinel:
+                return int(status)
+
+        # The shell exited before reporting a status, e.g. the command called
+        # `exit` or had a syntax error. The next command gets a new shell.
+        return self._restart()
+
+    def close(self):
+        if not self._process:
+            return
+
+        self._script.close()
+        self._process.wait()
+        self._status.close()
+        self._process = None
+
+    def _start(self):
+        script_read, script_write = os.pipe()
+        status_read, self._status_write = os.pipe()
+
+        options = dict(self.options)
+        if not PY2:
+            options['pass_fds'] = (script_read, self._status_write) + tuple(options.get('pass_fds', ()))
+
+        self._process = Popen(['/bin/sh', '/dev/fd/%d' % script_read], **options)
+
+        os.close(script_read)
+        os.close(self._status_write)
+        self._script = os.fdopen(script_write, 'w')
+        self._status = os.fdopen(status_read)
+
+    def _restart(self):
+        try:
+            self._script.close()
+        except (IOError, OSError):
+            # The shell is gone, along with what was left to write to it
+            pass
+
+        status = self._process.wait()
+        self._status.close()
+        self._process = None
+
+        return status
+
+
 class ShellWrapper(object):
-    def __init__(self, logger):
+    def __init__(self, logger, instrumentation=None):
         self.logger = logger
+        self.instrumentation = instrumentation or Instrumentation()
+
+        # The jobserver that commands share a budget of jobs with, if any
+        self.jobserver = None
 
-    def execute(self, command, silent=False):
+        # Each thread has its own session so that tasks running at the same
+        # time never share a shell
+        self._local = local()
+
+    def __call__(self, command, silent=False, capture=False):
+        return self.execute(command, silent=silent, capture=capture)
+
+    def execute(self, command, silent=False, capture=False):
         """Executes a command using the user's shell. A nonzero exit status will raise an exception unless
         silent is specified.
 
-        :param command: the command to run as a string
+        Commands without any shell syntax are run directly, without starting a shell, unless a
+        session is active.
+
+        :param command: the command to run as a string, or a list of arguments to run
+                        the program directly
         :param silent: if false, will raise if the command fails
+        :param capture: if true, the output of the command is captured instead of being
+                        written to the terminal
 
-        :return: the exit status of the command
+        :return: the exit status of the command, or a CommandResult with the exit status
+                 and output if capture is specified
+        """
+        self.logger.info(display_command(command))
+
+        with self.instrumentation.command(display_command(command)) as outcome:
+            status, stdout, stderr = self._run(command, capture)
+            outcome.status = status
+
+        return self._finish(command, status, silent, capture, stdout, stderr)
+
+    @contextmanager
+    def session(self):
+        """Runs every command on the current thread in one long lived shell for the duration
+        of the context, instead of starting a shell per command. Commands with captured or
+        streamed output still run in their own shell. Changes to the working directory and
+        shell variables carry over between commands in a session.
+
+        Sessions do not nest, entering a session while one is active reuses it.
+        """
+        if getattr(self._local, 'session', None):
+            yield self._local.session
+            return
+
+        self._local.session = ShellSession(self._process_options())
+        try:
+            yield self._local.session
+        finally:
+            self._local.session.close()
+            self._local.session = None
+
+    def execute_async(self, command, silent=False, capture=False):
+        """Returns a coroutine that executes a command using the user's shell without blocking
+        the event loop, so that many commands can run at the same time from a single task. It
+        otherwise behaves the same as execute. Needs Python 3.5 or later.
+
+        :param command: the command to run as a string or a list of arguments
+        :param silent: if false, will raise if the command fails
+        :param capture: if true, the output of the command is captured instead of being
+                        written to the terminal
+
+        :return: a coroutine resolving to what execute would return
+        """
+        # Imported here since asyncio is slow to import and most Snakefiles have
+        # no use for it
+        try:
+            from .aio import run_command
+        except (ImportError, SyntaxError):
+            raise RuntimeError("Running commands asynchronously needs Python 3.5 or later")
+
+        self.logger.info(display_command(command))
+
+        args, shell = program_arguments(command)
+        # The command is reported once the coroutine runs, perhaps in a context
+        # that no longer knows which task it belongs to
+        instrumented = self.instrumentation.command(display_command(command), self.instrumentation.current_task)
+        return run_command(self, command, args, shell, instrumented, silent=silent, capture=capture)
+
+    def map(self, template, items, jobs=None, keep_going=False, silent=False, capture=False,
+            callback=None):
+        """Runs a command once for each item, several at a time, like xargs. The template is
+        formatted with each item using %%, and items are quoted for the shell first. A template
+        given as a list of arguments has each argument formatted with the item instead.
+
+        By default no new commands are started once one has failed. With keep_going or silent,
+        every command is run regardless. Unless silent is specified, the commands that failed
+        are reported together in a single CommandsFailedException once the running commands
+        have finished.
+
+        :param template: the command to run, e.g. 'pylint %s'
+        :param items: the items to run the command for
+        :param jobs: the number of commands to run at a time, the number of CPUs by default
+        :param keep_going: if true, keep starting commands after one has failed
+        :param silent: if true, failed commands do not raise
+        :param capture: if true, the output of each command is captured
+        :param callback: function called with each item and its result as soon as its command
+                         finishes, on the calling thread
+
+        :return: list of the results of each command in the same order as the items, as
+                 execute would return them
+        """
+        items = list(items)
+        commands = [self._expand_template(template, item) for item in items]
+
+        work, finished = Queue(), Queue()
+        task = self.instrumentation.current_task
+        workers = [Thread(target=self._map_worker, args=(work, finished, capture, task),
+                          name='snake-map-%d' % (number + 1))
+                   for number in range(min(jobs or cpu_count(), len(items)))]
+
+        for worker in workers:
+            worker.start()
+
+        results = [None] * len(items)
+        failures = []
+        pending = iter(enumerate(commands))
+        running = 0
+        try:
+            for index, command in islice(pending, len(workers)):
+                work.put((index, command))
+                running += 1
+
+            while running:
+                index, result, error = finished.get()
+                running -= 1
+
+                if error:
+                    reraise(*error)
+
+                results[index] = result
+                if callback:
+                    callback(items[index], result)
+
+                status = result.status if capture else result
+                if status != 0:
+                    failures.append(index)
+                    if not (keep_going or silent):
+                        pending = iter([])
+
+                for index, command in islice(pending, 1):
+                    work.put((index, command))
+                    running += 1
+        finally:
+            for _ in workers:
+                work.put(None)
+
+            for worker in workers:
+                worker.join()
+
+        if failures and not silent:
+            errors = []
+            for index in sorted(failures):
+                status = results[index].status if capture else results[index]
+                errors.append((items[index], CommandFailedException(status, display_command(commands[index]))))
+
+            raise CommandsFailedException(errors, len(items))
+
+        return results
+
+    def stream(self, command, silent=False):
+        """Executes a command using the user's shell and yields the lines it writes to stdout as
+        they are read, without trailing newlines. The output is never held in memory all at once.
+        A nonzero exit status will raise an exception once the output is exhausted unless silent
+        is specified. The command is stopped if the generator is closed early.
+
+        :param command: the command to run as a string or a list of arguments
+        :param silent: if false, will raise if the command fails
+
+        :return: generator of output lines
         """
-        self.logger.info(command)
-        exit_status = call(command, shell=True)
+        self.logger.info(display_command(command))
+
+        with self.instrumentation.command(display_command(command)) as outcome:
+            args, shell = program_arguments(command)
+            process = self._popen(args, shell, stdout=PIPE, universal_newlines=PY2)
+            if not process:
+                outcome.status = 127
+            else:
+                try:
+                    for line in iter(text_output(process.stdout).readline, ''):
+                        yield line.rstrip('\n')
+                finally:
+                    process.stdout.close()
+                    if process.poll() is None:
+                        process.terminate()
+
+                    outcome.status = process.wait()
+
+        self._finish(command, outcome.status, silent, False)
+
+    def _map_worker(self, work, finished, capture, task):
+        with self.instrumentation.on_behalf_of(task):
+            self._map_commands(work, finished, capture)
+
+    def _map_commands(self, work, finished, capture):
+        while True:
+            job = work.get()
+            if job is None:
+                return
+
+            index, command = job
+            try:
+                finished.put((index, self.execute(command, silent=True, capture=capture), None))
+            except Exception:
+                finished.put((index, None, sys.exc_info()))
+
+    def _expand_template(self, template, item):
+        if isinstance(template, string_types):
+            return template % shlex_quote('%s' % (item,))
+
+        return [argument % (item,) if '%' in argument else argument for argument in template]
+
+    def _run(self, command, capture):
+        """Runs a command in the most direct way available.
+
+        :return: tuple of the exit status, stdout and stderr, where the output is
+                 None unless it was captured
+        """
+        args, shell = program_arguments(command)
+
+        if capture:
+            process = self._popen(args, shell, stdout=PIPE, stderr=PIPE, universal_newlines=PY2)
+            if not process:
+                return 127, '', ''
+
+            stdout, stderr = process.communicate()
+            return process.returncode, decode_output(stdout), decode_output(stderr)
+
+        # Commands in a session always go to its shell since they may depend on
+        # the working directory or variables set by earlier commands
+        session = getattr(self._local, 'session', None)
+        if session:
+            return session.run(display_command(command)), None, None
+
+        return self._call(args, shell), None, None
+
+    def _call(self, args, shell):
+        try:
+            return call(args, shell=shell, **self._process_options())
+        except OSError as e:
+            self._report_missing_program(e, args, shell)
+            return 127
+
+    def _popen(self, args, shell, **options):
+        """Starts a process.
+
+        :return: the process, or None if the program could not be found
+        """
+        try:
+            return Popen(args, shell=shell, **self._process_options(options))
+        except OSError as e:
+            self._report_missing_program(e, args, shell)
+            return None
+
+    def _process_options(self, options=None):
+        """The options to start a command with, which let it share the jobserver"""
+        if not self.jobserver:
+            return options or {}
+
+        return self.jobserver.process_options(options)
+
+    def _report_missing_program(self, e, args, shell):
+        # Programs that are run directly but cannot be found are reported the
+        # way the shell would report them
+        if shell or e.errno != ENOENT:
+            raise e
+
+        sys.stderr.write('sh: 1: %s: not found\n' % args[0])
+
+    def _finish(self, command, exit_status, silent, capture, stdout=None, stderr=None):
         if exit_status != 0 and not silent:
-            raise CommandFailedException(exit_status, command)
+            raise CommandFailedException(exit_status, display_command(command))
+
+        if capture:
+            return CommandResult(exit_status, stdout, stderr)
 
         return exit_status
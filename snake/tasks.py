@@ -1,23 +1,156 @@
-import re
-from collections import deque
-from inspect import getargspec
-from six import iteritems, iterkeys, itervalues, PY2
-
+from collections import OrderedDict
+from os import path
+from threading import Lock
+from time import localtime, strftime
+from six import iteritems, itervalues
+
+try:
+    from inspect import signature, Parameter
+except ImportError:
+    from funcsigs import signature, Parameter
+
+from .cache import expand
 from .dependencies import DependencyGraph
+from .instrumentation import Instrumentation
+from .jobserver import JobSlots
+from .rules import Rule
+from .scheduler import Scheduler
+
+try:
+    from inspect import iscoroutine
+except ImportError:
+    # Coroutines need Python 3.5 or later
+    iscoroutine = lambda value: False
+
+# How tasks can be run. Threads suit tasks that mostly run commands, while
+# processes suit CPU bound tasks written in Python.
+JOBS_MODES = ('thread', 'process')
+
+# How many rules can be chained together to build a single file before giving
+# up. This stops rules whose sources match their own pattern from recursing.
+MAX_RULE_DEPTH = 16
 
 
 class NoSuchTaskException(Exception):
     pass
 
 
+class NoSuchResultException(Exception):
+    pass
+
+
+class TasksFailedException(Exception):
+    """Raised when tasks fail while keeping going. The failures are kept as a
+    list of (chain, exc_info) pairs in the order the tasks failed, where the chain
+    is the labels leading from a requested task to the one that failed. The tasks
+    that did not run because they require a failed task are kept in skipped.
+    """
+    def __init__(self, failures, skipped, total):
+        self.failures = failures
+        self.skipped = skipped
+        self.total = total
+
+        message = '%d of %d tasks failed' % (len(failures), total)
+        if skipped:
+            message += ', %d did not run since they require a failed task' % len(skipped)
+
+        super(TasksFailedException, self).__init__(message)
+
+
+def result_parameter(label):
+    """The name of the parameter that receives the result of a required task"""
+    return label.replace(':', '_')
+
+
+class TaskSignature(object):
+    """The arguments that a task function accepts. This is worked out once when
+    the task is defined so that executing and listing tasks does not need to
+    reflect on the function again.
+    """
+    __slots__ = ('required', 'optional', 'names', 'accepts_kwargs')
+
+    def __init__(self, required, optional, accepts_kwargs):
+        self.required = required
+        self.optional = optional
+        self.names = frozenset(required).union(optional)
+        self.accepts_kwargs = accepts_kwargs
+
+    @classmethod
+    def of(cls, func):
+        """Reflects on a function to find the arguments it can be called with
+        by keyword. Variable positional arguments are ignored.
+
+        :param func: the function to reflect on
+        :return: the task signature of the function
+        """
+        required = []
+        optional = OrderedDict()
+        accepts_kwargs = False
+
+        for parameter in itervalues(signature(func).parameters):
+            if parameter.kind == Parameter.VAR_KEYWORD:
+                accepts_kwargs = True
+            elif parameter.kind in (Parameter.POSITIONAL_OR_KEYWORD, Parameter.KEYWORD_ONLY):
+                if parameter.default is Parameter.empty:
+                    required.append(parameter.name)
+                else:
+                    optional[parameter.name] = parameter.default
+
+        return cls(required, optional, accepts_kwargs)
+
+    def arguments(self, kwargs):
+        """Selects the keyword arguments that the function can be called with.
+
+        :param kwargs: all of the keyword arguments supplied
+        :return: dict of the keyword arguments the function accepts
+        """
+        if self.accepts_kwargs:
+            return dict(kwargs)
+
+        return dict((name, kwargs[name]) for name in self.names.intersection(kwargs))
+
+    def missing(self, kwargs):
+        """Returns the names of the required arguments that were not supplied."""
+        return [name for name in self.required if name not in kwargs]
+
+
 class Task(object):
     """A task is the basic building block in a Snakefile manifest. Each task
     has an underlying function and a short description about what the task does.
+
+    A task can also declare the input files, output files and environment
+    variables that its result depends on, which allows the result to be cached.
+    An isolated task is run in a separate worker process.
+
+    Parameters named after the tasks that a task requires receive the values
+    that those tasks returned.
     """
-    def __init__(self, label, func, description):
+    def __init__(self, label, func, description, inputs=None, outputs=None, env=None,
+                 isolated=False, requires=None, signature=None):
         self.label = label
         self.func = func
         self.description = description
+        self.inputs = inputs or []
+        self.outputs = outputs or []
+        self.env = env or []
+        self.isolated = isolated
+        self.requires = requires or []
+        self.signature = signature or TaskSignature.of(func)
+
+    @property
+    def result_parameters(self):
+        """The parameters of the function that receive the results of required tasks.
+
+        :return: dict of parameter names to the labels of the tasks
+        """
+        parameters = dict((result_parameter(label), label) for label in self.requires)
+        return dict((name, label) for name, label in iteritems(parameters)
+                    if name in self.signature.names)
+
+    @property
+    def cacheable(self):
+        """Whether the task declares enough about itself for its result to be cached"""
+        return bool(self.inputs or self.outputs)
 
     def execute(self, **kwargs):
         """Executes the underlying function in the task.
@@ -25,84 +158,111 @@ class Task(object):
         :param kwargs: the keyword arguments to pass to the function during
                        execution. Keywords that are not needed by the underlying
                        function will be ignored.
+        :return: the value returned by the function, which is a coroutine for
+                 functions defined with `async def`
         """
-        try:
-            self.func(**self._sanitize_keyword_args(kwargs))
-        except TypeError as e:
-            if self._is_error_due_to_missing_arguments(e):
-                args = ', '.join(self.required_args())
-                raise TypeError("%s requires argument(s): %s" % (self.label, args))
-            else:
-                raise
+        arguments = self.arguments(kwargs)
+        if self.signature.missing(arguments):
+            args = ', '.join(self.required_args())
+            raise TypeError("%s requires argument(s): %s" % (self.label, args))
+
+        return self.func(**arguments)
+
+    def arguments(self, kwargs):
+        """Returns the keyword arguments that the underlying function will be
+        called with.
+
+        :param kwargs: all of the keyword arguments supplied to the task
+        :return: dict of only the keyword arguments the function knows about
+        """
+        return self.signature.arguments(kwargs)
 
     def required_args(self):
         """Returns the list of required arguments for the task.
 
         :return: list of required arg names as strings
         """
-        positional_args, _ = self._positional_and_keyword_args()
-        return positional_args
+        injected = self.result_parameters
+        return [name for name in self.signature.required if name not in injected]
 
     def optional_args(self):
         """Returns the list of optional arguments for the task.
 
         :return: list of optional arg names as strings
         """
-        _, keyword_args = self._positional_and_keyword_args()
-        return keyword_args
-
-    def _all_args(self):
-        positional_args, keyword_args = self._positional_and_keyword_args()
-        return positional_args + list(iterkeys(keyword_args))
+        injected = self.result_parameters
+        return OrderedDict((name, default) for name, default in iteritems(self.signature.optional)
+                           if name not in injected)
 
-    def _positional_and_keyword_args(self):
-        args, _, _, defaults = getargspec(self.func)
-        if not defaults:
-            defaults = ()
 
-        number_of_positional_args = len(args) - len(defaults)
-        positional_args = args[:number_of_positional_args]
+class FileTask(Task):
+    """A file task is a task that builds a file. The label of the task is the
+    path of the file it builds. The task only needs to run when the file does not
+    exist or when one of the files it is built from has changed since.
+    """
+    def __init__(self, label, func, description, sources, requires=None, signature=None):
+        super(FileTask, self).__init__(label, func, description, requires=requires,
+                                       signature=signature)
+        self.sources = sources
 
-        keywords = args[number_of_positional_args:]
-        keyword_args = dict(zip(keywords, defaults))
+    @property
+    def target(self):
+        return self.label
 
-        return positional_args, keyword_args
+    def is_up_to_date(self, prerequisites):
+        """Checks whether the target is newer than all of the files it is built from.
 
-    def _sanitize_keyword_args(self, kwargs):
-        only_known_keywords = lambda kv: kv[0] in self._all_args()
-        return dict(filter(only_known_keywords, iteritems(kwargs)))
+        :param prerequisites: list of paths of the files that the target depends on
+        :return: true if the target exists and none of the prerequisites is newer
+        """
+        if not path.exists(self.target):
+            return False
 
-    def _is_error_due_to_missing_arguments(self, e):
-        # A bit of a hack, but we want to do this to make the error more specific
-        # and easy to understand for the end user
-        func = self.func.__name__
+        modified = path.getmtime(self.target)
+        return all(path.getmtime(prerequisite) <= modified
+                   for prerequisite in prerequisites if path.exists(prerequisite))
 
-        # This error message seems to have been changed in Python 3.2
-        if PY2:
-            pattern = r'%s\(\) takes exactly \d{1,2} .*arguments? \(\d{1,2} given\)' % func
-        else:
-            pattern = r'%s\(\) missing \d{1,2} required positional argument:' % func
 
-        return re.search(pattern, str(e))
+class RuleTask(FileTask):
+    """A file task created from a rule. The underlying function is called with
+    the target path followed by the paths of the sources.
+    """
+    def execute(self, **kwargs):
+        return self.func(self.target, *self.sources)
 
 
 class TaskRegistry(object):
     def __init__(self, name):
         self.name = name
         self.default = None
+        self.jobs = 1
+        self.jobs_mode = 'thread'
+        self.cache = None
+        self.processes = None
+        self.jobserver = None
+        self.keep_going = False
+        self.instrumentation = Instrumentation()
 
         self._tasks = {}
+        self._rules = []
         self._dependencies = DependencyGraph()
 
+        # The event loop that runs the tasks defined with `async def`. It is
+        # only started once such a task runs.
+        self._event_loop = None
+        self._event_loop_lock = Lock()
+
         # Keeps a stack of namespace strings to handle nested namespaces.
         # The array is usually empty except when in the middle of evaluating
         # the contents of a namespace
         self.__working_namespace = []
 
-        # A deque that lives for the duration of task execution. It is used
-        # for determining the task chain that was execution if an exception is
-        # raised.
-        self.__execution_context = deque()
+        # The chain of tasks leading from the requested task to the task that
+        # raised. It is used for reporting where a failure happened.
+        self.__execution_context = []
+
+        # The values returned by the tasks that have run during the current run
+        self._results = {}
 
     def __setattr__(self, name, value):
         if name == 'default':
@@ -111,18 +271,39 @@ class TaskRegistry(object):
                     "The default task must be a string that "
                     "references the name of the task to run")
 
+        if name == 'jobs':
+            if not isinstance(value, int) or value < 1:
+                raise AssertionError("The number of jobs must be a positive integer")
+
+        if name == 'jobs_mode':
+            if value not in JOBS_MODES:
+                raise AssertionError("The jobs mode must be one of: %s" % ', '.join(JOBS_MODES))
+
         super(TaskRegistry, self).__setattr__(name, value)
 
-    def add_task(self, func=None, requires=None):
+    def add_task(self, func=None, requires=None, inputs=None, outputs=None, env=None,
+                 isolated=False):
         """Defines a task by registering it. The function name is used as the task
         label and the function's docstring is used as the task description.
 
+        A task that declares inputs or outputs is cached. When the contents of its
+        inputs, the values of its environment variables and its arguments match a
+        previous run, the task is skipped and its outputs are restored.
+
+        An isolated task runs in a pool of worker processes instead of a thread, so
+        that CPU bound tasks can run in parallel. Its arguments and the value it
+        returns must be picklable.
+
         :param func: the function to use as the task. Do not use this parameter
                      directly. It is only here to avoid having to use `@task`
                      with parenthesis when there are no other arguments to the
                      decorator.
         :param requires: a list of required tasks where each entry in the list is
                          a string task label
+        :param inputs: a list of paths or glob patterns of the files the task reads
+        :param outputs: a list of paths or glob patterns of the files the task writes
+        :param env: a list of names of environment variables the task depends on
+        :param isolated: whether to run the task in a worker process
         :return: the function unmodified
         """
         if func:
@@ -131,11 +312,55 @@ class TaskRegistry(object):
 
         else:
             def wrapper(f):
-                self._add_task(f, requires or [])
+                self._add_task(f, requires or [], inputs=inputs, outputs=outputs, env=env,
+                               isolated=isolated)
                 return f
 
             return wrapper
 
+    def add_file_task(self, target, sources=None, requires=None):
+        """Defines a file task by registering it. The target path is used as the
+        task label and the function's docstring is used as the task description.
+        The task is skipped when the target exists and is newer than all of its
+        sources and the targets of any required file tasks.
+
+        Sources that are the target of another file task are built first.
+        Sources that are plain files must exist when the task runs.
+
+        :param target: the path of the file that the task builds
+        :param sources: a list of paths of the files the target is built from
+        :param requires: a list of required tasks where each entry in the list is
+                         a string task label
+        :return: the function unmodified
+        """
+        def wrapper(f):
+            self._add_file_task(target, f, sources or [], requires or [])
+            return f
+
+        return wrapper
+
+    def add_rule(self, pattern, sources=None, requires=None):
+        """Defines a rule for building files whose paths match a pattern. When a
+        task is needed that has not been defined and whose label matches the
+        pattern, a file task is created for it from the rule. Rules are tried in
+        the order they were defined and only apply when all of their sources
+        exist or can be built.
+
+        :param pattern: a string where `%` matches any part of a path, or a
+                        compiled regular expression
+        :param sources: a list of source paths where `%` is replaced with the
+                        matched part of the path, or functions that are called
+                        with the target path
+        :param requires: a list of required tasks where each entry in the list is
+                         a string task label
+        :return: the function unmodified
+        """
+        def wrapper(f):
+            self._rules.append(Rule(pattern, sources or [], f, self._description(f), requires))
+            return f
+
+        return wrapper
+
     def add_namespace(self, f):
         """Defines a namespace for tasks. The name of the namespace will be the
         name of the function. This is useful for semantically grouping tasks
@@ -154,62 +379,331 @@ class TaskRegistry(object):
 
     @property
     def execution_context(self):
-        return reversed(self.__execution_context)
+        return iter(self.__execution_context)
 
-    def execute(self, _label, **kwargs):
-        """Executes a number of tasks in order. The tasks are referenced by
-        their names. Executes the default task if no tasks are supplied.
+    def execute(self, *_labels, **kwargs):
+        """Executes a number of tasks along with their dependencies. The tasks are
+        referenced by their names. Executes the default task if no tasks are
+        supplied. The dependencies of all the tasks are merged into one plan so
+        that each task runs at most once. Up to `jobs` independent tasks are
+        run at the same time.
 
-        :param tasks: list of task labels
+        :param _labels: the task labels, in the order they were requested
         :param kwargs: the keyword arguments to pass to each task
         """
-        if not _label:
-            if not self.default:
-                raise NoSuchTaskException('default')
+        _labels = self._requested(_labels)
+
+        self._results = {}
+        self._execute_plan(_labels, self._dependencies.resolve_all(_labels), kwargs)
 
-            _label = self.default
+    def execute_affected(self, _labels, _changed, **kwargs):
+        """Executes the tasks that are affected by changes, out of a number of tasks
+        and their dependencies. A task is affected when it changed itself or when it
+        requires a task that changed, directly or not. Tasks that did not finish
+        during the previous execution run again too. The results of the others are
+        kept from the previous execution.
 
-        dependencies = self._dependencies.resolve(_label)
-        self.__execution_context = deque(dependencies)
+        :param _labels: the task labels, in the order they were requested
+        :param _changed: the labels of the tasks and files that changed
+        :param kwargs: the keyword arguments to pass to each task
+        """
+        _labels = self._requested(_labels)
 
-        for dependency in dependencies:
-            self._execute_task(dependency, **kwargs)
-            self.__execution_context.popleft()
+        affected = self._dependencies.dependents(_changed)
+        plan = [label for label in self._dependencies.resolve_all(_labels)
+                if label in affected or label not in self._results]
+        self._execute_plan(_labels, plan, kwargs)
 
-    def view_all(self):
+    def plan(self, *_labels):
+        """Lists the tasks that executing a number of tasks would run, without
+        running them.
+
+        :param _labels: the task labels, or none for the default task
+        :return: list of task labels, in the order they run in with one job
+        """
+        _labels = self._requested(_labels)
+        return [label for label in self._dependencies.resolve_all(_labels) if label in self._tasks]
+
+    def input_files(self, *_labels):
+        """Finds the files that a number of tasks and their dependencies read. These
+        are the inputs that tasks declare, and the files that are required without
+        being built by a task.
+
+        :param _labels: the task labels, or none for the default task
+        :return: dict of the paths of the files to the labels of the tasks or files
+                 that change when the files do
+        """
+        _labels = self._requested(_labels)
+
+        files = {}
+        for label in self._dependencies.resolve_all(_labels):
+            task = self._tasks.get(label)
+            if not task:
+                files[label] = label
+                continue
+
+            for filename in expand(task.inputs):
+                files[filename] = label
+
+        return files
+
+    def clear(self):
+        """Forgets every task, rule and result, so that the manifest can be loaded
+        again. Options such as the number of jobs are kept.
+        """
+        self.default = None
+
+        self._tasks = {}
+        self._rules = []
+        self._dependencies = DependencyGraph()
+        self._results = {}
+
+    def result(self, label):
+        """Returns the value that a task returned during the current run. Tasks that
+        were skipped since they were up to date have a result of None.
+
+        :param label: the label of the task
+        :raises NoSuchResultException: if the task has not run yet
+        :return: the value returned by the task
+        """
+        if label not in self._results:
+            raise NoSuchResultException("No result for task that has not run: %s" % label)
+
+        return self._results[label]
+
+    def run(self, _label, _results=None, **kwargs):
+        """Runs a single task, without its dependencies and regardless of whether
+        it is up to date. This is how worker processes run tasks.
+
+        :param _label: the label of the task
+        :param _results: the results of the tasks it requires, by label, which
+                         replace the results of the current run
+        :param kwargs: the keyword arguments to pass to the task
+        :return: the value returned by the task
+        """
+        task = self._tasks.get(_label) or self._task_from_rules(_label)
+        if not task:
+            raise NoSuchTaskException(_label)
+
+        if _results is not None:
+            self._results = dict(_results)
+
+        return self._run_task(task, **kwargs)
+
+    def tasks(self):
+        """Returns every task that has been defined.
+
+        :return: list of tasks
+        """
+        return list(itervalues(self._tasks))
+
+    def view_all(self, tasks=None, history=None):
         """Formats the tasks using each task's label and description.
 
+        :param tasks: the tasks to format instead of the ones that are defined
+        :param history: the task history to show when each task last ran from
         :return: string formatted as a table of tasks
         """
-        tasks = [task for task in itervalues(self._tasks)]
-        return TaskListFormatter(tasks).tableize(self.name)
+        if tasks is None:
+            tasks = self.tasks()
 
-    def _execute_task(self, _label, **kwargs):
+        return TaskListFormatter(tasks, history).tableize(self.name)
+
+    def _requested(self, labels):
+        labels = [label for label in labels if label]
+        if not labels:
+            if not self.default:
+                raise NoSuchTaskException('default')
+
+            labels = [self.default]
+
+        if self._rules:
+            self._define_tasks_from_rules(labels)
+
+        # Existing files only stand in for prerequisites, a task that is asked
+        # for by name has to be defined
+        for label in labels:
+            if label not in self._tasks:
+                raise NoSuchTaskException(label)
+
+        return labels
+
+    def _execute_plan(self, labels, plan, kwargs):
+        self.__execution_context = []
+
+        scheduler = Scheduler(self._dependencies, self.jobs, self._slots(), self.keep_going)
         try:
-            task = self._tasks[_label]
-        except KeyError:
+            scheduler.run(plan, lambda label: self._execute_task(label, **kwargs))
+        except Exception:
+            if scheduler.failed:
+                self.__execution_context = self._failure_chain(labels, scheduler.failed)
+            raise
+        finally:
+            if self.processes:
+                self.processes.close()
+
+        if scheduler.failures:
+            self.__execution_context = self._failure_chain(labels, scheduler.failed)
+            failures = [(self._failure_chain(labels, label), error) for label, error in scheduler.failures]
+            raise TasksFailedException(failures, scheduler.skipped, len(plan))
+
+    def _slots(self):
+        if self.jobserver:
+            return JobSlots(self.jobserver)
+
+    def _failure_chain(self, labels, failed):
+        for label in labels:
+            chain = self._dependencies.chain(label, failed)
+            if chain:
+                return chain
+
+        return [failed]
+
+    def _define_tasks_from_rules(self, labels):
+        # Walks everything reachable from the requested labels so that tasks are
+        # only created from rules for the files that are actually needed
+        pending = list(labels)
+        visited = set()
+        while pending:
+            label = pending.pop()
+            if label in visited:
+                continue
+
+            visited.add(label)
+            self._task_from_rules(label)
+            pending.extend(self._dependencies.dependencies(label))
+
+    def _task_from_rules(self, label, depth=0):
+        """Creates a task for the label from the first rule that can build it,
+        unless a task is already defined.
+
+        :return: the task, or None if no task exists and no rule applies
+        """
+        if label in self._tasks:
+            return self._tasks[label]
+
+        if depth >= MAX_RULE_DEPTH:
+            return None
+
+        for rule in self._rules:
+            sources = rule.match(label)
+            if sources is None:
+                continue
+
+            buildable = lambda source: (path.exists(source) or
+                                        self._task_from_rules(source, depth + 1))
+            if all(buildable(source) for source in sources):
+                self._dependencies.add(label, sources + rule.requires)
+                self._tasks[label] = RuleTask(label, rule.func, rule.description, sources)
+                return self._tasks[label]
+
+        return None
+
+    def _execute_task(self, _label, **kwargs):
+        task = self._tasks.get(_label)
+        if not task and self._rules:
+            task = self._task_from_rules(_label)
+
+        if not task:
+            # Like rake, a file that already exists is a valid prerequisite
+            # that has nothing left to build (requested labels are checked
+            # before anything runs)
+            if path.exists(_label):
+                return
+
             raise NoSuchTaskException(_label)
 
-        task.execute(**kwargs)
+        if self._is_up_to_date(task):
+            self._results[task.label] = None
+            return
+
+        # Arguments given on the command line take precedence over results
+        arguments = dict((name, self._results.get(label))
+                         for name, label in iteritems(task.result_parameters))
+        arguments.update(kwargs)
+
+        with self.instrumentation.task(task.label, task.arguments(arguments)):
+            if self.cache and task.cacheable:
+                result = self._execute_cached_task(task, **arguments)
+            else:
+                result = self._run_task(task, **arguments)
+
+        self._results[task.label] = result
 
-    def _add_task(self, f, deps):
+    def _execute_cached_task(self, task, **kwargs):
+        fingerprint = self.cache.fingerprint(task, task.arguments(kwargs))
+        cached = self.cache.restore(fingerprint)
+        if cached:
+            return cached.result
+
+        result = self._run_task(task, **kwargs)
+        self.cache.store(fingerprint, task.outputs, result)
+        return result
+
+    def _run_task(self, task, **kwargs):
+        if self.processes and (task.isolated or self.jobs_mode == 'process'):
+            # The task can only ask for results the worker is sent along with it
+            results = dict((label, self._results[label])
+                           for label in self._dependencies.dependencies(task.label)
+                           if label in self._results)
+            return self.processes.run(task.label, kwargs, results)
+
+        result = task.execute(**kwargs)
+        if iscoroutine(result):
+            from .aio import on_behalf_of
+            result = self._get_event_loop().run(on_behalf_of(self.instrumentation, task.label, result))
+
+        return result
+
+    def _get_event_loop(self):
+        with self._event_loop_lock:
+            if not self._event_loop:
+                # Imported here since asyncio is slow to import and most
+                # Snakefiles have no use for it
+                from .aio import EventLoop
+                self._event_loop = EventLoop()
+
+            return self._event_loop
+
+    def _is_up_to_date(self, task):
+        if not isinstance(task, FileTask):
+            return False
+
+        prerequisites = [dependency for dependency in self._dependencies.dependencies(task.label)
+                         if dependency in task.sources or
+                         isinstance(self._tasks.get(dependency), FileTask)]
+
+        return task.is_up_to_date(prerequisites)
+
+    def _add_task(self, f, deps, **options):
         label = ':'.join(self.__working_namespace + [f.__name__])
 
+        self._dependencies.add(label, deps)
+        self._tasks[label] = Task(label, f, self._description(f), requires=deps,
+                                  signature=TaskSignature.of(f), **options)
+
+    def _add_file_task(self, target, f, sources, deps):
+        # File tasks are labelled by their target path, regardless of namespace
+        self._dependencies.add(target, sources + deps)
+        self._tasks[target] = FileTask(target, f, self._description(f), sources, requires=deps,
+                                       signature=TaskSignature.of(f))
+
+    def _description(self, f):
         description = f.__doc__
         if description:
             # Trim leading whitespace and only get the first line of the function doc
             description = description.lstrip().split('\n')[0]
 
-        self._dependencies.add(label, deps)
-        self._tasks[label] = Task(label, f, description)
+        return description
 
 
 class TaskListFormatter(object):
-    def __init__(self, tasks):
+    def __init__(self, tasks, history=None):
         self._tasks = tasks
+        self._history = history
 
     def tableize(self, prefix):
-        documented_tasks = [(self._task_signature(t), t.description)
+        documented_tasks = [(self._task_signature(t), self._describe(t))
                             for t in self._tasks if t.description]
 
         if not documented_tasks:
@@ -226,6 +720,15 @@ class TaskListFormatter(object):
                          (prefix, signature.ljust(width), description)
                          for signature, description in sorted_tasks)
 
+    def _describe(self, task):
+        run = self._history and self._history.last_run(task.label)
+        if not run:
+            return task.description
+
+        outcome = 'failed after' if run.failed else 'took'
+        started = strftime('%Y-%m-%d %H:%M', localtime(run.started))
+        return '%s (last run %s, %s %.3fs)' % (task.description, started, outcome, run.duration)
+
     def _task_signature(self, task):
         """A task signature is the combination of the task name and its arguments"""
         return '%s%s' % (task.label, self._render_arg_list(task))
@@ -0,0 +1,171 @@
+"""Waits for files to change. On Linux the kernel reports changes through
+inotify. Elsewhere files are polled for changes to their modification time or
+size.
+"""
+import ctypes
+import os
+import select
+import struct
+import sys
+import time
+from ctypes.util import find_library
+from errno import EINTR
+
+# The inotify events that mean a file was written, replaced, created or removed
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# The fixed size part of each inotify event: wd, mask, cookie and name length
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def watch(paths):
+    """Starts watching files for changes, using inotify where it is available.
+
+    :param paths: the paths of the files to watch
+    :return: a watcher
+    """
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError):
+            pass
+
+    return PollingWatcher(paths)
+
+
+def wait_for_changes(watcher, debounce=0.1):
+    """Waits for files to change. Changes keep being collected until none have
+    been seen for the debounce period, so that a burst of changes, such as an
+    editor saving several files, is seen all at once.
+
+    :param watcher: the watcher of the files
+    :param debounce: how long to wait for more changes, in seconds
+    :return: set of the paths that changed
+    """
+    # The watcher also wakes up for files that are not watched but share a
+    # directory with watched files, such as the swap files of editors
+    changed = set()
+    while not changed:
+        changed = watcher.changes()
+
+    while True:
+        more = watcher.changes(debounce)
+        if not more:
+            return changed
+
+        changed.update(more)
+
+
+class InotifyWatcher(object):
+    """Watches files with inotify. The directories of the files are watched,
+    rather than the files themselves, so that files which are replaced by
+    renaming another file over them, as many editors do, are still seen.
+    """
+    def __init__(self, paths):
+        self._libc = ctypes.CDLL(find_library('c') or 'libc.so.6', use_errno=True)
+
+        self._fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        self._paths = {}
+        for filename in paths:
+            absolute = os.path.abspath(filename)
+            self._paths[absolute] = filename
+
+        self._directories = {}
+        for directory in set(os.path.dirname(filename) for filename in self._paths):
+            watch = self._libc.inotify_add_watch(self._fd, directory.encode('utf-8'), WATCH_MASK)
+            if watch >= 0:
+                self._directories[watch] = directory
+
+    def changes(self, timeout=None):
+        """Waits for any of the files to change.
+
+        :param timeout: how long to wait in seconds, or None to wait forever
+        :return: set of the paths that changed, which is empty if none changed
+                 before the timeout
+        """
+        try:
+            readable, _, _ = select.select([self._fd], [], [], timeout)
+        except (OSError, select.error) as e:
+            if e.args[0] == EINTR:
+                return set()
+            raise
+
+        if not readable:
+            return set()
+
+        changed = set()
+        data = os.read(self._fd, 65536)
+        offset = 0
+        while offset < len(data):
+            watch, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+
+            name = data[offset:offset + length].rstrip(b'\0').decode('utf-8', 'replace')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, so any of the files may have changed
+                return set(self._paths.values())
+
+            directory = self._directories.get(watch)
+            filename = directory and self._paths.get(os.path.join(directory, name))
+            if filename:
+                changed.add(filename)
+
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher(object):
+    """Watches files by checking their modification time and size"""
+    def __init__(self, paths, interval=0.5):
+        self.interval = interval
+
+        self._snapshot = dict((filename, self._identity(filename)) for filename in paths)
+
+    def changes(self, timeout=None):
+        """Waits for any of the files to change.
+
+        :param timeout: how long to wait in seconds, or None to wait forever
+        :return: set of the paths that changed, which is empty if none changed
+                 before the timeout
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            changed = set()
+            for filename, identity in list(self._snapshot.items()):
+                current = self._identity(filename)
+                if current != identity:
+                    self._snapshot[filename] = current
+                    changed.add(filename)
+
+            remaining = self.interval if deadline is None else deadline - time.time()
+            if changed or remaining <= 0:
+                return changed
+
+            time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+    def _identity(self, filename):
+        try:
+            info = os.stat(filename)
+        except OSError:
+            return None
+
+        return info.st_mtime, info.st_size
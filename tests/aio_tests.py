@@ -0,0 +1,83 @@
+import sys
+from mock import Mock
+from unittest2 import TestCase, skipIf
+
+from snake.application import Application
+from snake.instrumentation import Instrumentation
+from snake.shell import ShellWrapper, CommandFailedException
+from snake.tasks import TaskRegistry
+
+HAS_ASYNCIO = sys.version_info >= (3, 5)
+
+if HAS_ASYNCIO:
+    import asyncio
+    from snake.aio import EventLoop, on_behalf_of
+
+
+@skipIf(not HAS_ASYNCIO, "asyncio support needs Python 3.5 or later")
+class EventLoopTests(TestCase):
+    def setUp(self):
+        super(EventLoopTests, self).setUp()
+        self.loop = EventLoop()
+
+    def tearDown(self):
+        self.loop.close()
+        super(EventLoopTests, self).tearDown()
+
+    def test_it_runs_coroutines_and_returns_their_result(self):
+        self.assertEqual('done', self.loop.run(asyncio.sleep(0, result='done')))
+
+    def test_it_runs_commands_on_the_loop(self):
+        logger = Mock(spec=Application)
+        shell = ShellWrapper(logger)
+
+        result = self.loop.run(shell.execute_async('echo hello', capture=True))
+
+        self.assertEqual(0, result.status)
+        self.assertEqual('hello\n', result.stdout)
+        logger.info.assert_called_once_with('echo hello')
+
+    def test_it_attributes_commands_of_interleaved_coroutines_to_their_tasks(self):
+        instrumentation = Instrumentation()
+        listener = Mock()
+        instrumentation.add_listener(listener)
+        shell = ShellWrapper(Mock(spec=Application), instrumentation)
+
+        async def build(label):
+            await shell.execute_async('sleep 0.05; true')
+            shell.execute('true')
+
+        async def both():
+            await asyncio.gather(on_behalf_of(instrumentation, 'one', build('one')),
+                                 on_behalf_of(instrumentation, 'two', build('two')))
+
+        self.loop.run(both())
+
+        labels = sorted(call[0][0] for call in listener.command_finished.call_args_list)
+        self.assertEqual(['one', 'one', 'two', 'two'], labels)
+
+    def test_it_raises_when_async_command_fails(self):
+        shell = ShellWrapper(Mock(spec=Application))
+
+        with self.assertRaisesRegexp(CommandFailedException, r'failed with status \(4\)'):
+            self.loop.run(shell.execute_async('exit 4'))
+
+    def test_it_returns_status_of_silent_async_command(self):
+        shell = ShellWrapper(Mock(spec=Application))
+
+        self.assertEqual(4, self.loop.run(shell.execute_async('exit 4', silent=True)))
+
+
+@skipIf(not HAS_ASYNCIO, "asyncio support needs Python 3.5 or later")
+class AsyncTaskTests(TestCase):
+    def test_registry_runs_coroutines_returned_by_tasks(self):
+        registry = TaskRegistry('snake')
+        finished = []
+
+        @registry.add_task
+        def wait():
+            return asyncio.sleep(0, result=finished.append('wait'))
+
+        registry.execute('wait')
+
+        self.assertEqual(['wait'], finished)
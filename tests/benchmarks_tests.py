@@ -0,0 +1,59 @@
+from unittest2 import TestCase
+
+from benchmarks.generate import SnakefileSpec, generate_snakefile
+from benchmarks.run import BENCHMARKS, compare, run_suite
+
+
+class SnakefileSpecTests(TestCase):
+    def test_it_nests_tasks_in_namespaces(self):
+        spec = SnakefileSpec(tasks=20, depth=2)
+
+        self.assertEqual('n1:n0:t1', spec.label(1))
+        self.assertEqual('n2:n1:t6', spec.label(6))
+
+    def test_it_only_requires_tasks_from_earlier_groups(self):
+        spec = SnakefileSpec(tasks=100, fan_out=3, fan_in=4)
+
+        self.assertEqual([], spec.requirements(3))
+        for index in range(4, 100):
+            requirements = spec.requirements(index)
+
+            self.assertEqual(min(3, index - index % 4), len(requirements))
+            self.assertLess(max(requirements), index - index % 4)
+
+    def test_it_shares_requirements_within_group(self):
+        spec = SnakefileSpec(tasks=100, fan_out=3, fan_in=4)
+
+        self.assertEqual(spec.requirements(40), spec.requirements(43))
+
+    def test_it_generates_valid_snakefile(self):
+        source = generate_snakefile(SnakefileSpec(tasks=10, depth=2, kwargs=2))
+
+        compile(source, 'Snakefile', 'exec')
+        self.assertIn("default = 'all'", source)
+        self.assertIn("def t3(a0='0', a1='1'):", source)
+
+
+class BenchmarkTests(TestCase):
+    def test_it_measures_each_benchmark(self):
+        results = run_suite([SnakefileSpec(tasks=10, depth=1)], repeat=2)
+
+        self.assertEqual(BENCHMARKS, [result['benchmark'] for result in results['results']])
+        for result in results['results']:
+            self.assertEqual(10, result['tasks'])
+            self.assertLessEqual(result['min'], result['median'])
+
+    def test_it_compares_medians_of_matching_benchmarks(self):
+        def results(*medians):
+            return {'results': [dict(benchmark=name, tasks=10, depth=0, fan_out=2, fan_in=1,
+                                     kwargs=0, median=median)
+                                for name, median in medians]}
+
+        baseline = results(('resolve', 1.0), ('dispatch', 2.0), ('tableize', 1.0))
+        current = results(('resolve', 1.05), ('dispatch', 3.0), ('load_cold', 1.0))
+
+        comparisons = compare(baseline, current, threshold=0.1)
+
+        self.assertEqual([('resolve', 1.0, 1.05, False), ('dispatch', 2.0, 3.0, True)],
+                         [(key[0], before, after, regressed)
+                          for key, before, after, _, regressed in comparisons])
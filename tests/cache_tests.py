@@ -0,0 +1,152 @@
+from os import chdir, getcwd, listdir, makedirs, path, environ, remove, utime
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest2 import TestCase
+
+from mock import patch
+
+from snake.cache import BuildCache, expand
+from snake.tasks import Task
+
+
+def write(filename, contents):
+    with open(filename, 'w') as f:
+        f.write(contents)
+
+
+def read(filename):
+    with open(filename) as f:
+        return f.read()
+
+
+class BuildCacheTests(TestCase):
+    def setUp(self):
+        super(BuildCacheTests, self).setUp()
+        self._current_dir = getcwd()
+        self.directory = mkdtemp()
+        chdir(self.directory)
+
+        self.cache = BuildCache(path.join(self.directory, '.snake', 'cache'), 1024 * 1024)
+        write('input.txt', 'input')
+
+    def tearDown(self):
+        chdir(self._current_dir)
+        rmtree(self.directory)
+        super(BuildCacheTests, self).tearDown()
+
+    def task(self, **options):
+        def build():
+            pass
+
+        return Task('build', build, "Builds", **options)
+
+    def test_fingerprint_is_stable(self):
+        task = self.task(inputs=['input.txt'])
+
+        self.assertEqual(self.cache.fingerprint(task, {}), self.cache.fingerprint(task, {}))
+
+    def test_fingerprint_changes_with_input_contents(self):
+        task = self.task(inputs=['*.txt'])
+        before = self.cache.fingerprint(task, {})
+
+        write('input.txt', 'changed')
+
+        self.assertNotEqual(before, self.cache.fingerprint(task, {}))
+
+    def test_fingerprint_changes_with_arguments(self):
+        task = self.task(inputs=['input.txt'])
+
+        self.assertNotEqual(self.cache.fingerprint(task, {'a': '1'}),
+                            self.cache.fingerprint(task, {'a': '2'}))
+
+    def test_fingerprint_changes_with_environment(self):
+        task = self.task(inputs=['input.txt'], env=['SNAKE_CACHE_TEST'])
+
+        environ['SNAKE_CACHE_TEST'] = 'one'
+        before = self.cache.fingerprint(task, {})
+        environ['SNAKE_CACHE_TEST'] = 'two'
+        after = self.cache.fingerprint(task, {})
+        del environ['SNAKE_CACHE_TEST']
+
+        self.assertNotEqual(before, after)
+
+    def test_it_restores_stored_outputs(self):
+        makedirs('out')
+        write('out/result.txt', 'result')
+
+        self.cache.store('abc', ['out/*.txt'])
+        rmtree('out')
+
+        self.assertTrue(self.cache.restore('abc'))
+        self.assertEqual('result', read('out/result.txt'))
+
+    def test_it_restores_outputs_outside_of_working_directory_to_their_paths(self):
+        outside = mkdtemp()
+        self.addCleanup(rmtree, outside, True)
+        write(path.join(outside, 'result.txt'), 'absolute')
+        sibling = path.join(path.dirname(self.directory), 'sibling-%s.txt' % path.basename(self.directory))
+        write(sibling, 'relative')
+        self.addCleanup(remove, sibling)
+
+        self.cache.store('abc', [path.join(outside, 'result.txt'), path.relpath(sibling)])
+        rmtree(outside)
+        remove(sibling)
+
+        self.assertTrue(self.cache.restore('abc'))
+        self.assertEqual('absolute', read(path.join(outside, 'result.txt')))
+        self.assertEqual('relative', read(sibling))
+        self.assertEqual(['.snake', 'input.txt'], sorted(listdir('.')))
+
+    def test_it_restores_the_stored_result(self):
+        write('result.txt', 'result')
+
+        self.cache.store('abc', ['result.txt'], {'version': (1, 2)})
+
+        self.assertEqual({'version': (1, 2)}, self.cache.restore('abc').result)
+
+    def test_it_does_not_store_results_that_cannot_be_pickled(self):
+        write('result.txt', 'result')
+
+        self.cache.store('abc', ['result.txt'], lambda: None)
+
+        self.assertIsNone(self.cache.restore('abc'))
+
+    def test_it_misses_unknown_fingerprints(self):
+        self.assertFalse(self.cache.restore('abc'))
+
+    def test_it_does_not_store_when_an_output_is_missing(self):
+        self.cache.store('abc', ['missing.txt'])
+
+        self.assertFalse(self.cache.restore('abc'))
+
+    def test_it_evicts_least_recently_used_entries(self):
+        write('result.txt', 'x' * 1000)
+        self.cache.store('old', ['result.txt'])
+        self.cache.store('new', ['result.txt'])
+
+        old = path.join(self.cache.directory, 'old')
+        utime(old, (0, 0))
+
+        entry_size = sum(path.getsize(path.join(old, f)) for f in listdir(old))
+
+        self.assertEqual(1, self.cache.collect_garbage(max_size=entry_size * 3 // 2))
+        self.assertFalse(self.cache.restore('old'))
+        self.assertTrue(self.cache.restore('new'))
+
+    def test_it_only_collects_garbage_once_cache_is_too_large(self):
+        write('result.txt', 'x' * 1000)
+
+        with patch.object(self.cache, 'collect_garbage') as mock_collect_garbage:
+            self.cache.store('one', ['result.txt'])
+            self.assertFalse(mock_collect_garbage.called)
+
+            self.cache.max_size = 1000
+            self.cache.store('two', ['result.txt'])
+            self.assertTrue(mock_collect_garbage.called)
+
+    def test_expand_lists_files_in_directories(self):
+        makedirs('src/pkg')
+        write('src/a.py', '')
+        write('src/pkg/b.py', '')
+
+        self.assertEqual(['src/a.py', 'src/pkg/b.py'], expand(['src']))
@@ -0,0 +1,94 @@
+import os
+import socket
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from unittest2 import TestCase
+
+from mock import patch
+
+from snake.client import manifest_path, run, socket_path
+
+
+class SocketPathTests(TestCase):
+    def test_it_keeps_sockets_in_runtime_directory(self):
+        with patch.dict(os.environ, {'XDG_RUNTIME_DIR': '/run/user/1000'}):
+            address = socket_path('/project/Snakefile')
+
+        self.assertEqual('/run/user/1000/snake', path.dirname(address))
+        self.assertTrue(address.endswith('.sock'))
+
+    def test_it_keeps_sockets_in_temporary_directory_of_user_without_runtime_directory(self):
+        with patch.dict(os.environ):
+            os.environ.pop('XDG_RUNTIME_DIR', None)
+            with patch('tempfile.gettempdir', return_value='/scratch'):
+                address = socket_path('/project/Snakefile')
+
+        self.assertEqual('/scratch/snake-%d' % os.getuid(), path.dirname(address))
+
+    def test_it_uses_a_socket_for_each_snakefile(self):
+        self.assertEqual(socket_path('/one/Snakefile'), socket_path('/one/Snakefile'))
+        self.assertNotEqual(socket_path('/one/Snakefile'), socket_path('/two/Snakefile'))
+
+
+class ManifestPathTests(TestCase):
+    def test_it_defaults_to_snakefile_in_working_directory(self):
+        self.assertEqual('/project/Snakefile', manifest_path(['build', 'target=ios'], '/project'))
+
+    def test_it_finds_snakefile_option(self):
+        self.assertEqual('/project/other', manifest_path(['-f', 'other', 'build'], '/project'))
+        self.assertEqual('/project/other', manifest_path(['-fother'], '/project'))
+        self.assertEqual('/project/other', manifest_path(['--snakefile', 'other'], '/project'))
+        self.assertEqual('/project/other', manifest_path(['--snakefile=other'], '/project'))
+
+    def test_it_keeps_absolute_snakefile(self):
+        self.assertEqual('/elsewhere/Snakefile', manifest_path(['-f', '/elsewhere/Snakefile'], '/project'))
+
+
+class RunTests(TestCase):
+    def setUp(self):
+        super(RunTests, self).setUp()
+        self.directory = mkdtemp()
+        self.addCleanup(rmtree, self.directory)
+
+        environ = patch.dict(os.environ, {'XDG_RUNTIME_DIR': self.directory})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+    def test_it_runs_nothing_without_daemon(self):
+        self.assertEqual(None, run(['build']))
+
+    def test_it_runs_nothing_when_socket_is_left_behind(self):
+        address = socket_path(path.join(os.getcwd(), 'Snakefile'))
+        os.makedirs(path.dirname(address), 0o700)
+        open(address, 'w').close()
+
+        self.assertEqual(None, run(['build']))
+
+    def test_it_never_connects_to_socket_in_directory_open_to_other_users(self):
+        address = socket_path(path.join(os.getcwd(), 'Snakefile'))
+        os.makedirs(path.dirname(address))
+        os.chmod(path.dirname(address), 0o777)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(listener.close)
+        listener.bind(address)
+        listener.listen(1)
+        listener.setblocking(False)
+
+        self.assertEqual(None, run(['build']))
+        with self.assertRaises(socket.error):
+            listener.accept()
+
+    def test_it_never_runs_daemon_in_daemon(self):
+        with patch('snake.client.socket_path') as mock_socket_path:
+            self.assertEqual(None, run(['--daemon']))
+
+        self.assertFalse(mock_socket_path.called)
+
+    def test_it_runs_nothing_when_make_passed_down_jobserver_pipe(self):
+        with patch.dict(os.environ, {'MAKEFLAGS': ' -j4 --jobserver-auth=3,4'}):
+            with patch('snake.client.socket_path') as mock_socket_path:
+                self.assertEqual(None, run(['build']))
+
+        self.assertFalse(mock_socket_path.called)
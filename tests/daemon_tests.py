@@ -0,0 +1,84 @@
+import os
+import socket
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time
+
+from unittest2 import TestCase, skipUnless
+
+from mock import Mock, patch
+
+from snake.client import socket_path
+from snake.daemon import DaemonServer, DaemonException
+
+
+@skipUnless(hasattr(socket.socket, 'recvmsg'), "The daemon needs Python 3.3 or later")
+class DaemonServerTests(TestCase):
+    def setUp(self):
+        super(DaemonServerTests, self).setUp()
+        self.directory = mkdtemp()
+        self.addCleanup(rmtree, self.directory)
+
+        environ = patch.dict(os.environ, {'XDG_RUNTIME_DIR': path.join(self.directory, 'run')})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+        self.manifest = self.write('Snakefile', 'from snake import *\n')
+        self.include = self.write('helpers.py', 'VERSION = 1\n')
+
+    def write(self, name, contents):
+        filename = path.join(self.directory, name)
+        with open(filename, 'w') as f:
+            f.write(contents)
+
+        return filename
+
+    def server(self):
+        return DaemonServer(Mock(), self.manifest, [self.manifest, self.include])
+
+    def test_it_listens_on_socket_of_snakefile(self):
+        server = self.server()
+        server.listen()
+
+        self.assertEqual(socket_path(self.manifest), server.address)
+        self.assertTrue(path.exists(server.address))
+
+        server.close()
+        self.assertFalse(path.exists(server.address))
+
+    def test_it_replaces_socket_left_behind(self):
+        os.makedirs(path.dirname(socket_path(self.manifest)), 0o700)
+        open(socket_path(self.manifest), 'w').close()
+
+        server = self.server()
+        server.listen()
+        self.addCleanup(server.close)
+
+        self.assertTrue(path.exists(server.address))
+
+    def test_it_refuses_to_serve_snakefile_that_is_already_served(self):
+        server = self.server()
+        server.listen()
+        self.addCleanup(server.close)
+
+        with self.assertRaisesRegexp(DaemonException, r'already serving'):
+            self.server().listen()
+
+    def test_it_refuses_to_listen_in_directory_open_to_other_users(self):
+        os.makedirs(path.dirname(socket_path(self.manifest)))
+        os.chmod(path.dirname(socket_path(self.manifest)), 0o777)
+
+        with self.assertRaisesRegexp(DaemonException, r'closed to other users'):
+            self.server().listen()
+
+        self.assertFalse(path.exists(socket_path(self.manifest)))
+
+    def test_it_is_stale_once_files_of_snakefile_change(self):
+        server = self.server()
+        self.assertFalse(server.is_stale())
+
+        modified = time() + 10
+        os.utime(self.include, (modified, modified))
+
+        self.assertTrue(server.is_stale())
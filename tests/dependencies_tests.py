@@ -1,3 +1,4 @@
+import sys
 from unittest2 import TestCase
 
 from snake.dependencies import DependencyGraph, CircularDependencyException
@@ -30,6 +31,19 @@ class DependencyGraphTests(TestCase):
 
         self.assertEqual(['e', 'd', 'c', 'b', 'a'], dependencies.resolve('a'))
 
+    def test_it_resolves_several_nodes_into_one_ordering(self):
+        dependencies = DependencyGraph()
+        dependencies.add('a', ['c'])
+        dependencies.add('b', ['c', 'd'])
+
+        self.assertEqual(['c', 'a', 'd', 'b'], dependencies.resolve_all(['a', 'b']))
+
+    def test_it_does_not_repeat_nodes_requested_more_than_once(self):
+        dependencies = DependencyGraph()
+        dependencies.add('a', ['b'])
+
+        self.assertEqual(['b', 'a'], dependencies.resolve_all(['b', 'a', 'b']))
+
     def test_it_detects_cycles_from_starting_node(self):
         dependencies = DependencyGraph()
         dependencies.add('a', ['b'])
@@ -49,3 +63,50 @@ class DependencyGraphTests(TestCase):
         expected = "a => b => c => d => b"
         with self.assertRaisesRegexp(CircularDependencyException, expected):
             dependencies.resolve('a')
+
+    def test_it_lists_direct_dependencies(self):
+        dependencies = DependencyGraph()
+        dependencies.add('a', ['b', 'c'])
+
+        self.assertEqual(['b', 'c'], dependencies.dependencies('a'))
+        self.assertEqual([], dependencies.dependencies('b'))
+
+    def test_it_finds_every_node_that_depends_on_nodes(self):
+        dependencies = DependencyGraph()
+        dependencies.add('a', ['b', 'c'])
+        dependencies.add('c', ['d'])
+        dependencies.add('e', ['f'])
+
+        self.assertEqual(set(['a', 'c', 'd']), dependencies.dependents(['d']))
+        self.assertEqual(set(['a', 'b', 'e', 'f']), dependencies.dependents(['b', 'f']))
+        self.assertEqual(set(['x']), dependencies.dependents(['x']))
+
+    def test_it_finds_chain_between_nodes(self):
+        dependencies = DependencyGraph()
+        dependencies.add('a', ['b', 'c'])
+        dependencies.add('c', ['d'])
+
+        self.assertEqual(['a', 'c', 'd'], dependencies.chain('a', 'd'))
+        self.assertEqual(['a'], dependencies.chain('a', 'a'))
+        self.assertEqual([], dependencies.chain('b', 'd'))
+
+    def test_it_resolves_chains_deeper_than_the_recursion_limit(self):
+        depth = sys.getrecursionlimit() * 2
+        dependencies = DependencyGraph()
+        for node in range(depth):
+            dependencies.add(node, [node + 1])
+
+        resolved = dependencies.resolve(0)
+
+        self.assertEqual(list(range(depth, -1, -1)), resolved)
+        self.assertEqual(depth + 1, len(dependencies.chain(0, depth)))
+
+    def test_it_detects_cycles_when_resolving_several_nodes(self):
+        dependencies = DependencyGraph()
+        dependencies.add('a', ['b'])
+        dependencies.add('c', ['d'])
+        dependencies.add('d', ['c'])
+
+        expected = "^Circular dependency detected: c => d => c$"
+        with self.assertRaisesRegexp(CircularDependencyException, expected):
+            dependencies.resolve_all(['a', 'c'])
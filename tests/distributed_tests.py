@@ -0,0 +1,219 @@
+import os
+import socket
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Thread
+
+from unittest2 import TestCase
+
+from mock import Mock, patch
+
+from snake.distributed import (Connection, WorkerPool, WorkerServer, WorkerException, RemoteTaskException,
+                               parse_address, worker_key)
+from snake.shell import CommandFailedException
+from snake.tasks import TaskRegistry
+
+
+class ParseAddressTests(TestCase):
+    def test_it_parses_host_and_port(self):
+        self.assertEqual((socket.AF_INET, ('127.0.0.1', 8000)), parse_address('127.0.0.1:8000'))
+
+    def test_it_parses_unix_socket_path(self):
+        self.assertEqual((socket.AF_UNIX, '/tmp/worker.sock'), parse_address('unix:/tmp/worker.sock'))
+
+    def test_it_raises_on_address_without_port(self):
+        with self.assertRaisesRegexp(WorkerException, r'Invalid worker address'):
+            parse_address('localhost')
+
+
+class WorkerTests(TestCase):
+    key = None
+
+    def setUp(self):
+        super(WorkerTests, self).setUp()
+        self.directory = mkdtemp()
+        self.addCleanup(rmtree, self.directory)
+
+        self.manifest = self.write('Snakefile', 'from snake import *\n')
+        self.address = 'unix:%s' % path.join(self.directory, 'worker.sock')
+
+        self.registry = TaskRegistry('snake')
+        self.server = WorkerServer(self.address, self.registry, self.manifest, self.key)
+        self.server.listen()
+        self.addCleanup(self.server.close)
+
+        self.thread = Thread(target=self.serve_once)
+        self.thread.start()
+
+    def write(self, name, contents):
+        filename = path.join(self.directory, name)
+        with open(filename, 'w') as f:
+            f.write(contents)
+
+        return filename
+
+    def serve_once(self):
+        connection = self.server.accept()
+        try:
+            self.server.serve(connection)
+        finally:
+            connection.close()
+
+    def run_tasks(self, manifest, *labels, **options):
+        pool = WorkerPool([self.address], manifest, options.get('key', self.key))
+        try:
+            return [pool.run(label, {'name': 'snake'}) for label in labels]
+        finally:
+            pool.close()
+            self.thread.join()
+
+    def test_it_runs_tasks_on_worker(self):
+        @self.registry.add_task
+        def greet(name):
+            return 'hello %s' % name
+
+        self.assertEqual(['hello snake', 'hello snake'], self.run_tasks(self.manifest, 'greet', 'greet'))
+
+    def test_it_runs_tasks_with_results_of_required_tasks(self):
+        @self.registry.add_task
+        def package():
+            return 'package %s' % self.registry.result('version')
+
+        pool = WorkerPool([self.address], self.manifest, self.key)
+        try:
+            self.assertEqual('package 1.0', pool.run('package', {}, {'version': '1.0'}))
+        finally:
+            pool.close()
+            self.thread.join()
+
+    def test_it_reports_the_worker_and_wall_time_of_each_task(self):
+        @self.registry.add_task
+        def greet(name):
+            return 'hello %s' % name
+
+        instrumentation = Mock()
+        pool = WorkerPool([self.address], self.manifest, self.key, instrumentation)
+        try:
+            pool.run('greet', {'name': 'snake'})
+        finally:
+            pool.close()
+            self.thread.join()
+
+        (label, worker, wall_time), _ = instrumentation.ran_on_worker.call_args
+        self.assertEqual(('greet', self.address), (label, worker))
+        self.assertGreaterEqual(wall_time, 0)
+
+    def test_it_raises_exceptions_of_tasks_with_their_traceback(self):
+        @self.registry.add_task
+        def bad():
+            raise CommandFailedException(2, 'make all')
+
+        with self.assertRaises(RemoteTaskException) as context:
+            self.run_tasks(self.manifest, 'bad')
+
+        self.assertEqual('Command failed with status (2): [make...]', str(context.exception))
+        self.assertEqual('bad', context.exception.remote_traceback[-1][2])
+
+    def test_it_refuses_coordinator_with_different_snakefile(self):
+        other = self.write('Other', 'from snake import *\n\n# Changed\n')
+
+        with self.assertRaisesRegexp(WorkerException, r'refused to run tasks: .*different Snakefile'):
+            self.run_tasks(other, 'greet')
+
+    def test_it_only_serves_unix_sockets_to_the_user(self):
+        @self.registry.add_task
+        def greet(name):
+            return 'hello %s' % name
+
+        mode = os.stat(self.address[len('unix:'):]).st_mode
+        self.run_tasks(self.manifest, 'greet')
+
+        self.assertEqual(0o600, mode & 0o777)
+
+
+class LostWorkerTests(TestCase):
+    def setUp(self):
+        super(LostWorkerTests, self).setUp()
+        self.directory = mkdtemp()
+        self.addCleanup(rmtree, self.directory)
+
+        self.manifest = path.join(self.directory, 'Snakefile')
+        with open(self.manifest, 'w') as f:
+            f.write('from snake import *\n')
+
+        self.address = 'unix:%s' % path.join(self.directory, 'worker.sock')
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(self.listener.close)
+        self.listener.bind(self.address[len('unix:'):])
+        self.listener.listen(1)
+
+        self.thread = Thread(target=self.drop_connection_when_running_task)
+        self.thread.start()
+        self.addCleanup(self.thread.join)
+
+    def drop_connection_when_running_task(self):
+        sock, _ = self.listener.accept()
+        connection = Connection(sock, self.address)
+        connection.receive()
+        connection.send({'type': 'ready'})
+        connection.receive()
+        connection.close()
+
+    def test_it_gives_up_on_tasks_once_every_worker_is_lost(self):
+        pool = WorkerPool([self.address], self.manifest)
+        self.addCleanup(pool.close)
+
+        with self.assertRaisesRegexp(WorkerException, r'Lost connection to worker'):
+            pool.run('one', {})
+
+        with self.assertRaisesRegexp(WorkerException, r'none is left to run two'):
+            pool.run('two', {})
+
+
+class AuthenticatedWorkerTests(WorkerTests):
+    key = b'secret'
+
+    def test_it_runs_tasks_for_coordinator_with_key(self):
+        @self.registry.add_task
+        def greet(name):
+            return 'hello %s' % name
+
+        self.assertEqual(['hello snake'], self.run_tasks(self.manifest, 'greet'))
+
+    def test_it_refuses_coordinator_with_other_key(self):
+        with self.assertRaisesRegexp(WorkerException, r'refused to run tasks: .*key'):
+            self.run_tasks(self.manifest, 'greet', key=b'guess')
+
+    def test_it_refuses_coordinator_without_key(self):
+        with self.assertRaisesRegexp(WorkerException, r'needs a key'):
+            self.run_tasks(self.manifest, 'greet', key=None)
+
+
+class WorkerServerTests(TestCase):
+    def test_it_needs_key_to_listen_on_host_and_port(self):
+        manifest = path.join(path.dirname(__file__), '__init__.py')
+        server = WorkerServer('127.0.0.1:0', TaskRegistry('snake'), manifest)
+
+        with self.assertRaisesRegexp(WorkerException, r'need a key'):
+            server.listen()
+
+
+class WorkerKeyTests(TestCase):
+    def test_it_reads_key_from_environment(self):
+        with patch.dict(os.environ, {'SNAKE_WORKER_KEY': 'secret'}):
+            self.assertEqual(b'secret', worker_key())
+
+    def test_it_reads_key_from_file(self):
+        directory = mkdtemp()
+        self.addCleanup(rmtree, directory)
+        filename = path.join(directory, 'key')
+        with open(filename, 'w') as f:
+            f.write('secret\n')
+
+        self.assertEqual(b'secret', worker_key(filename))
+
+    def test_it_has_no_key_by_default(self):
+        with patch.dict(os.environ):
+            os.environ.pop('SNAKE_WORKER_KEY', None)
+            self.assertEqual(None, worker_key())
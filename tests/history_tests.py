@@ -0,0 +1,127 @@
+import json
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from unittest2 import TestCase
+
+from mock import patch
+
+from snake.history import Estimate, TaskHistory, format_plan
+
+
+class EstimateTests(TestCase):
+    def test_it_estimates_median_and_90th_percentile(self):
+        estimate = Estimate([5.0, 1.0, 3.0, 2.0, 4.0, 6.0, 7.0, 8.0, 9.0, 100.0])
+
+        self.assertEqual(10, estimate.runs)
+        self.assertEqual(5.5, estimate.median)
+        self.assertEqual(9.0, estimate.p90)
+
+    def test_it_estimates_from_single_run(self):
+        estimate = Estimate([2.0])
+
+        self.assertEqual(2.0, estimate.median)
+        self.assertEqual(2.0, estimate.p90)
+
+
+class TaskHistoryTests(TestCase):
+    def setUp(self):
+        super(TaskHistoryTests, self).setUp()
+        self.directory = mkdtemp()
+        self.addCleanup(rmtree, self.directory)
+
+        self.filename = path.join(self.directory, '.snake', 'history')
+
+    def record(self, history, label, duration, failed=False, arguments=None):
+        with patch('snake.history.time.time', side_effect=[100.0, 100.0 + duration]):
+            history.task_started(label, arguments or {})
+            history.task_finished(label, failed)
+
+    def test_it_records_runs_of_tasks(self):
+        history = TaskHistory(self.filename)
+        self.record(history, 'build', 2.5, arguments={'target': 'ios', 'count': 2})
+        history.save()
+
+        run = TaskHistory(self.filename).last_run('build')
+
+        self.assertEqual('build', run.label)
+        self.assertEqual(100.0, run.started)
+        self.assertEqual(2.5, run.duration)
+        self.assertEqual(False, run.failed)
+        self.assertEqual({'target': 'ios', 'count': '2'}, run.arguments)
+
+    def test_it_appends_runs_to_history(self):
+        for duration in [1.0, 2.0]:
+            history = TaskHistory(self.filename)
+            self.record(history, 'build', duration)
+            history.save()
+
+        runs = TaskHistory(self.filename).runs('build')
+
+        self.assertEqual([1.0, 2.0], [run.duration for run in runs])
+
+    def test_it_has_nothing_for_tasks_that_never_ran(self):
+        history = TaskHistory(self.filename)
+
+        self.assertEqual([], history.runs('build'))
+        self.assertEqual(None, history.last_run('build'))
+        self.assertEqual(None, history.estimate('build'))
+
+    def test_it_estimates_from_successful_runs_only(self):
+        history = TaskHistory(self.filename)
+        self.record(history, 'build', 3.0)
+        self.record(history, 'build', 0.1, failed=True)
+        self.record(history, 'build', 5.0)
+        history.save()
+
+        estimate = history.estimate('build')
+
+        self.assertEqual(2, estimate.runs)
+        self.assertEqual(4.0, estimate.median)
+
+    def test_it_keeps_latest_runs_of_each_task_once_too_large(self):
+        history = TaskHistory(self.filename, runs=2, max_size=0)
+        for duration in [1.0, 2.0, 3.0]:
+            self.record(history, 'build', duration)
+        self.record(history, 'test', 4.0)
+        history.save()
+
+        self.assertEqual([2.0, 3.0], [run.duration for run in history.runs('build')])
+        self.assertEqual([4.0], [run.duration for run in history.runs('test')])
+
+    def test_it_skips_lines_cut_short(self):
+        history = TaskHistory(self.filename)
+        self.record(history, 'build', 1.0)
+        history.save()
+
+        with open(self.filename, 'a') as f:
+            f.write(json.dumps({'task': 'build'})[:10])
+
+        self.assertEqual(1, len(TaskHistory(self.filename).runs('build')))
+
+    def test_it_ignores_history_that_cannot_be_written(self):
+        open(path.join(self.directory, '.snake'), 'w').close()
+
+        history = TaskHistory(self.filename)
+        self.record(history, 'build', 1.0)
+        history.save()
+
+        self.assertEqual([], history.runs('build'))
+
+
+class FormatPlanTests(TestCase):
+    def test_it_formats_estimates_of_each_task_and_total(self):
+        history = TaskHistory('/nonexistent/history')
+        estimates = {'compile': Estimate([1.0, 2.0, 3.0]), 'link': Estimate([0.5])}
+
+        with patch.object(history, 'estimate', side_effect=estimates.get):
+            plan = format_plan(['compile', 'link', 'package'], history)
+
+        self.assertEqual('\n'.join([
+            'Task        Median        P90   Runs',
+            'compile     2.000s     3.000s      3',
+            'link        0.500s     0.500s      1',
+            'package          -          -      0',
+            'Total       2.500s     3.500s',
+        ]), plan)
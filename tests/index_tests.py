@@ -0,0 +1,78 @@
+from os import listdir, path, utime
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest2 import TestCase
+
+from snake.index import TaskIndex
+from snake.tasks import Task
+
+
+def write(filename, contents, modified):
+    with open(filename, 'w') as f:
+        f.write(contents)
+
+    utime(filename, (modified, modified))
+
+
+class TaskIndexTests(TestCase):
+    def setUp(self):
+        super(TaskIndexTests, self).setUp()
+        self.directory = mkdtemp()
+        self.manifest = path.join(self.directory, 'Snakefile')
+        self.include = path.join(self.directory, 'helpers.py')
+        self.index = TaskIndex(self.manifest, path.join(self.directory, 'index'))
+
+        write(self.manifest, 'contents', 1000)
+        write(self.include, 'contents', 1000)
+
+    def tearDown(self):
+        rmtree(self.directory)
+        super(TaskIndexTests, self).tearDown()
+
+    def save_task(self):
+        def build(target, mode='debug'):
+            pass
+
+        self.index.save([Task('build', build, "Builds")], [self.include])
+
+    def test_it_has_no_tasks_before_being_saved(self):
+        self.assertIsNone(self.index.tasks())
+        self.assertFalse(self.index.is_current())
+
+    def test_it_reads_saved_tasks(self):
+        self.save_task()
+
+        tasks = self.index.tasks()
+
+        self.assertEqual(1, len(tasks))
+        self.assertEqual('build', tasks[0].label)
+        self.assertEqual('Builds', tasks[0].description)
+        self.assertEqual(['target'], tasks[0].required_args())
+        self.assertEqual({'mode': 'debug'}, tasks[0].optional_args())
+
+    def test_it_is_stale_when_manifest_changes(self):
+        self.save_task()
+
+        write(self.manifest, 'changed contents', 2000)
+
+        self.assertIsNone(self.index.tasks())
+
+    def test_it_is_current_without_reading_the_tasks(self):
+        self.save_task()
+
+        filename, = [path.join(self.index.directory, name) for name in listdir(self.index.directory)]
+        with open(filename) as f:
+            header = f.readline()
+
+        with open(filename, 'w') as f:
+            f.write(header + 'not json\n')
+
+        self.assertTrue(self.index.is_current())
+        self.assertIsNone(self.index.tasks())
+
+    def test_it_is_stale_when_an_include_changes(self):
+        self.save_task()
+
+        write(self.include, 'changed contents', 2000)
+
+        self.assertFalse(self.index.is_current())
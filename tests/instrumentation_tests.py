@@ -0,0 +1,281 @@
+import time
+from threading import Thread
+
+from mock import Mock
+from unittest2 import TestCase
+
+from snake.application import Application
+from snake.instrumentation import ForwardedCommand, Instrumentation, Profiler, TraceRecorder
+from snake.shell import ShellWrapper
+from snake.tasks import TaskRegistry
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        super(InstrumentationTests, self).setUp()
+        self.listener = Mock()
+        self.instrumentation = Instrumentation()
+        self.instrumentation.add_listener(self.listener)
+
+    def test_it_reports_tasks_starting_and_finishing(self):
+        with self.instrumentation.task('build'):
+            self.listener.task_started.assert_called_once_with('build', {})
+
+        self.listener.task_finished.assert_called_once_with('build', False)
+
+    def test_it_reports_failed_tasks(self):
+        with self.assertRaises(ValueError):
+            with self.instrumentation.task('build'):
+                raise ValueError()
+
+        self.listener.task_finished.assert_called_once_with('build', True)
+
+    def test_it_attributes_commands_to_current_task(self):
+        with self.instrumentation.task('build'):
+            with self.instrumentation.command('make') as outcome:
+                outcome.status = 2
+
+        self.listener.command_started.assert_called_once_with('build', 'make')
+        self.listener.command_finished.assert_called_once_with('build', 'make', 2)
+
+    def test_it_tracks_current_task_per_thread(self):
+        seen = []
+        thread = Thread(target=lambda: seen.append(self.instrumentation.current_task))
+
+        with self.instrumentation.task('build'):
+            thread.start()
+            thread.join()
+
+            self.assertEqual('build', self.instrumentation.current_task)
+
+        self.assertEqual([None], seen)
+        self.assertIsNone(self.instrumentation.current_task)
+
+    def test_it_attributes_commands_to_task_given_for_them(self):
+        with self.instrumentation.command('make', 'build'):
+            pass
+
+        self.listener.command_started.assert_called_once_with('build', 'make')
+
+    def test_it_reports_task_arguments(self):
+        with self.instrumentation.task('build', {'target': 'ios'}):
+            pass
+
+        self.listener.task_started.assert_called_once_with('build', {'target': 'ios'})
+
+    def test_it_ignores_listeners_without_handler(self):
+        self.instrumentation.add_listener(object())
+
+        with self.instrumentation.task('build'):
+            pass
+
+
+class ProfilerTests(TestCase):
+    def setUp(self):
+        super(ProfilerTests, self).setUp()
+        self.profiler = Profiler()
+
+        instrumentation = Instrumentation()
+        instrumentation.add_listener(self.profiler)
+
+        self.registry = TaskRegistry('snake')
+        self.registry.instrumentation = instrumentation
+        self.shell = ShellWrapper(Mock(spec=Application), instrumentation)
+
+    def test_it_records_time_and_commands_of_each_task(self):
+        @self.registry.add_task(requires=['first'])
+        def second():
+            self.shell('sleep 0.05')
+
+        @self.registry.add_task
+        def first():
+            self.shell('true')
+            self.shell('true')
+
+        self.registry.execute('second')
+
+        profiles = self.profiler.profiles()
+
+        self.assertEqual(['second', 'first'], [profile.label for profile in profiles])
+        self.assertEqual([1, 2], [profile.commands for profile in profiles])
+        self.assertGreaterEqual(profiles[0].wall_time, 0.05)
+
+    def test_it_counts_commands_run_by_sh_map_for_the_task(self):
+        @self.registry.add_task
+        def lint():
+            self.shell.map('true %s', ['a', 'b', 'c'], jobs=2)
+
+        self.registry.execute('lint')
+
+        self.assertEqual(3, self.profiler.profiles()[0].commands)
+
+    def test_it_counts_commands_forwarded_from_worker_processes(self):
+        commands = [ForwardedCommand('make', 0, 10.0, 12.0), ForwardedCommand('make', 0, 12.0, 13.0)]
+
+        instrumentation = self.registry.instrumentation
+        with instrumentation.task('build'):
+            instrumentation.forward('build', commands, 1.5)
+
+        profile, = self.profiler.profiles()
+        self.assertEqual(2, profile.commands)
+        self.assertGreaterEqual(profile.child_cpu_time, 1.5)
+
+    def test_it_reports_the_worker_each_task_ran_on(self):
+        instrumentation = self.registry.instrumentation
+        with instrumentation.task('build'):
+            instrumentation.ran_on_worker('build', 'unix:a.sock', 1.5)
+
+        with instrumentation.task('lint'):
+            pass
+
+        profiles = dict((profile.label, profile) for profile in self.profiler.profiles())
+        lines = self.profiler.report().split('\n')
+
+        self.assertEqual(('unix:a.sock', 1.5), (profiles['build'].worker, profiles['build'].worker_time))
+        self.assertRegexpMatches(lines[0], r'^Task\s+Wall\s+CPU\s+Child CPU\s+sh\s+Worker$')
+        self.assertIn('build', [line.split()[0] for line in lines if line.endswith('unix:a.sock (1.500s)')])
+        self.assertIn('lint', [line.split()[0] for line in lines if line.endswith(' 0')])
+
+    def test_it_marks_failed_tasks_in_report(self):
+        @self.registry.add_task
+        def bad():
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            self.registry.execute('bad')
+
+        lines = self.profiler.report().split('\n')
+
+        self.assertRegexpMatches(lines[0], r'^Task\s+Wall\s+CPU\s+Child CPU\s+sh$')
+        self.assertRegexpMatches(lines[1], r'^bad \(failed\)\s+\d+\.\d{3}s\s+\d+\.\d{3}s\s+\d+\.\d{3}s\s+0$')
+
+
+class TraceRecorderTests(TestCase):
+    def setUp(self):
+        super(TraceRecorderTests, self).setUp()
+        self.tracer = TraceRecorder()
+
+        self.instrumentation = Instrumentation()
+        self.instrumentation.add_listener(self.tracer)
+
+    def spans(self):
+        return [event for event in self.tracer.events() if event['ph'] == 'X']
+
+    def test_it_records_tasks_and_their_commands_as_nested_spans(self):
+        with self.instrumentation.task('build', {'target': 'ios'}):
+            with self.instrumentation.command('make') as outcome:
+                outcome.status = 2
+
+        command, task = self.spans()
+
+        self.assertEqual(('make', 'command'), (command['name'], command['cat']))
+        self.assertEqual({'task': 'build', 'status': 2}, command['args'])
+        self.assertEqual(('build', 'task'), (task['name'], task['cat']))
+        self.assertEqual({'target': 'ios', 'failed': False}, task['args'])
+
+        self.assertEqual(task['tid'], command['tid'])
+        self.assertLessEqual(task['ts'], command['ts'])
+        self.assertGreaterEqual(task['ts'] + task['dur'], command['ts'] + command['dur'])
+
+    def test_it_gives_each_thread_its_own_lane(self):
+        def work(label):
+            with self.instrumentation.task(label):
+                pass
+
+        threads = [Thread(target=work, args=(label,), name=label) for label in ['one', 'two']]
+        for thread in threads:
+            thread.start()
+            thread.join()
+
+        names = dict((event['tid'], event['args']['name'])
+                     for event in self.tracer.events() if event['ph'] == 'M')
+        lanes = dict((span['name'], span['tid']) for span in self.spans())
+
+        self.assertEqual({'one': 'one', 'two': 'two'},
+                         dict((label, names[lane]) for label, lane in lanes.items()))
+
+    def test_it_nests_commands_run_on_other_threads_under_their_task(self):
+        def work():
+            with self.instrumentation.command('make', 'build'):
+                pass
+
+        with self.instrumentation.task('build'):
+            thread = Thread(target=work, name='snake-event-loop')
+            thread.start()
+            thread.join()
+
+        command, task = self.spans()
+
+        self.assertEqual(task['tid'], command['tid'])
+        self.assertEqual({'task': 'build', 'status': None}, command['args'])
+
+    def test_it_nests_commands_forwarded_from_worker_processes_under_their_task(self):
+        with self.instrumentation.task('build'):
+            started = time.time()
+            self.instrumentation.forward('build', [ForwardedCommand('make', 2, started, started + 0.5)], 0.4)
+
+        command, task = sorted(self.spans(), key=lambda span: span['cat'])
+
+        self.assertEqual(('make', task['tid']), (command['name'], command['tid']))
+        self.assertEqual({'task': 'build', 'status': 2}, command['args'])
+        self.assertEqual(500000, command['dur'])
+
+    def test_it_nests_the_time_tasks_took_on_workers_under_their_task(self):
+        with self.instrumentation.task('build'):
+            self.instrumentation.ran_on_worker('build', 'unix:a.sock', 0.5)
+
+        worker, task = sorted(self.spans(), key=lambda span: span['cat'], reverse=True)
+
+        self.assertEqual(('unix:a.sock', 'worker', task['tid']), (worker['name'], worker['cat'], worker['tid']))
+        self.assertEqual({'task': 'build'}, worker['args'])
+        self.assertEqual(500000, worker['dur'])
+
+    def test_it_closes_interleaved_spans_on_one_thread(self):
+        first = self.instrumentation.command('sleep 1')
+        second = self.instrumentation.command('sleep 2')
+
+        first.__enter__()
+        second.__enter__()
+        first.__exit__(None, None, None)
+        second.__exit__(None, None, None)
+
+        first_span, second_span = self.spans()
+
+        self.assertEqual(['sleep 1', 'sleep 2'], [first_span['name'], second_span['name']])
+        self.assertNotEqual(first_span['tid'], second_span['tid'])
+
+    def test_it_puts_commands_running_at_the_same_time_on_lanes_beside_their_task(self):
+        with self.instrumentation.task('build'):
+            first = self.instrumentation.command('sleep 1')
+            second = self.instrumentation.command('sleep 2')
+
+            first.__enter__()
+            second.__enter__()
+            second.__exit__(None, None, None)
+            first.__exit__(None, None, None)
+
+            with self.instrumentation.command('true'):
+                pass
+
+        names = dict((event['tid'], event['args']['name'])
+                     for event in self.tracer.events() if event['ph'] == 'M')
+        lanes = dict((span['name'], span['tid']) for span in self.spans())
+
+        self.assertEqual(lanes['build'], lanes['sleep 1'])
+        self.assertEqual(lanes['build'], lanes['true'])
+        self.assertEqual('%s (2)' % names[lanes['build']], names[lanes['sleep 2']])
+
+    def test_it_puts_forwarded_commands_that_overlap_on_separate_lanes(self):
+        started = time.time()
+        commands = [ForwardedCommand('sleep 2', 0, started + 0.1, started + 0.3),
+                    ForwardedCommand('sleep 1', 0, started, started + 0.2),
+                    ForwardedCommand('true', 0, started + 0.4, started + 0.5)]
+
+        with self.instrumentation.task('build'):
+            self.instrumentation.forward('build', commands, 0)
+
+        lanes = dict((span['name'], span['tid']) for span in self.spans())
+
+        self.assertEqual(lanes['build'], lanes['sleep 1'])
+        self.assertEqual(lanes['build'], lanes['true'])
+        self.assertNotEqual(lanes['build'], lanes['sleep 2'])
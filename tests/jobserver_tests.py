@@ -0,0 +1,99 @@
+import os
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from unittest2 import TestCase
+
+from snake.jobserver import Jobserver, JobSlots
+
+
+class JobserverTests(TestCase):
+    def setUp(self):
+        super(JobserverTests, self).setUp()
+        self.jobserver = Jobserver.create(3)
+        self.addCleanup(os.close, self.jobserver.read_fd)
+        self.addCleanup(os.close, self.jobserver.write_fd)
+
+    def test_it_holds_a_token_for_each_job_beyond_the_first(self):
+        self.assertEqual(b'+', self.jobserver.acquire(0))
+        self.assertEqual(b'+', self.jobserver.acquire(0))
+        self.assertEqual(None, self.jobserver.acquire(0))
+
+    def test_it_takes_released_tokens_again(self):
+        tokens = [self.jobserver.acquire(0), self.jobserver.acquire(0)]
+        self.jobserver.release(tokens.pop())
+
+        self.assertEqual(b'+', self.jobserver.acquire(0))
+
+    def test_it_joins_jobserver_from_makeflags(self):
+        makeflags = ' -j3 --jobserver-auth=%d,%d' % (self.jobserver.read_fd, self.jobserver.write_fd)
+        jobserver = Jobserver.from_makeflags(makeflags)
+
+        self.assertEqual(3, jobserver.jobs)
+        self.assertEqual(b'+', jobserver.acquire(0))
+
+    def test_it_joins_jobserver_of_older_make(self):
+        makeflags = ' -j --jobserver-fds=%d,%d' % (self.jobserver.read_fd, self.jobserver.write_fd)
+        jobserver = Jobserver.from_makeflags(makeflags)
+
+        self.assertEqual(None, jobserver.jobs)
+        self.assertEqual(self.jobserver.write_fd, jobserver.write_fd)
+
+    def test_it_joins_jobserver_using_named_pipe(self):
+        directory = mkdtemp()
+        self.addCleanup(rmtree, directory)
+        fifo = path.join(directory, 'jobserver')
+        os.mkfifo(fifo)
+
+        jobserver = Jobserver.from_makeflags('-j2 --jobserver-auth=fifo:%s' % fifo)
+        self.addCleanup(os.close, jobserver.read_fd)
+        jobserver.release(b'+')
+
+        self.assertEqual(b'+', jobserver.acquire(0))
+        self.assertEqual('-j2 --jobserver-auth=fifo:%s' % fifo, jobserver.makeflags())
+
+    def test_it_ignores_jobserver_that_was_not_passed_down(self):
+        read_fd, write_fd = os.pipe()
+        os.close(read_fd)
+        os.close(write_fd)
+
+        self.assertEqual(None, Jobserver.from_makeflags('-j4 --jobserver-auth=%d,%d' % (read_fd, write_fd)))
+
+    def test_it_finds_no_jobserver_in_makeflags_without_one(self):
+        self.assertEqual(None, Jobserver.from_makeflags(''))
+        self.assertEqual(None, Jobserver.from_makeflags('-k -s'))
+
+    def test_it_replaces_jobserver_in_makeflags(self):
+        makeflags = self.jobserver.makeflags(' -k -j8 --jobserver-auth=5,6')
+
+        self.assertEqual('-k -j3 --jobserver-auth=%d,%d' % (self.jobserver.read_fd, self.jobserver.write_fd),
+                         makeflags)
+
+    def test_it_passes_jobserver_to_child_processes(self):
+        options = self.jobserver.process_options({'env': {'MAKEFLAGS': '-k'}, 'shell': True})
+
+        self.assertEqual(True, options['shell'])
+        self.assertEqual({'MAKEFLAGS': self.jobserver.makeflags('-k')}, options['env'])
+        self.assertEqual((self.jobserver.read_fd, self.jobserver.write_fd), options['pass_fds'])
+
+
+class JobSlotsTests(TestCase):
+    def setUp(self):
+        super(JobSlotsTests, self).setUp()
+        self.jobserver = Jobserver.create(2)
+        self.addCleanup(os.close, self.jobserver.read_fd)
+        self.addCleanup(os.close, self.jobserver.write_fd)
+        self.slots = JobSlots(self.jobserver, poll_interval=0.01)
+
+    def test_it_uses_own_slot_before_taking_tokens(self):
+        with self.slots.slot():
+            self.assertEqual(b'+', self.jobserver.acquire(0))
+            self.jobserver.release(b'+')
+
+    def test_it_takes_token_while_own_slot_is_used(self):
+        with self.slots.slot():
+            with self.slots.slot():
+                self.assertEqual(None, self.jobserver.acquire(0))
+
+        self.assertEqual(b'+', self.jobserver.acquire(0))
@@ -0,0 +1,69 @@
+from os import listdir, path, utime
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest2 import TestCase
+
+from snake.loader import ManifestLoader
+
+
+class ManifestLoaderTests(TestCase):
+    def setUp(self):
+        super(ManifestLoaderTests, self).setUp()
+        self.directory = mkdtemp()
+        self.cache = path.join(self.directory, 'cache')
+        self.filename = path.join(self.directory, 'Snakefile')
+        self.loader = ManifestLoader(self.cache)
+
+    def tearDown(self):
+        rmtree(self.directory)
+        super(ManifestLoaderTests, self).tearDown()
+
+    def write(self, contents, modified):
+        with open(self.filename, 'w') as f:
+            f.write(contents)
+
+        utime(self.filename, (modified, modified))
+
+    def test_it_loads_manifest_as_module(self):
+        self.write("default = 'build'\n", 1000)
+
+        module = self.loader.load(self.filename)
+
+        self.assertEqual('build', module.default)
+        self.assertEqual(self.filename, module.__file__)
+
+    def test_it_caches_compiled_code(self):
+        self.write("default = 'build'\n", 1000)
+
+        self.loader.load(self.filename)
+
+        self.assertEqual(1, len(listdir(self.cache)))
+
+    def test_it_uses_cached_code_while_manifest_is_unchanged(self):
+        self.write("default = 'build'\n", 1000)
+        self.loader.load(self.filename)
+
+        # Same size and modification time, so the cached code is still used
+        self.write("default = 'other'\n", 1000)
+
+        self.assertEqual('build', self.loader.load(self.filename).default)
+
+    def test_it_recompiles_when_manifest_changes(self):
+        self.write("default = 'build'\n", 1000)
+        self.loader.load(self.filename)
+
+        self.write("default = 'changed'\n", 2000)
+
+        self.assertEqual('changed', self.loader.load(self.filename).default)
+
+    def test_it_does_not_touch_cache_when_disabled(self):
+        self.write("default = 'build'\n", 1000)
+
+        module = self.loader.load(self.filename, use_cache=False)
+
+        self.assertEqual('build', module.default)
+        self.assertFalse(path.exists(self.cache))
+
+    def test_it_raises_when_manifest_is_missing(self):
+        with self.assertRaises((IOError, OSError)):
+            self.loader.load(self.filename)
@@ -25,6 +25,51 @@ class CommandLineParserTests(TestCase):
         self.assertEqual('file', opts.filename)
         self.assertEqual(True, opts.trace)
 
+    def test_it_parses_number_of_jobs(self):
+        _, _, opts = self._parse_command_line('-j 4 build')
+
+        self.assertEqual(4, opts.jobs)
+
+    def test_it_defaults_to_one_job(self):
+        _, _, opts = self._parse_command_line('build')
+
+        self.assertEqual(1, opts.jobs)
+
+    def test_it_parses_manifest_cache_flag(self):
+        _, _, opts = self._parse_command_line('--no-manifest-cache build')
+
+        self.assertEqual(False, opts.manifest_cache)
+
+    def test_it_parses_profile_flag(self):
+        _, _, opts = self._parse_command_line('--profile build')
+
+        self.assertEqual(True, opts.profile)
+
+    def test_it_parses_trace_events_file(self):
+        _, _, opts = self._parse_command_line('--trace-events trace.json build')
+
+        self.assertEqual('trace.json', opts.trace_events)
+
+    def test_it_parses_watch_flag(self):
+        _, _, opts = self._parse_command_line('--watch build')
+
+        self.assertEqual(True, opts.watch)
+
+    def test_it_parses_daemon_flag(self):
+        _, _, opts = self._parse_command_line('--daemon')
+
+        self.assertEqual(True, opts.daemon)
+
+    def test_it_parses_dry_run_flag(self):
+        _, _, opts = self._parse_command_line('-n build')
+
+        self.assertEqual(True, opts.dry_run)
+
+    def test_it_parses_keep_going_flag(self):
+        _, _, opts = self._parse_command_line('-k lint test')
+
+        self.assertEqual(True, opts.keep_going)
+
     def test_it_parses_everything_together(self):
         command = '-f file bootstrap install token=abc dir=env'
 
@@ -3,7 +3,7 @@ from unittest2 import TestCase
 
 
 class PEP8Tests(TestCase):
-    CHECKED_DIRS = ['tests', 'snake']
+    CHECKED_DIRS = ['tests', 'snake', 'benchmarks']
     IGNORED_RULES = [
         'E501',  # Long lines
         'E731',  # Lambda variable assignment
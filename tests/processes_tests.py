@@ -0,0 +1,86 @@
+import pickle
+
+from mock import patch
+from unittest2 import TestCase
+
+from snake import processes
+from snake.instrumentation import CommandRecorder
+from snake.processes import RemoteFailure, execute_task
+from snake.shell import CommandFailedException
+from snake.tasks import TaskRegistry
+
+
+class Unpicklable(Exception):
+    def __init__(self, resource, detail):
+        super(Unpicklable, self).__init__('%s: %s' % (resource, detail))
+
+
+class ExecuteTaskTests(TestCase):
+    def setUp(self):
+        super(ExecuteTaskTests, self).setUp()
+        self.registry = TaskRegistry('snake')
+
+        patcher = patch.object(processes, '_registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_it_returns_value_of_task(self):
+        @self.registry.add_task
+        def double(number):
+            return int(number) * 2
+
+        self.assertEqual(4, execute_task('double', {'number': '2'}).result)
+
+    def test_it_runs_task_with_results_of_required_tasks(self):
+        @self.registry.add_task
+        def package():
+            return 'package %s' % self.registry.result('version')
+
+        self.assertEqual('package 1.0', execute_task('package', {}, {'version': '1.0'}).result)
+
+    def test_it_returns_commands_that_task_ran(self):
+        recorder = CommandRecorder()
+        self.registry.instrumentation.add_listener(recorder)
+        patcher = patch.object(processes, '_recorder', recorder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        @self.registry.add_task
+        def build():
+            with self.registry.instrumentation.command('make') as outcome:
+                outcome.status = 0
+
+        outcome = execute_task('build', {})
+
+        self.assertEqual([('make', 0)], [(command.command, command.status) for command in outcome.commands])
+        self.assertLessEqual(outcome.commands[0].started, outcome.commands[0].finished)
+        self.assertEqual([], execute_task('build', {}).commands[1:])
+
+    def test_it_returns_exception_with_frames_of_traceback(self):
+        @self.registry.add_task
+        def bad():
+            raise CommandFailedException(2, 'make all')
+
+        failure = execute_task('bad', {}).result
+
+        self.assertIsInstance(failure, RemoteFailure)
+        self.assertEqual(2, failure.exception.status)
+        self.assertEqual('bad', failure.frames[-1][2])
+        self.assertEqual(failure.frames, pickle.loads(pickle.dumps(failure)).frames)
+
+    def test_it_replaces_exceptions_that_cannot_be_pickled(self):
+        @self.registry.add_task
+        def bad():
+            raise Unpicklable('socket', 'closed')
+
+        failure = execute_task('bad', {}).result
+
+        self.assertEqual('Unpicklable: socket: closed', str(failure.exception))
+
+    def test_it_raises_exception_with_remote_traceback(self):
+        failure = RemoteFailure(ValueError('bad'), [('Snakefile', 5, 'bad', None)])
+
+        with self.assertRaises(ValueError) as context:
+            failure.reraise()
+
+        self.assertEqual([('Snakefile', 5, 'bad', None)], context.exception.remote_traceback)
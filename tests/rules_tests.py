@@ -0,0 +1,35 @@
+import re
+from unittest2 import TestCase
+
+from snake.rules import Rule
+
+
+def noop(target, source):
+    pass
+
+
+class RuleTests(TestCase):
+    def test_it_replaces_stem_in_sources(self):
+        rule = Rule('build/%.o', ['src/%.c', 'include/%.h'], noop, None)
+
+        self.assertEqual(['src/app.c', 'include/app.h'], rule.match('build/app.o'))
+
+    def test_it_does_not_match_other_labels(self):
+        rule = Rule('build/%.o', ['src/%.c'], noop, None)
+
+        self.assertIsNone(rule.match('build/app.c'))
+        self.assertIsNone(rule.match('other/build/app.o'))
+
+    def test_it_expands_regular_expression_groups(self):
+        rule = Rule(re.compile(r'^out/(?P<name>\w+)\.min\.js$'), [r'src/\g<name>.js'], noop, None)
+
+        self.assertEqual(['src/app.js'], rule.match('out/app.min.js'))
+
+    def test_it_calls_source_functions_with_target(self):
+        rule = Rule('%.gz', [lambda target: [target[:-3], 'VERSION']], noop, None)
+
+        self.assertEqual(['log.txt', 'VERSION'], rule.match('log.txt.gz'))
+
+    def test_it_requires_a_stem_in_string_patterns(self):
+        with self.assertRaisesRegexp(ValueError, r'must contain a % stem'):
+            Rule('build/app.o', [], noop, None)
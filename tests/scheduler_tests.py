@@ -0,0 +1,141 @@
+import os
+import time
+from threading import Event, Lock
+from unittest2 import TestCase
+
+from snake.dependencies import DependencyGraph
+from snake.jobserver import Jobserver, JobSlots
+from snake.scheduler import Scheduler
+
+
+class Recorder(object):
+    def __init__(self):
+        self.calls = []
+        self._lock = Lock()
+
+    def __call__(self, label):
+        with self._lock:
+            self.calls.append(label)
+
+
+class SchedulerTests(TestCase):
+    def setUp(self):
+        super(SchedulerTests, self).setUp()
+        self.graph = DependencyGraph()
+
+    def test_it_runs_plan_in_order_with_one_job(self):
+        recorder = Recorder()
+
+        Scheduler(self.graph, jobs=1).run(['a', 'b', 'c'], recorder)
+
+        self.assertEqual(['a', 'b', 'c'], recorder.calls)
+
+    def test_it_runs_dependencies_before_dependents(self):
+        self.graph.add('d', ['b', 'c'])
+        self.graph.add('b', ['a'])
+        self.graph.add('c', ['a'])
+        recorder = Recorder()
+
+        Scheduler(self.graph, jobs=4).run(self.graph.resolve('d'), recorder)
+
+        calls = recorder.calls
+        self.assertEqual('a', calls[0])
+        self.assertEqual('d', calls[-1])
+        self.assertEqual(set(['b', 'c']), set(calls[1:3]))
+
+    def test_it_runs_independent_tasks_at_the_same_time(self):
+        self.graph.add('c', ['a', 'b'])
+        started = dict((label, Event()) for label in ['a', 'b'])
+
+        def execute(label):
+            if label in started:
+                started[label].set()
+                # Each task waits for its sibling, which only works if both are running
+                other = 'b' if label == 'a' else 'a'
+                if not started[other].wait(5):
+                    raise Exception('%s was not started concurrently' % other)
+
+        Scheduler(self.graph, jobs=2).run(self.graph.resolve('c'), execute)
+
+    def test_it_stops_starting_tasks_and_reraises_after_failure(self):
+        self.graph.add('c', ['b'])
+        self.graph.add('b', ['a'])
+        recorder = Recorder()
+
+        def execute(label):
+            recorder(label)
+            if label == 'b':
+                raise ValueError('b failed')
+
+        scheduler = Scheduler(self.graph, jobs=2)
+        with self.assertRaisesRegexp(ValueError, 'b failed'):
+            scheduler.run(self.graph.resolve('c'), execute)
+
+        self.assertEqual(['a', 'b'], recorder.calls)
+        self.assertEqual('b', scheduler.failed)
+
+    def test_it_records_failed_task_when_running_serially(self):
+        def execute(label):
+            raise ValueError(label)
+
+        scheduler = Scheduler(self.graph, jobs=1)
+        with self.assertRaises(ValueError):
+            scheduler.run(['a', 'b'], execute)
+
+        self.assertEqual('a', scheduler.failed)
+
+    def test_it_keeps_going_with_tasks_that_do_not_require_failed_task(self):
+        self.graph.add('d', ['c'])
+        self.graph.add('c', ['a'])
+        recorder = Recorder()
+
+        def execute(label):
+            recorder(label)
+            if label == 'a':
+                raise ValueError('a failed')
+
+        scheduler = Scheduler(self.graph, jobs=1, keep_going=True)
+        scheduler.run(['a', 'b', 'c', 'd', 'e'], execute)
+
+        self.assertEqual(['a', 'b', 'e'], recorder.calls)
+        self.assertEqual(['a'], [label for label, _ in scheduler.failures])
+        self.assertEqual(['c', 'd'], scheduler.skipped)
+        self.assertEqual('a', scheduler.failed)
+
+    def test_it_keeps_going_with_jobs(self):
+        self.graph.add('d', ['b', 'c'])
+        self.graph.add('b', ['a'])
+        recorder = Recorder()
+
+        def execute(label):
+            recorder(label)
+            if label in ('a', 'c'):
+                raise ValueError('%s failed' % label)
+
+        scheduler = Scheduler(self.graph, jobs=2, keep_going=True)
+        scheduler.run(['a', 'c', 'e', 'b', 'd'], execute)
+
+        self.assertEqual(['a', 'c', 'e'], sorted(recorder.calls))
+        self.assertEqual(['a', 'c'], sorted(label for label, _ in scheduler.failures))
+        self.assertEqual(['b', 'd'], scheduler.skipped)
+
+    def test_it_runs_no_more_tasks_at_once_than_jobserver_allows(self):
+        jobserver = Jobserver.create(2)
+        self.addCleanup(os.close, jobserver.read_fd)
+        self.addCleanup(os.close, jobserver.write_fd)
+        running = []
+        most = []
+        lock = Lock()
+
+        def execute(label):
+            with lock:
+                running.append(label)
+                most.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(label)
+
+        Scheduler(self.graph, jobs=4, slots=JobSlots(jobserver, 0.01)).run(['a', 'b', 'c', 'd'], execute)
+
+        self.assertEqual(2, max(most))
+        self.assertEqual(b'+', jobserver.acquire(0))
@@ -1,8 +1,12 @@
+import os
+import pickle
+
 from mock import Mock, patch
 from unittest2 import TestCase
 
 from snake.application import Application
-from snake.shell import ShellWrapper, CommandFailedException
+from snake.jobserver import Jobserver
+from snake.shell import ShellWrapper, CommandFailedException, CommandsFailedException, program_arguments
 
 
 class ShellWrapperTests(TestCase):
@@ -16,7 +20,7 @@ class ShellWrapperTests(TestCase):
             mock_call.return_value = 0
             self.shell.execute('echo hello world')
 
-            mock_call.assert_called_once_with('echo hello world', shell=True)
+            mock_call.assert_called_once_with(['echo', 'hello', 'world'], shell=False)
             self.logger.info.assert_called_once_with('echo hello world')
 
     @patch('snake.shell.call')
@@ -32,3 +36,204 @@ class ShellWrapperTests(TestCase):
 
         status = self.shell.execute('echo hello world', silent=True)
         self.assertEqual(1, status)
+
+    def test_it_is_callable(self):
+        with patch('snake.shell.call') as mock_call:
+            mock_call.return_value = 0
+            self.shell('echo hello world')
+
+            mock_call.assert_called_once_with(['echo', 'hello', 'world'], shell=False)
+
+    @patch('snake.shell.call')
+    def test_it_runs_commands_with_shell_syntax_using_the_shell(self, mock_call):
+        mock_call.return_value = 0
+        self.shell.execute('echo hello > out.txt')
+
+        mock_call.assert_called_once_with('echo hello > out.txt', shell=True)
+
+    def test_it_runs_list_of_arguments_directly(self):
+        result = self.shell.execute(['echo', 'hello  world', '$HOME'], capture=True)
+
+        self.assertEqual('hello  world $HOME\n', result.stdout)
+        self.logger.info.assert_called_once_with("echo 'hello  world' '$HOME'")
+
+    @patch('sys.stderr')
+    def test_it_returns_not_found_status_for_missing_program(self, mock_stderr):
+        status = self.shell.execute(['snake-missing-program'], silent=True)
+
+        self.assertEqual(127, status)
+        mock_stderr.write.assert_called_once_with('sh: 1: snake-missing-program: not found\n')
+
+    def test_it_captures_output(self):
+        result = self.shell.execute('echo out; echo err >&2', capture=True)
+
+        self.assertEqual(0, result.status)
+        self.assertEqual('out\n', result.stdout)
+        self.assertEqual('err\n', result.stderr)
+        self.logger.info.assert_called_once_with('echo out; echo err >&2')
+
+    def test_it_captures_output_that_is_not_valid_in_the_encoding(self):
+        result = self.shell.execute('printf "\\377out\\n"', capture=True)
+
+        self.assertTrue(result.stdout.endswith('out\n'))
+
+    def test_it_raises_when_captured_command_fails(self):
+        with self.assertRaisesRegexp(CommandFailedException, r'failed with status \(3\).*exit'):
+            self.shell.execute('exit 3', capture=True)
+
+    def test_it_returns_captured_result_when_silent(self):
+        result = self.shell.execute('echo out; exit 3', silent=True, capture=True)
+
+        self.assertEqual(3, result.status)
+        self.assertEqual('out\n', result.stdout)
+
+    def test_it_streams_output_lines(self):
+        lines = list(self.shell.stream('printf "one\\ntwo\\n"'))
+
+        self.assertEqual(['one', 'two'], lines)
+
+    def test_it_streams_output_that_is_not_valid_in_the_encoding(self):
+        lines = list(self.shell.stream('printf "one\\n\\377\\ntwo\\n"'))
+
+        self.assertEqual(3, len(lines))
+        self.assertEqual(['one', 'two'], [lines[0], lines[2]])
+
+    def test_it_raises_after_streaming_output_of_failed_command(self):
+        lines = []
+
+        with self.assertRaisesRegexp(CommandFailedException, r'failed with status \(2\)'):
+            for line in self.shell.stream('echo one; exit 2'):
+                lines.append(line)
+
+        self.assertEqual(['one'], lines)
+
+    def test_it_stops_command_when_stream_is_closed(self):
+        stream = self.shell.stream('yes')
+
+        self.assertEqual('y', next(stream))
+        stream.close()
+
+    def test_it_passes_jobserver_to_commands(self):
+        self.shell.jobserver = Jobserver.create(3)
+        self.addCleanup(os.close, self.shell.jobserver.read_fd)
+        self.addCleanup(os.close, self.shell.jobserver.write_fd)
+
+        result = self.shell.execute('echo $MAKEFLAGS; head -c 2 /dev/fd/%d' % self.shell.jobserver.read_fd,
+                                    capture=True)
+
+        jobserver = self.shell.jobserver
+        self.assertEqual('-j3 --jobserver-auth=%d,%d\n++' % (jobserver.read_fd, jobserver.write_fd),
+                         result.stdout)
+
+    def test_it_runs_commands_in_one_shell_during_session(self):
+        with self.shell.session():
+            self.shell.execute('SNAKE_SESSION_TEST=yes')
+            result = self.shell.execute('test "$SNAKE_SESSION_TEST" = yes', silent=True)
+
+        self.assertEqual(0, result)
+
+    def test_it_runs_plain_commands_in_session_shell(self):
+        with self.shell.session():
+            self.shell.execute('cd /')
+            status = self.shell.execute('test -d tmp', silent=True)
+
+        self.assertEqual(0, status)
+
+    def test_it_logs_each_command_during_session(self):
+        with self.shell.session():
+            self.shell.execute('true')
+            self.shell.execute('true')
+
+        self.assertEqual(2, self.logger.info.call_count)
+
+    def test_it_raises_when_command_fails_during_session(self):
+        with self.shell.session():
+            with self.assertRaisesRegexp(CommandFailedException, r'failed with status \(5\).*sh'):
+                self.shell.execute('sh -c "exit 5"')
+
+    def test_it_starts_new_shell_when_session_shell_exits(self):
+        with self.shell.session():
+            status = self.shell.execute('exit 6', silent=True)
+            self.assertEqual(6, status)
+
+            self.assertEqual(0, self.shell.execute('true'))
+
+    def test_it_reuses_active_session(self):
+        with self.shell.session() as outer:
+            with self.shell.session() as inner:
+                self.assertIs(outer, inner)
+
+    def test_it_maps_command_over_items_in_order(self):
+        results = self.shell.map('echo %s', ['one', 'two', 'three'], jobs=2, capture=True)
+
+        self.assertEqual(['one\n', 'two\n', 'three\n'], [result.stdout for result in results])
+        self.assertEqual(3, self.logger.info.call_count)
+
+    def test_it_quotes_items_for_the_shell(self):
+        results = self.shell.map('echo %s | wc -w', ['a b c', '$HOME'], capture=True)
+
+        self.assertEqual(['3', '1'], [result.stdout.strip() for result in results])
+
+    def test_it_maps_list_of_arguments(self):
+        results = self.shell.map(['echo', 'item=%s'], ['a b'], capture=True)
+
+        self.assertEqual('item=a b\n', results[0].stdout)
+
+    def test_it_calls_back_with_each_result(self):
+        seen = []
+        self.shell.map('test %s = a', ['a', 'b'], silent=True,
+                       callback=lambda item, status: seen.append((item, status)))
+
+        self.assertEqual([('a', 0), ('b', 1)], sorted(seen))
+
+    def test_it_stops_starting_commands_after_failure(self):
+        with self.assertRaises(CommandsFailedException) as context:
+            self.shell.map('exit %s', [3, 0, 0], jobs=1)
+
+        self.assertEqual(1, self.logger.info.call_count)
+        self.assertEqual(3, context.exception.status)
+        self.assertEqual([3], [item for item, _ in context.exception.failures])
+
+    def test_it_reports_all_failures_when_keeping_going(self):
+        with self.assertRaises(CommandsFailedException) as context:
+            self.shell.map('exit %s', [3, 0, 4], jobs=1, keep_going=True)
+
+        message = str(context.exception)
+        self.assertEqual(3, self.logger.info.call_count)
+        self.assertRegexpMatches(message, r'^2 of 3 commands failed:')
+        self.assertRegexpMatches(message, r'3: Command failed with status \(3\): \[exit\.\.\.\]')
+        self.assertRegexpMatches(message, r'4: Command failed with status \(4\): \[exit\.\.\.\]')
+
+    def test_it_returns_statuses_of_failed_commands_when_silent(self):
+        statuses = self.shell.map('exit %s', [0, 2, 0], silent=True)
+        self.assertEqual([0, 2, 0], statuses)
+
+    def test_failures_can_be_pickled(self):
+        failure = CommandsFailedException([('a', CommandFailedException(3, 'exit 3'))], 2)
+        copy = pickle.loads(pickle.dumps(failure))
+
+        self.assertEqual(str(failure), str(copy))
+        self.assertEqual((3, 'exit 3'), (copy.status, copy.command))
+
+    def test_it_is_a_command_failed_exception(self):
+        with self.assertRaises(CommandFailedException):
+            self.shell.map('exit %s', [1])
+
+
+class ProgramArgumentsTests(TestCase):
+    def test_it_runs_plain_commands_directly(self):
+        self.assertEqual((['echo', 'a b', 'c'], False), program_arguments("echo 'a b' c"))
+
+    def test_it_runs_lists_directly(self):
+        self.assertEqual((['echo', '$HOME'], False), program_arguments(('echo', '$HOME')))
+
+    def test_it_uses_the_shell_for_shell_syntax(self):
+        for command in ['ls | wc', 'echo $HOME', 'ls *.py', 'true && false', 'echo `date`']:
+            self.assertEqual((command, True), program_arguments(command))
+
+    def test_it_uses_the_shell_for_builtins_and_assignments(self):
+        for command in ['cd build', 'export A', 'A=1 env', 'exit 3']:
+            self.assertEqual((command, True), program_arguments(command))
+
+    def test_it_uses_the_shell_when_program_is_not_found(self):
+        self.assertEqual(('snake-missing-program', True), program_arguments('snake-missing-program'))
@@ -1,3 +1,12 @@
+import json
+import socket
+import sys
+from os import getcwd, path, remove
+from time import sleep
+from unittest2 import skipIf
+
+from snake.client import socket_path
+from snake.shell import which
 from tests.utils import IntegrationTest
 
 
@@ -129,6 +138,386 @@ class SnakeTests(IntegrationTest):
         self.assertStdoutEqual(result, ['three', 'two', 'one'])
         self.assertStatusEqual(result, 0)
 
+    def test_it_runs_shared_dependencies_once_for_several_tasks(self):
+        self.use_snakefile("""
+            from __future__ import print_function
+            from snake import *
+
+            @task
+            def install():
+                print('install')
+
+            @task(requires=['install'])
+            def test():
+                print('test')
+
+            @task(requires=['install'])
+            def build():
+                print('build')
+        """)
+
+        result = self.execute('snake test build')
+
+        self.assertStderrEmpty(result)
+        self.assertStdoutEqual(result, ['install', 'test', 'build'])
+        self.assertStatusEqual(result, 0)
+
+    def test_it_runs_tasks_with_dependencies_in_parallel(self):
+        self.use_snakefile("""
+            from __future__ import print_function
+            from snake import *
+
+            @task(requires=['two', 'three'])
+            def one():
+                print('one')
+
+            @task
+            def two():
+                sh('sleep 0.2')
+
+            @task
+            def three():
+                sh('sleep 0.2')
+        """)
+
+        result = self.execute('snake -j 2 one')
+
+        self.assertStderrEmpty(result)
+        self.assertEqual('one', result.stdout[-1])
+        self.assertStatusEqual(result, 0)
+
+    def test_it_runs_isolated_tasks_in_worker_processes(self):
+        self.use_snakefile("""
+            import os
+            import sys
+            from snake import *
+
+            @task(requires=['one', 'two'])
+            def both():
+                sys.stdout.write('parent %d\\n' % os.getpid())
+
+            @task(isolated=True)
+            def one():
+                sys.stdout.write('one %d\\n' % os.getpid())
+
+            @task(isolated=True)
+            def two():
+                sys.stdout.write('two %d\\n' % os.getpid())
+        """)
+
+        result = self.execute('snake -j 2 both')
+
+        self.assertStderrEmpty(result)
+        self.assertStatusEqual(result, 0)
+
+        pids = dict(line.split(' ') for line in result.stdout)
+        self.assertEqual(3, len(pids))
+        self.assertNotIn(pids['parent'], [pids['one'], pids['two']])
+
+    def test_it_runs_every_task_in_worker_processes_in_process_mode(self):
+        self.use_snakefile("""
+            from __future__ import print_function
+            import os
+            from snake import *
+
+            # Workers load the Snakefile again but inherit the environment
+            parent = os.environ.setdefault('PARENT_PID', '%d' % os.getpid())
+
+            @task
+            def check(name='world'):
+                print('hello %s from %s' % (name, 'parent' if '%d' % os.getpid() == parent else 'worker'))
+        """)
+
+        result = self.execute('snake --jobs-mode process check name=snake')
+
+        self.assertStderrEmpty(result)
+        self.assertStdoutEqual(result, ['hello snake from worker'])
+        self.assertStatusEqual(result, 0)
+
+    def test_it_passes_results_of_required_tasks_to_isolated_tasks(self):
+        self.use_snakefile("""
+            from __future__ import print_function
+            from snake import *
+
+            @task
+            def version():
+                return '1.0'
+
+            @task(requires=['version'], isolated=True)
+            def package():
+                print('package %s' % results('version'))
+        """)
+
+        result = self.execute('snake package')
+
+        self.assertStderrEmpty(result)
+        self.assertStdoutEqual(result, ['package 1.0'])
+        self.assertStatusEqual(result, 0)
+
+    def test_it_profiles_commands_of_isolated_tasks(self):
+        self.use_snakefile("""
+            from snake import *
+
+            @task(isolated=True)
+            def build():
+                sh('true')
+                sh('true')
+        """)
+
+        result = self.execute('snake --profile build')
+
+        self.assertStatusEqual(result, 0)
+        self.assertStdoutMatches(result, r'^build +\S+s +\S+s +\S+s +2$')
+
+    def test_it_reports_stack_trace_of_isolated_task(self):
+        self.use_snakefile("""
+            from snake import *
+
+            @task(isolated=True)
+            def bad():
+                sh('false')
+        """)
+
+        result = self.execute('snake bad')
+
+        self.assertStdoutEqual(result, ['false'])
+        self.assertStderrMatches(result, r'^Command failed with status \(1\): \[false\.\.\.\]$')
+        self.assertStderrMatches(result, r"Snakefile:5:in `bad'$")
+        self.assertStderrMatches(result, r"^Tasks: TOP => bad$")
+        self.assertStatusEqual(result, 1)
+
+    def test_it_keeps_going_and_reports_every_failure(self):
+        self.use_snakefile("""
+            from __future__ import print_function
+            from snake import *
+
+            @task
+            def lint():
+                sh('false')
+
+            @task
+            def test():
+                raise ValueError('2 tests failed')
+
+            @task(requires=['lint'])
+            def package():
+                print('package')
+
+            @task
+            def docs():
+                print('docs')
+        """)
+
+        result = self.execute('snake -k package test docs')
+
+        self.assertStdoutEqual(result, ['false', 'docs'])
+        self.assertStderrMatches(result, r'^2 of 4 tasks failed, 1 did not run since they require a failed task$')
+        self.assertStderrMatches(result, r'^Command failed with status \(1\): \[false\.\.\.\]$')
+        self.assertStderrMatches(result, r"^Tasks: TOP => package => lint$")
+        self.assertStderrMatches(result, r'^2 tests failed$')
+        self.assertStderrMatches(result, r"Snakefile:10:in `test'$")
+        self.assertStderrMatches(result, r"^Tasks: TOP => test$")
+        self.assertStderrMatches(result, r'^Did not run: package$')
+        self.assertStatusEqual(result, 1)
+
+    def test_it_runs_tasks_on_workers(self):
+        self.use_snakefile("""
+            from __future__ import print_function
+            import sys
+            from snake import *
+
+            @task(requires=['one', 'two'])
+            def both(name):
+                print('both %s' % name)
+
+            @task
+            def one():
+                sh('echo one')
+
+            @task
+            def two():
+                print('two', file=sys.stderr)
+        """)
+
+        for name in ['a', 'b']:
+            self.start('snake --worker --listen unix:%s.sock' % name, '%s.sock' % name)
+
+        result = self.execute('snake --workers unix:a.sock,unix:b.sock both name=snake')
+
+        self.assertStderrEqual(result, ['two'])
+        self.assertEqual(['echo one', 'one'], [line for line in result.stdout if 'one' in line])
+        self.assertEqual('both snake', result.stdout[-1])
+        self.assertStatusEqual(result, 0)
+
+    def test_it_profiles_tasks_on_workers_by_the_worker_they_ran_on(self):
+        self.use_snakefile("""
+            from snake import *
+
+            @task
+            def build():
+                pass
+        """)
+
+        self.start('snake --worker --listen unix:a.sock', 'a.sock')
+        result = self.execute('snake --workers unix:a.sock --profile build')
+
+        self.assertStderrEmpty(result)
+        self.assertStdoutMatches(result, r'^Task\s+Wall\s+CPU\s+Child CPU\s+sh\s+Worker$')
+        self.assertStdoutMatches(result, r'^build\s+.*\s0\s+unix:a\.sock \(\d+\.\d{3}s\)$')
+        self.assertStatusEqual(result, 0)
+
+    def test_it_reports_failures_of_tasks_on_workers(self):
+        self.use_snakefile("""
+            from snake import *
+
+            @task
+            def bad():
+                raise Exception("Bad task")
+        """)
+
+        self.start('snake --worker --listen unix:worker.sock', 'worker.sock')
+
+        result = self.execute('snake --workers unix:worker.sock bad')
+
+        self.assertStdoutEmpty(result)
+        self.assertStderrMatches(result, r'^Bad task$')
+        self.assertStderrMatches(result, r"Snakefile:5:in `bad'$")
+        self.assertStatusEqual(result, 1)
+
+    def test_it_shares_results_between_tasks(self):
+        self.use_snakefile("""
+            from __future__ import print_function
+            from snake import *
+
+            @task
+            def version():
+                print('computing version')
+                return '1.2.3'
+
+            @task(requires=['version'])
+            def package(version):
+                print('package %s' % version)
+
+            @task(requires=['version'])
+            def tag():
+                print('tag %s' % results('version'))
+        """)
+
+        result = self.execute('snake package tag')
+
+        self.assertStderrEmpty(result)
+        self.assertStdoutEqual(result, ['computing version', 'package 1.2.3', 'tag 1.2.3'])
+        self.assertStatusEqual(result, 0)
+
+    def test_it_skips_file_tasks_that_are_up_to_date(self):
+        self.use_snakefile("""
+            from snake import *
+
+            @file_task('build.out', sources=['Snakefile'])
+            def build():
+                sh('touch build.out')
+        """)
+
+        result = self.execute('snake build.out')
+
+        self.assertStderrEmpty(result)
+        self.assertStdoutEqual(result, ['touch build.out'])
+        self.assertStatusEqual(result, 0)
+
+        result = self.execute('snake build.out')
+
+        self.assertStderrEmpty(result)
+        self.assertStdoutEmpty(result)
+        self.assertStatusEqual(result, 0)
+
+    def test_it_restores_outputs_of_cached_tasks(self):
+        self.use_snakefile("""
+            from snake import *
+
+            @task(inputs=['Snakefile'], outputs=['cached.out'])
+            def build():
+                sh('touch cached.out')
+        """)
+
+        result = self.execute('snake build')
+
+        self.assertStdoutEqual(result, ['touch cached.out'])
+        self.assertStatusEqual(result, 0)
+
+        self.execute('rm cached.out')
+        result = self.execute('snake build')
+
+        self.assertStderrEmpty(result)
+        self.assertStdoutEmpty(result)
+        self.assertStatusEqual(result, 0)
+        self.assertTrue(path.exists('cached.out'))
+
+    def test_it_restores_results_of_cached_tasks(self):
+        self.use_snakefile("""
+            from __future__ import print_function
+            from snake import *
+
+            @task(inputs=['Snakefile'], outputs=['cached.out'])
+            def gen():
+                sh('touch cached.out', silent=True)
+                return 42
+
+            @task(requires=['gen'])
+            def use(gen):
+                print('gen result', gen)
+        """)
+
+        self.execute('snake use')
+        result = self.execute('snake use')
+
+        self.assertStderrEmpty(result)
+        self.assertStdoutEqual(result, ['gen result 42'])
+        self.assertStatusEqual(result, 0)
+
+    def test_it_evicts_cache_entries(self):
+        result = self.execute('snake --cache-gc --cache-size 0')
+
+        self.assertStderrEmpty(result)
+        self.assertStdoutMatches(result, r'^Evicted \d+ cache entries$')
+        self.assertStatusEqual(result, 0)
+
+    def test_it_does_not_import_asyncio_without_async_tasks(self):
+        self.use_snakefile("""
+            from __future__ import print_function
+            import sys
+            from snake import *
+
+            @task
+            def build():
+                print('asyncio' in sys.modules)
+        """)
+
+        result = self.execute('snake build')
+
+        self.assertStderrEmpty(result)
+        self.assertStdoutEqual(result, ['False'])
+        self.assertStatusEqual(result, 0)
+
+    @skipIf(sys.version_info < (3, 5), "asyncio support needs Python 3.5 or later")
+    def test_it_runs_async_tasks(self):
+        self.use_snakefile("""
+            from __future__ import print_function
+            import asyncio
+            from snake import *
+
+            @task
+            async def fetch():
+                results = await asyncio.gather(sh_async('echo one', capture=True),
+                                               sh_async('echo two', capture=True))
+                print(' '.join(result.stdout.strip() for result in results))
+        """)
+
+        result = self.execute('snake fetch')
+
+        self.assertStderrEmpty(result)
+        self.assertStdoutMatches(result, '^one two$')
+        self.assertStatusEqual(result, 0)
+
     def test_it_has_shortcut_to_current_environment(self):
         import os
         os.environ['THING'] = 'hey'
@@ -196,6 +585,326 @@ class SnakeTests(IntegrationTest):
         self.assertStdoutEqual(result, expected)
         self.assertStatusEqual(result, 0)
 
+    def test_it_completes_task_names(self):
+        self.use_snakefile("""
+            from snake import *
+
+            @namespace
+            def build():
+
+                @task
+                def app():
+                    pass
+
+                @task
+                def tools():
+                    pass
+
+            @task
+            def bootstrap():
+                pass
+        """)
+
+        # The first run loads the Snakefile and the second is answered from the index
+        for _ in range(2):
+            result = self.execute('snake --complete build:')
+
+            self.assertStderrEmpty(result)
+            self.assertStdoutEqual(result, ['build:app', 'build:tools'])
+            self.assertStatusEqual(result, 0)
+
+    def test_it_lists_tasks_again_after_snakefile_changes(self):
+        self.use_snakefile("""
+            from snake import *
+
+            @task
+            def one():
+                '''One'''
+        """)
+
+        self.execute('snake -T')
+
+        self.use_snakefile("""
+            from snake import *
+
+            @task
+            def one():
+                '''One'''
+
+            @task
+            def two():
+                '''Two'''
+        """)
+
+        result = self.execute('snake -T')
+
+        self.assertStderrEmpty(result)
+        self.assertStdoutEqual(result, ['snake one  # One', 'snake two  # Two'])
+        self.assertStatusEqual(result, 0)
+
+    def test_it_profiles_tasks(self):
+        self.use_snakefile("""
+            from snake import *
+
+            @task(requires=['two'])
+            def one():
+                sh('true')
+
+            @task
+            def two():
+                sh('sleep 0.1')
+        """)
+
+        result = self.execute('snake --profile one')
+
+        self.assertStderrEmpty(result)
+        self.assertEqual(['sleep 0.1', 'true'], result.stdout[:2])
+        self.assertStdoutMatches(result, r'^Task\s+Wall\s+CPU\s+Child CPU\s+sh$')
+        self.assertRegexpMatches(result.stdout[3], r'^two\s+0\.1\d\ds\s.*\s1$')
+        self.assertRegexpMatches(result.stdout[4], r'^one\s.*\s1$')
+        self.assertStatusEqual(result, 0)
+
+    def test_it_profiles_tasks_that_failed(self):
+        self.use_snakefile("""
+            from snake import *
+
+            @task
+            def bad():
+                sh('false')
+        """)
+
+        result = self.execute('snake --profile bad')
+
+        self.assertStderrMatches(result, r'^snake aborted!$')
+        self.assertStdoutMatches(result, r'^bad \(failed\)\s.*\s1$')
+        self.assertStatusEqual(result, 1)
+
+    def test_it_writes_trace_events(self):
+        self.use_snakefile("""
+            from snake import *
+
+            @task
+            def build(target='linux'):
+                sh('true')
+        """)
+
+        result = self.execute('snake --trace-events trace.json build target=ios')
+
+        self.assertStderrEmpty(result)
+        self.assertStatusEqual(result, 0)
+
+        with open('trace.json') as f:
+            events = json.load(f)['traceEvents']
+
+        spans = [(event['name'], event['args']) for event in events if event['ph'] == 'X']
+        self.assertEqual([('true', {'task': 'build', 'status': 0}),
+                          ('build', {'target': 'ios', 'failed': False})], spans)
+
+    def test_it_runs_tasks_affected_by_changed_files_when_watching(self):
+        self.use_snakefile("""
+            from snake import *
+
+            def log(message):
+                with open('runs.txt', 'a') as f:
+                    f.write(message + '\\n')
+
+            @task(inputs=['source.txt'])
+            def compile():
+                log('compile')
+
+            @task(inputs=['style.txt'])
+            def lint():
+                log('lint')
+
+            @task(requires=['compile', 'lint'])
+            def build():
+                log('build')
+        """)
+
+        for name in ['source.txt', 'style.txt']:
+            with open(name, 'w') as f:
+                f.write('one')
+
+        runs = lambda: open('runs.txt').read().split()
+        process = self.start('snake --watch --no-manifest-cache build', 'runs.txt')
+        self.wait_until(lambda: len(runs()) == 3, process, "build did not run")
+
+        # Lets the watcher start before the change
+        sleep(0.5)
+        with open('source.txt', 'w') as f:
+            f.write('two')
+
+        self.wait_until(lambda: len(runs()) == 5, process, "build did not run again")
+        self.assertEqual(['compile', 'lint', 'build', 'compile', 'build'], runs())
+
+    def test_it_traces_each_run_when_watching(self):
+        self.use_snakefile("""
+            from snake import *
+
+            @task(inputs=['source.txt'])
+            def compile():
+                pass
+
+            @task(inputs=['style.txt'])
+            def lint():
+                pass
+
+            @task(requires=['compile', 'lint'])
+            def build():
+                pass
+        """)
+
+        for name in ['source.txt', 'style.txt']:
+            with open(name, 'w') as f:
+                f.write('one')
+
+        def traced():
+            try:
+                with open('trace.json') as f:
+                    events = json.load(f)['traceEvents']
+            except (IOError, ValueError):
+                return None
+
+            return sorted(event['name'] for event in events if event['ph'] == 'X')
+
+        process = self.start('snake --watch --no-manifest-cache --trace-events trace.json build', 'trace.json')
+        self.wait_until(lambda: traced() == ['build', 'compile', 'lint'], process, "build was not traced")
+
+        # Lets the watcher start before the change
+        sleep(0.5)
+        with open('source.txt', 'w') as f:
+            f.write('two')
+
+        self.wait_until(lambda: traced() == ['build', 'compile'], process, "build was not traced again")
+
+    def test_it_passes_own_jobserver_to_commands_when_running_jobs(self):
+        self.use_snakefile("""
+            from snake import *
+
+            @task
+            def build():
+                sh('echo $MAKEFLAGS')
+        """)
+
+        result = self.execute('snake -j 2 build')
+
+        self.assertStderrEmpty(result)
+        self.assertStdoutMatches(result, r'^-j2 --jobserver-auth=\d+,\d+$')
+        self.assertStatusEqual(result, 0)
+
+    @skipIf(not which('make'), "GNU make is not installed")
+    def test_it_shares_jobserver_of_make(self):
+        self.use_snakefile("""
+            from __future__ import print_function
+            import os
+            from snake import *
+
+            @task
+            def build():
+                passed = sh('echo $MAKEFLAGS', capture=True).stdout.split()
+                print('shared' if passed[-1] == os.environ['MAKEFLAGS'].split()[-1] else 'not shared')
+        """)
+        with open('Makefile', 'w') as f:
+            f.write('all:\n\t@+snake build\n')
+        self.addCleanup(remove, 'Makefile')
+
+        result = self.execute('make -j3')
+
+        self.assertStderrEmpty(result)
+        self.assertStdoutMatches(result, r'^shared$')
+        self.assertStatusEqual(result, 0)
+
+    @skipIf(not hasattr(socket.socket, 'sendmsg'), "The daemon needs Python 3.3 or later")
+    def test_it_runs_commands_in_daemon(self):
+        self.use_snakefile("""
+            from __future__ import print_function
+            import os
+            from snake import *
+
+            with open('loads.txt', 'a') as f:
+                f.write('load\\n')
+
+            @task
+            def greet(name):
+                print('%s %s' % (os.environ['GREETING'], name))
+
+            @task
+            def bad():
+                raise Exception("Bad task")
+        """)
+
+        self.start('snake --daemon', socket_path(path.join(getcwd(), 'Snakefile')))
+
+        result = self.execute('GREETING=hello snake greet name=snake')
+        self.assertStdoutEqual(result, ['hello snake'])
+        self.assertStatusEqual(result, 0)
+
+        result = self.execute('snake bad')
+        self.assertStderrMatches(result, r'^Bad task$')
+        self.assertStatusEqual(result, 1)
+
+        self.assertEqual(['load'], open('loads.txt').read().split())
+
+    @skipIf(not hasattr(socket.socket, 'sendmsg'), "The daemon needs Python 3.3 or later")
+    def test_it_restarts_daemon_when_snakefile_changes(self):
+        snakefile = """
+            from __future__ import print_function
+            from snake import *
+
+            @task
+            def version():
+                print('%s')
+        """
+        self.use_snakefile(snakefile % 'one')
+
+        address = socket_path(path.join(getcwd(), 'Snakefile'))
+        process = self.start('snake --daemon', address)
+
+        self.use_snakefile(snakefile % 'two!')
+        result = self.execute('snake version')
+        self.assertStdoutEqual(result, ['two!'])
+
+        # The daemon goes away while it loads the Snakefile again
+        self.wait_until(lambda: path.exists(address), process, "the daemon did not come back")
+
+        result = self.execute('snake version')
+        self.assertStdoutEqual(result, ['two!'])
+        self.assertStatusEqual(result, 0)
+
+    def test_it_estimates_tasks_from_history_without_running_them(self):
+        self.use_snakefile("""
+            from __future__ import print_function
+            from snake import *
+
+            @task
+            def compile():
+                \"\"\"Compiles\"\"\"
+                print('compiling')
+
+            @task(requires=['compile'])
+            def package():
+                \"\"\"Packages\"\"\"
+                print('packaging')
+        """)
+
+        self.execute('snake compile')
+        self.execute('snake compile')
+
+        result = self.execute('snake -n package')
+
+        self.assertStderrEmpty(result)
+        self.assertStdoutDoesNotMatch(result, r'compiling|packaging')
+        self.assertEqual(['Task', 'Median', 'P90', 'Runs'], result.stdout[0].split())
+        self.assertStdoutMatches(result, r'^compile +\d+\.\d{3}s +\d+\.\d{3}s +2$')
+        self.assertStdoutMatches(result, r'^package +- +- +0$')
+        self.assertStdoutMatches(result, r'^Total +\d+\.\d{3}s +\d+\.\d{3}s$')
+        self.assertStatusEqual(result, 0)
+
+        result = self.execute('snake --no-manifest-cache -T')
+
+        self.assertStdoutMatches(result, r'# Compiles \(last run [-\d]+ [:\d]+, took \d+\.\d{3}s\)$')
+        self.assertStdoutMatches(result, r'# Packages$')
+
     def test_it_reports_exception_with_terse_stack_trace(self):
         self.use_snakefile("""
             from snake import *
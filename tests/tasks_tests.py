@@ -1,8 +1,16 @@
+from os import path, utime
+from shutil import rmtree
 from six import StringIO
+from tempfile import mkdtemp
+from time import mktime, time
 
 from unittest2 import TestCase
 
-from snake.tasks import Task, TaskRegistry, NoSuchTaskException
+from mock import Mock, patch
+
+from snake.history import TaskRun
+from snake.tasks import (Task, TaskSignature, FileTask, TaskRegistry, NoSuchTaskException,
+                         NoSuchResultException, TasksFailedException)
 
 
 class Flag(object):
@@ -73,6 +81,30 @@ class TaskTests(TestCase):
         with self.assertRaisesRegexp(TypeError, r"unsupported operand type"):
             task.execute()
 
+    def test_it_passes_all_kwargs_to_functions_accepting_splat_kwargs(self):
+        received = {}
+
+        def foo(a, **kwargs):
+            received.update(kwargs)
+
+        task = Task('foo', foo, "Description")
+        task.execute(a=1, b=2, c=3)
+
+        self.assertEqual({'b': 2, 'c': 3}, received)
+
+    def test_it_does_not_reflect_on_function_when_executing(self):
+        def foo(a, b=2):
+            pass
+
+        task = Task('foo', foo, "Description")
+
+        with patch('snake.tasks.signature') as mock_signature:
+            task.execute(a=1, c=3)
+            task.required_args()
+            task.optional_args()
+
+        self.assertFalse(mock_signature.called)
+
     def test_required_args_returns_list_of_positional_args(self):
         def foo(a, b):
             pass
@@ -138,6 +170,71 @@ class TaskTests(TestCase):
         self.assertEqual({'one': 1}, task.optional_args())
 
 
+class TaskSignatureTests(TestCase):
+    def test_it_separates_required_and_optional_args(self):
+        def foo(a, b, c=1, *args, **kwargs):
+            pass
+
+        signature = TaskSignature.of(foo)
+
+        self.assertEqual(['a', 'b'], signature.required)
+        self.assertEqual({'c': 1}, signature.optional)
+        self.assertTrue(signature.accepts_kwargs)
+
+    def test_it_selects_only_known_arguments(self):
+        def foo(a, b=2):
+            pass
+
+        signature = TaskSignature.of(foo)
+
+        self.assertEqual({'a': 1}, signature.arguments({'a': 1, 'c': 3}))
+
+    def test_it_finds_missing_required_arguments(self):
+        def foo(a, b, c=3):
+            pass
+
+        signature = TaskSignature.of(foo)
+
+        self.assertEqual(['b'], signature.missing({'a': 1}))
+
+
+class FileTaskTests(TestCase):
+    def setUp(self):
+        super(FileTaskTests, self).setUp()
+        self.directory = mkdtemp()
+        self.target = self.touch('target', age=10)
+
+    def tearDown(self):
+        rmtree(self.directory)
+        super(FileTaskTests, self).tearDown()
+
+    def touch(self, name, age=0):
+        filename = path.join(self.directory, name)
+        open(filename, 'w').close()
+
+        modified = time() - age
+        utime(filename, (modified, modified))
+        return filename
+
+    def test_it_is_up_to_date_when_target_is_newer_than_prerequisites(self):
+        source = self.touch('source', age=20)
+        task = FileTask(self.target, lambda: None, "Description", [source])
+
+        self.assertTrue(task.is_up_to_date([source]))
+
+    def test_it_is_not_up_to_date_when_a_prerequisite_is_newer(self):
+        source = self.touch('source')
+        task = FileTask(self.target, lambda: None, "Description", [source])
+
+        self.assertFalse(task.is_up_to_date([source]))
+
+    def test_it_is_not_up_to_date_when_target_does_not_exist(self):
+        target = path.join(self.directory, 'missing')
+        task = FileTask(target, lambda: None, "Description", [])
+
+        self.assertFalse(task.is_up_to_date([]))
+
+
 class TaskRegistryTests(TestCase):
     def setUp(self):
         super(TaskRegistryTests, self).setUp()
@@ -248,6 +345,24 @@ class TaskRegistryTests(TestCase):
         self.assertTrue(two_called)
         self.assertTrue(one_called)
 
+    def test_it_executes_shared_dependencies_once_for_several_tasks(self):
+        calls = []
+
+        @self.registry.add_task
+        def install():
+            calls.append('install')
+
+        @self.registry.add_task(requires=['install'])
+        def test():
+            calls.append('test')
+
+        @self.registry.add_task(requires=['install'])
+        def build():
+            calls.append('build')
+
+        self.registry.execute('test', 'build')
+        self.assertEqual(['install', 'test', 'build'], calls)
+
     def test_it_reports_execution_context_at_point_of_failure(self):
 
         @self.registry.add_task(requires=['two'])
@@ -267,6 +382,239 @@ class TaskRegistryTests(TestCase):
         except ValueError:
             self.assertEqual(['one', 'two'], list(self.registry.execution_context))
 
+    def test_it_reports_execution_context_of_failed_branch_with_jobs(self):
+
+        @self.registry.add_task(requires=['left', 'right'])
+        def top():
+            pass
+
+        @self.registry.add_task(requires=['bottom'])
+        def left():
+            pass
+
+        @self.registry.add_task
+        def right():
+            raise ValueError('right')
+
+        @self.registry.add_task
+        def bottom():
+            pass
+
+        self.registry.jobs = 2
+
+        with self.assertRaises(ValueError):
+            self.registry.execute('top')
+
+        self.assertEqual(['top', 'right'], list(self.registry.execution_context))
+
+    def test_it_keeps_going_after_failure_and_reports_every_failure(self):
+        calls = []
+
+        @self.registry.add_task(requires=['lint', 'compile'])
+        def build():
+            calls.append('build')
+
+        @self.registry.add_task
+        def lint():
+            raise ValueError('lint')
+
+        @self.registry.add_task
+        def compile():
+            raise ValueError('compile')
+
+        @self.registry.add_task
+        def docs():
+            calls.append('docs')
+
+        self.registry.keep_going = True
+
+        with self.assertRaises(TasksFailedException) as context:
+            self.registry.execute('build', 'docs')
+
+        failure = context.exception
+        self.assertEqual('2 of 4 tasks failed, 1 did not run since they require a failed task', str(failure))
+        self.assertEqual([['build', 'lint'], ['build', 'compile']], [chain for chain, _ in failure.failures])
+        self.assertEqual(['lint', 'compile'], [str(error) for _, (_, error, _) in failure.failures])
+        self.assertEqual(['build'], failure.skipped)
+        self.assertEqual(['docs'], calls)
+        self.assertEqual(['build', 'lint'], list(self.registry.execution_context))
+
+    def test_it_raises_assertion_when_jobs_is_not_positive(self):
+        with self.assertRaisesRegexp(AssertionError, r"number of jobs must be a positive integer"):
+            self.registry.jobs = 0
+
+    def test_it_raises_assertion_when_jobs_mode_is_unknown(self):
+        with self.assertRaisesRegexp(AssertionError, r"jobs mode must be one of: thread, process"):
+            self.registry.jobs_mode = 'fibers'
+
+    def test_it_runs_isolated_tasks_in_processes(self):
+        self.registry.processes = Mock()
+        self.registry.processes.run.return_value = 'result'
+
+        @self.registry.add_task(isolated=True)
+        def heavy(size=1):
+            raise AssertionError('Should run in a worker')
+
+        @self.registry.add_task(requires=['heavy'])
+        def light():
+            pass
+
+        self.registry.execute('light', size=2)
+
+        self.registry.processes.run.assert_called_once_with('heavy', {'size': 2}, {})
+        self.registry.processes.close.assert_called_once_with()
+
+    def test_it_runs_every_task_in_processes_in_process_mode(self):
+        self.registry.processes = Mock()
+        self.registry.jobs_mode = 'process'
+
+        @self.registry.add_task
+        def light():
+            raise AssertionError('Should run in a worker')
+
+        self.registry.execute('light')
+
+        self.registry.processes.run.assert_called_once_with('light', {}, {})
+
+    def test_it_sends_results_of_required_tasks_to_processes(self):
+        self.registry.processes = Mock()
+
+        @self.registry.add_task
+        def version():
+            return '1.0'
+
+        @self.registry.add_task(requires=['version'], isolated=True)
+        def package():
+            raise AssertionError('Should run in a worker')
+
+        self.registry.execute('package')
+
+        self.registry.processes.run.assert_called_once_with('package', {}, {'version': '1.0'})
+
+    def test_it_runs_single_task_with_results_of_another_run(self):
+        @self.registry.add_task
+        def package():
+            return 'package %s' % self.registry.result('version')
+
+        self.assertEqual('package 1.0', self.registry.run('package', _results={'version': '1.0'}))
+
+    def test_it_runs_isolated_tasks_in_place_without_processes(self):
+        called = Flag()
+
+        @self.registry.add_task(isolated=True)
+        def heavy():
+            called.value = True
+
+        self.registry.execute('heavy')
+
+        self.assertTrue(called.value)
+
+    def test_it_runs_single_task_by_label_without_dependencies(self):
+        @self.registry.add_task(requires=['other'])
+        def one(name):
+            return 'hello %s' % name
+
+        @self.registry.add_task
+        def other():
+            raise AssertionError('Should not run')
+
+        self.assertEqual('hello snake', self.registry.run('one', name='snake'))
+
+    def test_it_raises_when_running_unknown_task_by_label(self):
+        with self.assertRaises(NoSuchTaskException):
+            self.registry.run('missing')
+
+    def test_it_passes_results_of_required_tasks_to_parameters_named_after_them(self):
+        @self.registry.add_task
+        def version():
+            return '1.2.3'
+
+        @self.registry.add_namespace
+        def build():
+            @self.registry.add_task
+            def tools():
+                return ['cc', 'ld']
+
+        @self.registry.add_task(requires=['version', 'build:tools'])
+        def release(version, build_tools, channel='stable'):
+            return '%s %s %s' % (version, ','.join(build_tools), channel)
+
+        self.registry.execute('release', channel='beta')
+
+        self.assertEqual('1.2.3 cc,ld beta', self.registry.result('release'))
+
+    def test_it_prefers_given_arguments_to_results(self):
+        @self.registry.add_task
+        def version():
+            return '1.2.3'
+
+        @self.registry.add_task(requires=['version'])
+        def release(version):
+            return version
+
+        self.registry.execute('release', version='2.0.0')
+
+        self.assertEqual('2.0.0', self.registry.result('release'))
+        self.assertEqual('1.2.3', self.registry.result('version'))
+
+    def test_it_computes_results_once_for_several_tasks(self):
+        calls = []
+
+        @self.registry.add_task
+        def discover():
+            calls.append('discover')
+            return ['a', 'b']
+
+        @self.registry.add_task(requires=['discover'])
+        def lint(discover):
+            pass
+
+        @self.registry.add_task(requires=['discover'])
+        def test():
+            return self.registry.result('discover')
+
+        self.registry.execute('lint', 'test')
+
+        self.assertEqual(['discover'], calls)
+        self.assertEqual(['a', 'b'], self.registry.result('test'))
+
+    def test_it_raises_for_result_of_task_that_has_not_run(self):
+        @self.registry.add_task
+        def one():
+            pass
+
+        with self.assertRaisesRegexp(NoSuchResultException, r'has not run: one'):
+            self.registry.result('one')
+
+    def test_it_clears_results_between_executions(self):
+        @self.registry.add_task
+        def one():
+            return 1
+
+        @self.registry.add_task
+        def two():
+            return 2
+
+        self.registry.execute('one')
+        self.registry.execute('two')
+
+        with self.assertRaises(NoSuchResultException):
+            self.registry.result('one')
+
+    def test_it_does_not_list_parameters_that_receive_results(self):
+        @self.registry.add_task
+        def version():
+            pass
+
+        @self.registry.add_task(requires=['version'])
+        def release(version, channel, dry_run=False):
+            pass
+
+        task = self.registry._tasks['release']
+
+        self.assertEqual(['channel'], task.required_args())
+        self.assertEqual(['dry_run'], list(task.optional_args()))
+
     def test_it_resets_execution_context_between_executions(self):
 
         @self.registry.add_task()
@@ -284,6 +632,229 @@ class TaskRegistryTests(TestCase):
         except ValueError:
             self.assertEqual(['two'], list(self.registry.execution_context))
 
+    def test_it_executes_only_tasks_affected_by_changes(self):
+        calls = []
+
+        @self.registry.add_task
+        def lint():
+            calls.append('lint')
+
+        @self.registry.add_task
+        def compile():
+            calls.append('compile')
+            return 'app.o'
+
+        @self.registry.add_task(requires=['compile'])
+        def link(compile):
+            calls.append('link %s' % compile)
+
+        @self.registry.add_task(requires=['lint', 'link'])
+        def build():
+            calls.append('build')
+
+        self.registry.execute('build')
+        del calls[:]
+
+        self.registry.execute_affected(['build'], ['link'])
+
+        self.assertEqual(['link app.o', 'build'], calls)
+
+    def test_it_executes_tasks_that_failed_before_with_affected_tasks(self):
+        calls = []
+        broken = Flag()
+        broken.set()
+
+        @self.registry.add_task
+        def compile():
+            calls.append('compile')
+            if broken.value:
+                raise ValueError('compile')
+
+        @self.registry.add_task
+        def lint():
+            calls.append('lint')
+
+        @self.registry.add_task(requires=['compile', 'lint'])
+        def build():
+            calls.append('build')
+
+        with self.assertRaises(ValueError):
+            self.registry.execute('build')
+
+        broken.value = False
+        del calls[:]
+
+        self.registry.execute_affected(['build'], ['lint'])
+
+        self.assertEqual(['compile', 'lint', 'build'], calls)
+
+    def test_it_plans_tasks_without_executing_them(self):
+        calls = []
+
+        @self.registry.add_task
+        def compile():
+            calls.append('compile')
+
+        @self.registry.add_task(requires=['compile', 'README'])
+        def package():
+            calls.append('package')
+
+        @self.registry.add_task(requires=['compile', 'package'])
+        def release():
+            calls.append('release')
+
+        self.registry.default = 'release'
+
+        self.assertEqual(['compile', 'package', 'release'], self.registry.plan())
+        self.assertEqual([], calls)
+
+    def test_it_finds_input_files_of_tasks_and_their_dependencies(self):
+        directory = mkdtemp()
+        self.addCleanup(rmtree, directory)
+
+        source = path.join(directory, 'app.c')
+        header = path.join(directory, 'app.h')
+        target = path.join(directory, 'app')
+        open(source, 'w').close()
+        open(header, 'w').close()
+
+        @self.registry.add_task(inputs=[path.join(directory, '*.h')])
+        def headers():
+            pass
+
+        @self.registry.add_file_task(target, sources=[source], requires=['headers'])
+        def build():
+            pass
+
+        self.assertEqual({header: 'headers', source: source}, self.registry.input_files(target))
+
+    def test_it_forgets_tasks_when_cleared(self):
+
+        @self.registry.add_task
+        def build():
+            pass
+
+        self.registry.default = 'build'
+        self.registry.jobs = 2
+        self.registry.execute()
+
+        self.registry.clear()
+
+        self.assertEqual([], self.registry.tasks())
+        self.assertEqual(None, self.registry.default)
+        self.assertEqual(2, self.registry.jobs)
+        with self.assertRaises(NoSuchResultException):
+            self.registry.result('build')
+
+    def test_it_runs_file_task_only_when_target_is_out_of_date(self):
+        directory = mkdtemp()
+        self.addCleanup(rmtree, directory)
+
+        source = path.join(directory, 'source')
+        target = path.join(directory, 'target')
+        open(source, 'w').close()
+        calls = []
+
+        @self.registry.add_file_task(target, sources=[source])
+        def build():
+            calls.append('build')
+            open(target, 'w').close()
+
+        self.registry.execute(target)
+        self.registry.execute(target)
+
+        self.assertEqual(['build'], calls)
+
+    def test_it_builds_file_task_sources_that_are_file_tasks(self):
+        directory = mkdtemp()
+        self.addCleanup(rmtree, directory)
+
+        intermediate = path.join(directory, 'intermediate')
+        target = path.join(directory, 'target')
+        calls = []
+
+        @self.registry.add_file_task(intermediate)
+        def generate():
+            calls.append('generate')
+            open(intermediate, 'w').close()
+
+        @self.registry.add_file_task(target, sources=[intermediate])
+        def build():
+            calls.append('build')
+            open(target, 'w').close()
+
+        self.registry.execute(target)
+
+        self.assertEqual(['generate', 'build'], calls)
+
+    def test_it_raises_for_requested_label_that_is_only_an_existing_file(self):
+        directory = mkdtemp()
+        self.addCleanup(rmtree, directory)
+
+        @self.registry.add_task
+        def test():
+            raise AssertionError('Should not run')
+
+        with self.assertRaisesRegexp(NoSuchTaskException, directory):
+            self.registry.execute(directory)
+
+    def test_it_raises_for_missing_file_task_source(self):
+
+        @self.registry.add_file_task('/nonexistent/target', sources=['/nonexistent/source'])
+        def build():
+            pass
+
+        with self.assertRaisesRegexp(NoSuchTaskException, r'/nonexistent/source'):
+            self.registry.execute('/nonexistent/target')
+
+    def test_it_creates_file_tasks_from_rules_when_needed(self):
+        directory = mkdtemp()
+        self.addCleanup(rmtree, directory)
+
+        source = path.join(directory, 'app.c')
+        target = path.join(directory, 'app.o')
+        open(source, 'w').close()
+        calls = []
+
+        @self.registry.add_rule('%.o', sources=['%.c'])
+        def compile(target, source):
+            calls.append((target, source))
+            open(target, 'w').close()
+
+        self.registry.execute(target)
+        self.registry.execute(target)
+
+        self.assertEqual([(target, source)], calls)
+
+    def test_it_chains_rules_to_build_sources(self):
+        directory = mkdtemp()
+        self.addCleanup(rmtree, directory)
+
+        open(path.join(directory, 'app.c'), 'w').close()
+        calls = []
+
+        @self.registry.add_rule('%.o', sources=['%.c'])
+        def compile(target, source):
+            calls.append(target)
+            open(target, 'w').close()
+
+        @self.registry.add_rule('%.bin', sources=['%.o'])
+        def link(target, source):
+            calls.append(target)
+
+        self.registry.execute(path.join(directory, 'app.bin'))
+
+        self.assertEqual([path.join(directory, 'app.o'), path.join(directory, 'app.bin')], calls)
+
+    def test_it_does_not_use_rules_whose_sources_cannot_be_built(self):
+
+        @self.registry.add_rule('%.o', sources=['%.c'])
+        def compile(target, source):
+            pass
+
+        with self.assertRaisesRegexp(NoSuchTaskException, r'missing\.o'):
+            self.registry.execute('/nonexistent/missing.o')
+
     def test_it_renders_nothing_when_no_tasks(self):
         table = self.registry.view_all()
         self.assertEqual('', table)
@@ -336,6 +907,36 @@ class TaskRegistryTests(TestCase):
 
         self.assertEqual(expected, self.registry.view_all())
 
+    def test_it_renders_last_run_of_tasks_from_history(self):
+
+        @self.registry.add_task
+        def build():
+            """Builds"""
+
+        @self.registry.add_task
+        def deploy():
+            """Deploys"""
+
+        @self.registry.add_task
+        def test():
+            """Tests"""
+
+        started = mktime((2026, 10, 18, 14, 3, 0, 0, 0, -1))
+        runs = {
+            'build': TaskRun('build', started, 1.25, False, {}),
+            'test': TaskRun('test', started, 0.5, True, {}),
+        }
+        history = Mock()
+        history.last_run.side_effect = runs.get
+
+        expected = [
+            'snake build   # Builds (last run 2026-10-18 14:03, took 1.250s)',
+            'snake deploy  # Deploys',
+            'snake test    # Tests (last run 2026-10-18 14:03, failed after 0.500s)',
+        ]
+
+        self.assertEqual('\n'.join(expected), self.registry.view_all(history=history))
+
     def test_it_does_not_render_tasks_without_descriptions(self):
 
         @self.registry.add_task
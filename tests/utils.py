@@ -4,7 +4,7 @@ from os import path, getcwd, chdir, makedirs, remove, environ as env
 from re import search
 from shutil import rmtree
 from subprocess import Popen, PIPE
-from time import time
+from time import sleep, time
 
 
 class ProcessResult(object):
@@ -64,6 +64,7 @@ class IntegrationTest(TestCase, ProcessResultAssertions):
         cls._current_dir = getcwd()
 
         cls._update_pythonpath_to_prefer_dev_version()
+        cls._keep_caches_in_sandbox()
         cls._create_and_enter_sandbox()
 
     @classmethod
@@ -73,6 +74,7 @@ class IntegrationTest(TestCase, ProcessResultAssertions):
 
     def tearDown(self):
         self._remove_snakefile()
+        rmtree('.snake', ignore_errors=True)
         super(IntegrationTest, self).tearDown()
 
     def use_snakefile(self, contents):
@@ -85,6 +87,26 @@ class IntegrationTest(TestCase, ProcessResultAssertions):
 
         return ProcessResult(p.returncode, stdout, stderr)
 
+    def start(self, command, creates):
+        """Starts a command in the background that is stopped after the test,
+        and waits for it to create a file.
+        """
+        # The shell is replaced by the command so that it can be stopped
+        p = Popen('exec %s' % command, shell=True)
+        self.addCleanup(p.wait)
+        self.addCleanup(p.terminate)
+
+        self.wait_until(lambda: path.exists(creates), p, "%s did not create %s" % (command, creates))
+        return p
+
+    def wait_until(self, condition, process, message):
+        """Waits for a condition to hold while a background command runs"""
+        deadline = time() + 10
+        while not condition():
+            if process.poll() is not None or time() > deadline:
+                self.fail(message)
+            sleep(0.05)
+
     def _remove_indentation_padding(self, contents):
         contents = contents.lstrip('\n')
         padding = len(contents) - len(contents.lstrip(' '))
@@ -102,6 +124,11 @@ class IntegrationTest(TestCase, ProcessResultAssertions):
         env['PYTHONPATH'] = cls._current_dir + ':' + env.get('PYTHONPATH', '')
         env['PATH'] = path.join(cls._current_dir, 'bin') + ':' + env.get('PATH', '')
 
+    @classmethod
+    def _keep_caches_in_sandbox(cls):
+        env['XDG_CACHE_HOME'] = path.join(cls._sandbox_dir, '.cache')
+        env['XDG_RUNTIME_DIR'] = path.join(cls._sandbox_dir, '.run')
+
     @classmethod
     def _create_and_enter_sandbox(cls):
         makedirs(cls._sandbox_dir, mode=0o755)
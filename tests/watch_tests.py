@@ -0,0 +1,133 @@
+import sys
+from os import path, rename
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Timer
+
+from unittest2 import TestCase, skipUnless
+
+from mock import Mock
+
+from snake.watch import InotifyWatcher, PollingWatcher, watch, wait_for_changes
+
+
+def write(filename, contents):
+    with open(filename, 'w') as f:
+        f.write(contents)
+
+
+class WatcherTests(object):
+    """Tests shared by every kind of watcher"""
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.addCleanup(rmtree, self.directory)
+
+        self.source = path.join(self.directory, 'source')
+        self.other = path.join(self.directory, 'other')
+        write(self.source, 'a')
+        write(self.other, 'a')
+
+    def watch(self, paths):
+        watcher = self.create(paths)
+        self.addCleanup(watcher.close)
+        return watcher
+
+    def test_it_reports_nothing_when_nothing_changed(self):
+        watcher = self.watch([self.source])
+
+        self.assertEqual(set(), watcher.changes(0.1))
+
+    def test_it_reports_changed_files(self):
+        watcher = self.watch([self.source, self.other])
+
+        write(self.source, 'changed')
+
+        self.assertEqual(set([self.source]), watcher.changes(5))
+
+    def test_it_reports_files_that_are_replaced(self):
+        watcher = self.watch([self.source])
+
+        replacement = path.join(self.directory, 'replacement')
+        write(replacement, 'replaced')
+        rename(replacement, self.source)
+
+        self.assertEqual(set([self.source]), watcher.changes(5))
+
+    def test_it_reports_files_that_are_created(self):
+        missing = path.join(self.directory, 'missing')
+        watcher = self.watch([missing])
+
+        write(missing, 'created')
+
+        self.assertEqual(set([missing]), watcher.changes(5))
+
+    def test_it_ignores_files_that_are_not_watched(self):
+        watcher = self.watch([self.source])
+
+        write(self.other, 'changed')
+
+        self.assertEqual(set(), watcher.changes(0.1))
+
+
+class PollingWatcherTests(WatcherTests, TestCase):
+    def create(self, paths):
+        return PollingWatcher(paths, interval=0.01)
+
+
+@skipUnless(sys.platform.startswith('linux'), "inotify is only available on Linux")
+class InotifyWatcherTests(WatcherTests, TestCase):
+    def create(self, paths):
+        return InotifyWatcher(paths)
+
+    def test_it_is_preferred_on_linux(self):
+        watcher = watch([self.source])
+        self.addCleanup(watcher.close)
+
+        self.assertIsInstance(watcher, InotifyWatcher)
+
+
+class WaitForChangesTests(TestCase):
+    def test_it_collects_changes_until_they_stop(self):
+        watcher = Mock()
+        watcher.changes.side_effect = [set(['a']), set(['b']), set(['a', 'c']), set()]
+
+        self.assertEqual(set(['a', 'b', 'c']), wait_for_changes(watcher, debounce=0.1))
+        watcher.changes.assert_called_with(0.1)
+
+    def test_it_waits_for_changes_made_later(self):
+        directory = mkdtemp()
+        self.addCleanup(rmtree, directory)
+
+        source = path.join(directory, 'source')
+        write(source, 'a')
+
+        watcher = PollingWatcher([source], interval=0.01)
+        timer = Timer(0.1, write, (source, 'changed'))
+        timer.start()
+        self.addCleanup(timer.join)
+
+        self.assertEqual(set([source]), wait_for_changes(watcher, debounce=0.05))
+
+    def test_it_keeps_waiting_when_only_unwatched_files_change(self):
+        watcher = Mock()
+        watcher.changes.side_effect = [set(), set(), set(['a']), set()]
+
+        self.assertEqual(set(['a']), wait_for_changes(watcher, debounce=0.1))
+
+    @skipUnless(sys.platform.startswith('linux'), "inotify is only available on Linux")
+    def test_it_ignores_unwatched_files_next_to_watched_files(self):
+        directory = mkdtemp()
+        self.addCleanup(rmtree, directory)
+
+        source = path.join(directory, 'in.txt')
+        write(source, 'a')
+
+        watcher = InotifyWatcher([source])
+        self.addCleanup(watcher.close)
+        swap = Timer(0.05, write, (path.join(directory, 'other.swp'), 'swap'))
+        change = Timer(0.3, write, (source, 'changed'))
+        for timer in (swap, change):
+            timer.start()
+            self.addCleanup(timer.join)
+
+        self.assertEqual(set([source]), wait_for_changes(watcher, debounce=0.05))